@@ -0,0 +1,656 @@
+"""
+Servicio HTTP para generar documentos desde otros sistemas (por ejemplo el ERP)
+
+Endpoints:
+    POST /membrete     Aplica un membrete a un PDF. multipart/form-data con los campos
+                       'documento' (PDF) y 'membrete' (nombre del PNG, por ejemplo
+                       Intra.png), o el PDF como cuerpo application/pdf y
+                       ?membrete=Intra.png
+    POST /cotizacion   JSON con los datos de la cotización
+    POST /comprobante  JSON con los datos del comprobante, o multipart/form-data con
+                       'datos' (JSON) y archivos en 'imagenes' y 'anexos' (PDF)
+    GET  /salud        Estado del servicio
+    GET  /metrics      Métricas en formato Prometheus (tiempos por etapa, tamaños,
+                       aciertos de caché), sumadas de todos los procesos del pool
+
+Los datos JSON usan las mismas claves que la aplicación ('cliente', 'items',
+'descuento', 'conceptos', 'folio', 'fecha'); 'empresa' es el nombre o la serie de
+la división (por defecto la primera), 'membrete' el nombre de un PNG de membretes/
+y "archivar": false evita guardar el documento en el archivo local. Los datos con
+tipos incorrectos se rechazan con 400. Si no se envía folio se asigna el siguiente
+de la serie (va en la cabecera X-Folio); si la generación falla vuelve a la serie.
+
+Los documentos se generan en un pool de procesos que se inicia y precarga al
+arrancar. Con más de --max-concurrentes peticiones en curso las nuevas se
+rechazan con 503 y Retry-After. El PDF se escribe en la carpeta de artefactos y
+la respuesta se envía desde el archivo en bloques.
+
+Uso:
+    python api.py --puerto 8502 --procesos 2 --max-concurrentes 8
+"""
+import argparse
+import email.parser
+import email.policy
+import io
+import json
+import os
+import shutil
+import threading
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, quote
+
+from utils.artefacto_utils import guardar_artefacto, abrir_artefacto
+from utils.folio_utils import asignar_folio, devolver_folio, obtener_serie
+from utils.items_utils import COLUMNAS_COTIZACION, COLUMNAS_COMPROBANTE, VALORES_POR_OMISION
+from utils.metricas_utils import combinar_metricas, exportar_prometheus, tomar_metricas
+from utils.recursos_utils import obtener_configuracion, listar_membretes
+
+
+# Tamaño máximo del cuerpo de una petición
+MAX_BYTES_PETICION = 50 * 1024 * 1024
+
+# Segundos máximos que una petición espera su documento
+TIEMPO_MAXIMO = 120
+
+# Tamaño de los bloques con que se envía la respuesta
+TAMANO_BLOQUE = 64 * 1024
+
+PREFIJOS_ARCHIVO = {
+    'cotizacion': 'Cotizacion',
+    'comprobante': 'Comprobante'
+}
+
+CAMPOS_CLIENTE = ('nombre', 'empresa', 'direccion', 'telefono', 'email')
+
+TIPOS_DESCUENTO = ('Porcentaje', 'Monto')
+
+# Claves con rutas de archivos: en JSON se rechazan, los archivos solo llegan como multipart
+CLAVES_ARCHIVOS = ('comprobante_imagen', 'comprobante_imagenes', 'anexos_pdf')
+
+
+class ErrorPeticion(Exception):
+    """Error en los datos de la petición (se responde con 400)"""
+
+
+class ServicioDocumentos:
+    """Pool de procesos y límite de peticiones simultáneas del servicio"""
+
+    def __init__(self, procesos, max_concurrentes):
+        self.procesos = procesos
+        self.max_concurrentes = max_concurrentes
+        self.limite = threading.BoundedSemaphore(max_concurrentes)
+        self.en_curso = 0
+        self.atendidas = 0
+        self.rechazadas = 0
+        self._lock = threading.Lock()
+        self.pool = ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_proceso)
+
+    def precalentar(self):
+        """Arranca todos los procesos del pool y espera a que importen los generadores"""
+        futuros = [self.pool.submit(_calentar_proceso) for _ in range(self.procesos)]
+        return sorted({futuro.result() for futuro in futuros})
+
+    def entrar(self):
+        """Ocupa un lugar del límite; devuelve False si ya está lleno"""
+        if not self.limite.acquire(blocking=False):
+            with self._lock:
+                self.rechazadas += 1
+            return False
+        with self._lock:
+            self.en_curso += 1
+        return True
+
+    def salir(self):
+        """Libera el lugar ocupado con entrar"""
+        with self._lock:
+            self.en_curso -= 1
+            self.atendidas += 1
+        self.limite.release()
+
+    def generar(self, tipo, datos, archivar):
+        """
+        Genera un documento en el pool.
+
+        Si la cotización o el comprobante no trae folio, se asigna el siguiente de la
+        serie con los datos ya validados, justo antes de enviarlo al pool, y se
+        devuelve a la serie si la generación falla.
+
+        Si se agota TIEMPO_MAXIMO se lanza FuturesTimeoutError pero el documento se
+        sigue generando: el lugar ocupado con entrar se libera cuando termina, no
+        antes, así el límite de peticiones refleja el trabajo real del pool.
+
+        Returns:
+            tuple: (str: ID del artefacto con el PDF, int: tamaño en bytes)
+        """
+        folio_asignado = None
+        if tipo != 'membrete' and not datos.get('folio'):
+            datos['folio'] = folio_asignado = asignar_folio(datos['empresa'], tipo)
+
+        futuro = self.pool.submit(_generar_en_proceso, tipo, datos, archivar)
+        try:
+            artefacto_id, tamano, metricas = futuro.result(timeout=TIEMPO_MAXIMO)
+        except FuturesTimeoutError:
+            futuro.add_done_callback(
+                lambda terminado: self._terminar_tarde(terminado, tipo, datos, archivar, folio_asignado)
+            )
+            raise
+        except BaseException:
+            if folio_asignado:
+                devolver_folio(datos['empresa'], tipo, folio_asignado)
+            raise
+
+        combinar_metricas(metricas)
+        return artefacto_id, tamano
+
+    def _terminar_tarde(self, futuro, tipo, datos, archivar, folio_asignado):
+        """
+        Cierra una petición que ya respondió 504 cuando su documento termina.
+
+        El folio asignado vuelve a la serie si el documento falló o si no quedó en el
+        archivo, porque el cliente nunca lo recibió.
+        """
+        try:
+            if futuro.exception() is None:
+                combinar_metricas(futuro.result()[2])
+            if folio_asignado and (futuro.exception() is not None or not archivar):
+                devolver_folio(datos['empresa'], tipo, folio_asignado)
+        finally:
+            self.salir()
+
+    def estado(self):
+        """Resumen del estado para /salud"""
+        with self._lock:
+            return {
+                'estado': 'ok',
+                'procesos': self.procesos,
+                'max_concurrentes': self.max_concurrentes,
+                'en_curso': self.en_curso,
+                'atendidas': self.atendidas,
+                'rechazadas': self.rechazadas
+            }
+
+    def cerrar(self):
+        """Termina los procesos del pool"""
+        self.pool.shutdown(wait=True, cancel_futures=True)
+
+
+class ManejadorAPI(BaseHTTPRequestHandler):
+    """Atiende las peticiones HTTP del servicio"""
+
+    server_version = "DocumentadorAPI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        ruta = urlsplit(self.path).path
+        if ruta == '/salud':
+            self._responder_json(HTTPStatus.OK, self.server.servicio.estado())
+        elif ruta in ('/metrics', '/metricas'):
+            self._responder_texto(exportar_prometheus(), 'text/plain; version=0.0.4; charset=utf-8')
+        else:
+            self._responder_json(HTTPStatus.NOT_FOUND, {'error': 'Ruta no encontrada'})
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        rutas = {
+            '/membrete': self._membrete,
+            '/cotizacion': self._cotizacion,
+            '/comprobante': self._comprobante
+        }
+        if url.path not in rutas:
+            self._descartar_cuerpo()
+            self._responder_json(HTTPStatus.NOT_FOUND, {'error': 'Ruta no encontrada'})
+            return
+
+        servicio = self.server.servicio
+        if not servicio.entrar():
+            self._descartar_cuerpo()
+            self._responder_json(
+                HTTPStatus.SERVICE_UNAVAILABLE,
+                {'error': f"Límite de {servicio.max_concurrentes} peticiones simultáneas alcanzado, intenta de nuevo"},
+                {'Retry-After': '1'}
+            )
+            return
+
+        # Con un 504 el documento se sigue generando y generar libera el lugar al terminar
+        en_generacion = False
+        self._pdf_iniciado = False
+        try:
+            consulta = {clave: valores[-1] for clave, valores in parse_qs(url.query).items()}
+            tipo, datos, archivar, nombre = rutas[url.path](self._leer_cuerpo(), consulta)
+            artefacto_id, tamano = servicio.generar(tipo, datos, archivar)
+            self._enviar_pdf(artefacto_id, tamano, nombre or _nombre_documento(tipo, datos), datos.get('folio'))
+        except ErrorPeticion as e:
+            self._responder_json(HTTPStatus.BAD_REQUEST, {'error': str(e)})
+        except FuturesTimeoutError:
+            en_generacion = True
+            self._responder_json(HTTPStatus.GATEWAY_TIMEOUT, {'error': "El documento tardó demasiado en generarse"})
+        except Exception as e:
+            if self._pdf_iniciado:
+                # La respuesta 200 ya empezó: no se puede enviar otra en la misma conexión
+                self.close_connection = True
+                print(f"Error al enviar el PDF: {e}")
+            else:
+                self._responder_json(HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)})
+        finally:
+            if not en_generacion:
+                servicio.salir()
+
+    def _membrete(self, cuerpo, consulta):
+        """Datos para aplicar un membrete a un PDF"""
+        campos, archivos = _leer_formulario(self.headers, cuerpo)
+        if archivos.get('documento'):
+            documento = archivos['documento'][0][1]
+            nombre = archivos['documento'][0][0] or 'documento.pdf'
+        elif self.headers.get_content_type() == 'application/pdf':
+            documento, nombre = cuerpo, consulta.get('nombre', 'documento.pdf')
+        else:
+            raise ErrorPeticion("Envía el PDF en el campo 'documento' o como cuerpo application/pdf")
+
+        datos = {
+            'documento': documento,
+            'membrete': _buscar_membrete(campos.get('membrete') or consulta.get('membrete'))
+        }
+        if not datos['membrete']:
+            raise ErrorPeticion("Indica el membrete a aplicar")
+        nombre_base = os.path.splitext(os.path.basename(nombre))[0]
+        return 'membrete', datos, False, f"{nombre_base}_con_membrete.pdf"
+
+    def _cotizacion(self, cuerpo, consulta):
+        """Datos de una cotización"""
+        datos = _leer_json(self.headers, cuerpo)
+        if not datos.get('items'):
+            raise ErrorPeticion("Agrega al menos un item a la cotización")
+        datos['items'] = _validar_filas(datos['items'], COLUMNAS_COTIZACION, 'items')
+        datos['descuento'] = _validar_descuento(datos.get('descuento'))
+        return self._preparar_documento('cotizacion', datos, consulta)
+
+    def _comprobante(self, cuerpo, consulta):
+        """Datos de un comprobante de pago (con imágenes y anexos opcionales)"""
+        if self.headers.get_content_type() == 'multipart/form-data':
+            campos, archivos = _leer_formulario(self.headers, cuerpo)
+            datos = _interpretar_json(campos.get('datos', ''))
+            _rechazar_rutas(datos)
+            imagenes = [contenido for _, contenido in archivos.get('imagenes', [])]
+            anexos = [contenido for _, contenido in archivos.get('anexos', [])]
+            if imagenes:
+                datos['comprobante_imagenes'] = imagenes
+            if anexos:
+                datos['anexos_pdf'] = anexos
+        else:
+            datos = _leer_json(self.headers, cuerpo)
+            _rechazar_rutas(datos)
+
+        if not datos.get('conceptos'):
+            raise ErrorPeticion("Agrega al menos un concepto al comprobante")
+        datos['conceptos'] = _validar_filas(datos['conceptos'], COLUMNAS_COMPROBANTE, 'conceptos')
+        return self._preparar_documento('comprobante', datos, consulta)
+
+    def _preparar_documento(self, tipo, datos, consulta):
+        """
+        Valida el cliente y completa empresa, fecha y membrete de una cotización o comprobante.
+
+        El folio no se asigna aquí sino en ServicioDocumentos.generar, así las
+        peticiones con datos no válidos no consumen números de la serie.
+        """
+        config = obtener_configuracion()
+        if config is None:
+            raise Exception("No se pudo cargar la configuración (data/config.json)")
+
+        datos['cliente'] = _validar_cliente(datos.get('cliente'))
+        if datos.get('folio') is not None:
+            datos['folio'] = _validar_texto(datos['folio'], 'folio')
+            # El folio va en las cabeceras de la respuesta (X-Folio, nombre del archivo)
+            if not datos['folio'].isprintable():
+                raise ErrorPeticion("'folio' no puede tener saltos de línea ni caracteres de control")
+
+        datos['empresa'] = _buscar_empresa(config, datos.get('empresa'))
+        if not datos.get('fecha'):
+            datos['fecha'] = datetime.now().replace(microsecond=0)
+        else:
+            try:
+                datos['fecha'] = datetime.fromisoformat(str(datos['fecha']))
+            except ValueError:
+                raise ErrorPeticion("'fecha' debe tener formato ISO (AAAA-MM-DD o AAAA-MM-DDTHH:MM:SS)")
+        if datos.get('membrete'):
+            datos['membrete'] = _buscar_membrete(_validar_texto(datos['membrete'], 'membrete'))
+        else:
+            datos.pop('membrete', None)
+
+        archivar = datos.pop('archivar', consulta.get('archivar', '1') != '0')
+        return tipo, datos, bool(archivar), None
+
+    def _leer_cuerpo(self):
+        """Cuerpo de la petición (requiere Content-Length)"""
+        try:
+            longitud = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            raise ErrorPeticion("Content-Length no válido")
+        if longitud > MAX_BYTES_PETICION:
+            self.close_connection = True
+            raise ErrorPeticion(f"La petición pasa de {MAX_BYTES_PETICION // (1024 * 1024)} MB")
+        return self.rfile.read(longitud)
+
+    def _descartar_cuerpo(self):
+        """Lee el cuerpo no usado para poder responder en la misma conexión"""
+        try:
+            longitud = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            longitud = 0
+        if 0 < longitud <= MAX_BYTES_PETICION:
+            self.rfile.read(longitud)
+        elif longitud:
+            self.close_connection = True
+
+    def _enviar_pdf(self, artefacto_id, tamano, nombre, folio):
+        """
+        Envía el PDF desde la carpeta de artefactos en bloques.
+
+        Las cabeceras se arman antes de send_response: si algo falla todavía se
+        puede responder con un error en lugar de cortar una respuesta 200.
+        """
+        cabeceras = {
+            'Content-Type': 'application/pdf',
+            'Content-Length': str(tamano),
+            'Content-Disposition': _cabecera_adjunto(nombre)
+        }
+        if folio:
+            cabeceras['X-Folio'] = _valor_cabecera(folio)
+
+        with abrir_artefacto(artefacto_id) as archivo:
+            self._pdf_iniciado = True
+            self.send_response(HTTPStatus.OK)
+            for clave, valor in cabeceras.items():
+                self.send_header(clave, valor)
+            self.end_headers()
+            shutil.copyfileobj(archivo, self.wfile, TAMANO_BLOQUE)
+
+    def _responder_json(self, estado, contenido, cabeceras=None):
+        """Respuesta JSON (errores y /salud)"""
+        cuerpo = json.dumps(contenido, ensure_ascii=False).encode('utf-8')
+        self.send_response(estado)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        for nombre, valor in (cabeceras or {}).items():
+            self.send_header(nombre, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _responder_texto(self, texto, tipo):
+        """Respuesta de texto (/metrics)"""
+        cuerpo = texto.encode('utf-8')
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        print(f"{self.address_string()} - {formato % args}")
+
+
+class ServidorAPI(ThreadingHTTPServer):
+    """Servidor HTTP con un hilo por conexión y el servicio de documentos compartido"""
+
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, direccion, servicio):
+        super().__init__(direccion, ManejadorAPI)
+        self.servicio = servicio
+
+
+def _leer_json(cabeceras, cuerpo):
+    """Datos JSON del cuerpo de la petición"""
+    if cabeceras.get_content_type() != 'application/json':
+        raise ErrorPeticion("Envía los datos como application/json")
+    return _interpretar_json(cuerpo)
+
+
+def _interpretar_json(texto):
+    """Interpreta un objeto JSON; los errores se responden con 400"""
+    try:
+        datos = json.loads(texto or b'{}')
+    except ValueError as e:
+        raise ErrorPeticion(f"JSON no válido: {e}")
+    if not isinstance(datos, dict):
+        raise ErrorPeticion("Los datos deben ser un objeto JSON")
+    return datos
+
+
+def _leer_formulario(cabeceras, cuerpo):
+    """
+    Campos y archivos de un cuerpo multipart/form-data.
+
+    Returns:
+        tuple: ({nombre: texto}, {nombre: [(nombre de archivo, bytes)]})
+    """
+    if cabeceras.get_content_type() != 'multipart/form-data':
+        return {}, {}
+
+    mensaje = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {cabeceras['Content-Type']}\r\n\r\n".encode('latin-1') + cuerpo
+    )
+    if not mensaje.is_multipart():
+        raise ErrorPeticion("Cuerpo multipart/form-data no válido")
+
+    campos, archivos = {}, {}
+    for parte in mensaje.iter_parts():
+        nombre = parte.get_param('name', header='content-disposition')
+        if not nombre:
+            continue
+        contenido = parte.get_payload(decode=True) or b''
+        if parte.get_filename() is not None:
+            archivos.setdefault(nombre, []).append((parte.get_filename(), contenido))
+        else:
+            campos[nombre] = contenido.decode(parte.get_content_charset() or 'utf-8')
+    return campos, archivos
+
+
+def _nombre_documento(tipo, datos):
+    """Nombre del PDF de una cotización o comprobante, con el folio ya asignado"""
+    return f"{PREFIJOS_ARCHIVO[tipo]}_{datos['folio']}_{datos['fecha'].strftime('%Y%m%d')}.pdf"
+
+
+def _valor_cabecera(texto):
+    """Texto para una cabecera HTTP: sin caracteres de control y en ASCII (lo demás con %XX)"""
+    texto = ''.join(caracter for caracter in texto if caracter.isprintable())
+    return texto if texto.isascii() else quote(texto, safe=" !#$&'()*+,-./:;=?@[]^_`{|}~")
+
+
+def _cabecera_adjunto(nombre):
+    """
+    Content-Disposition de un archivo con cualquier nombre (RFC 6266): filename con
+    una versión ASCII para clientes antiguos y filename* con el nombre en UTF-8.
+    """
+    nombre = ''.join(caracter for caracter in nombre if caracter.isprintable())
+    respaldo = unicodedata.normalize('NFKD', nombre).encode('ascii', 'ignore').decode('ascii')
+    respaldo = respaldo.replace('"', '').replace('\\', '').strip() or 'documento.pdf'
+    if respaldo == nombre:
+        return f'attachment; filename="{respaldo}"'
+    return f"attachment; filename=\"{respaldo}\"; filename*=UTF-8''{quote(nombre, safe='')}"
+
+
+def _validar_texto(valor, campo):
+    """Texto de un campo; acepta números (teléfonos, referencias) y None como texto vacío"""
+    if valor is None:
+        return ''
+    if isinstance(valor, bool) or not isinstance(valor, (str, int, float)):
+        raise ErrorPeticion(f"'{campo}' debe ser texto")
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _validar_numero(valor, campo):
+    """Número de un campo; acepta texto con formato de moneda ("$1,234.50")"""
+    if isinstance(valor, str):
+        texto = valor.strip().replace('$', '').replace(',', '').replace(' ', '')
+        try:
+            valor = float(texto)
+        except ValueError:
+            raise ErrorPeticion(f"'{campo}' debe ser un número")
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)) or valor != valor:
+        raise ErrorPeticion(f"'{campo}' debe ser un número")
+    return valor
+
+
+def _validar_cliente(cliente):
+    """Datos del cliente con todos los campos como texto; el nombre es obligatorio"""
+    if not isinstance(cliente, dict):
+        raise ErrorPeticion("Ingresa el nombre del cliente ('cliente': {'nombre': ...})")
+    validado = dict(cliente)
+    for campo in CAMPOS_CLIENTE:
+        validado[campo] = _validar_texto(cliente.get(campo), f"cliente.{campo}")
+    if not validado['nombre']:
+        raise ErrorPeticion("Ingresa el nombre del cliente ('cliente': {'nombre': ...})")
+    return validado
+
+
+def _validar_filas(filas, columnas, campo):
+    """
+    Items o conceptos con cada columna convertida a su tipo (COLUMNAS_COTIZACION,
+    COLUMNAS_COMPROBANTE). La descripción y las columnas numéricas sin valor en
+    VALORES_POR_OMISION son obligatorias.
+    """
+    if not isinstance(filas, list):
+        raise ErrorPeticion(f"'{campo}' debe ser una lista")
+
+    validadas = []
+    for numero, fila in enumerate(filas, start=1):
+        if not isinstance(fila, dict):
+            raise ErrorPeticion(f"'{campo}[{numero}]' debe ser un objeto")
+        validada = dict(fila)
+        for nombre, tipo in columnas.items():
+            nombre_campo = f"{campo}[{numero}].{nombre}"
+            valor = fila.get(nombre)
+            if tipo is str:
+                validada[nombre] = _validar_texto(valor, nombre_campo)
+            elif valor is None or valor == '':
+                if nombre not in VALORES_POR_OMISION:
+                    raise ErrorPeticion(f"Falta '{nombre_campo}'")
+                validada[nombre] = VALORES_POR_OMISION[nombre]
+            else:
+                valor = _validar_numero(valor, nombre_campo)
+                validada[nombre] = tipo(round(valor)) if tipo is int else tipo(valor)
+        if not validada.get('descripcion'):
+            raise ErrorPeticion(f"Falta '{campo}[{numero}].descripcion'")
+        validadas.append(validada)
+    return validadas
+
+
+def _validar_descuento(descuento):
+    """Descuento de una cotización; sin descuento si no se envía"""
+    if descuento is None:
+        return {'aplicar': False, 'tipo': 'Porcentaje', 'valor': 0}
+    if not isinstance(descuento, dict):
+        raise ErrorPeticion("'descuento' debe ser un objeto {'aplicar', 'tipo', 'valor'}")
+
+    tipo = descuento.get('tipo') or 'Porcentaje'
+    if tipo not in TIPOS_DESCUENTO:
+        raise ErrorPeticion(f"'descuento.tipo' debe ser uno de: {', '.join(TIPOS_DESCUENTO)}")
+    valor = _validar_numero(descuento.get('valor', 0), 'descuento.valor')
+    if valor < 0:
+        raise ErrorPeticion("'descuento.valor' no puede ser negativo")
+    return {'aplicar': bool(descuento.get('aplicar', valor > 0)), 'tipo': tipo, 'valor': valor}
+
+
+def _rechazar_rutas(datos):
+    """Los archivos solo se aceptan subidos: una ruta en el JSON leería archivos del servidor"""
+    for clave in CLAVES_ARCHIVOS:
+        if datos.get(clave):
+            raise ErrorPeticion(f"Envía '{clave}' como archivos multipart/form-data, no en el JSON")
+
+
+def _buscar_empresa(config, buscada):
+    """Empresa por nombre o serie (sin distinguir mayúsculas); por defecto la primera"""
+    if not buscada:
+        return config['empresas'][0]
+    buscada = str(buscada).lower()
+    for empresa in config['empresas']:
+        if buscada in (empresa['nombre'].lower(), obtener_serie(empresa).lower()):
+            return empresa
+    raise ErrorPeticion(f"No existe la empresa {buscada}")
+
+
+def _buscar_membrete(nombre):
+    """Ruta de un membrete de la carpeta por su nombre de archivo (sin rutas arbitrarias)"""
+    if not nombre:
+        return None
+    for ruta in listar_membretes():
+        if os.path.basename(ruta).lower() in (nombre.lower(), f"{nombre.lower()}.png"):
+            return ruta
+    raise ErrorPeticion(f"No existe el membrete {nombre}")
+
+
+def _inicializar_proceso():
+    """Importa los generadores en cada proceso del pool"""
+    import utils.comprobante_utils  # noqa: F401
+    import utils.cotizacion_utils  # noqa: F401
+    import utils.pdf_utils  # noqa: F401
+
+
+def _calentar_proceso():
+    """Trabajo vacío para arrancar un proceso del pool; devuelve su PID"""
+    time.sleep(0.1)
+    return os.getpid()
+
+
+def _generar_en_proceso(tipo, datos, archivar):
+    """
+    Genera un documento dentro de un proceso del pool y lo guarda como artefacto.
+
+    Returns:
+        tuple: (ID del artefacto, tamaño en bytes, métricas del proceso para combinar_metricas)
+    """
+    from utils.archivo_utils import archivar_documento
+    from utils.comprobante_utils import generar_comprobante_pdf
+    from utils.cotizacion_utils import generar_cotizacion_pdf
+    from utils.pdf_utils import aplicar_membrete_pdf
+
+    try:
+        config = obtener_configuracion()
+        if tipo == 'membrete':
+            pdf_bytes = aplicar_membrete_pdf(io.BytesIO(datos['documento']), datos['membrete'])
+        elif tipo == 'cotizacion':
+            pdf_bytes = generar_cotizacion_pdf(datos, config)
+        else:
+            pdf_bytes = generar_comprobante_pdf(datos, config)
+
+        if archivar:
+            archivar_documento(tipo, datos, pdf_bytes, config)
+        return guardar_artefacto(pdf_bytes, f"{tipo}.pdf"), len(pdf_bytes), tomar_metricas()
+    except Exception as e:
+        # Se relanza como Exception simple para que siempre se pueda enviar al proceso principal
+        raise Exception(f"{type(e).__name__}: {e}") from None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio HTTP de membretes, cotizaciones y comprobantes")
+    parser.add_argument("--host", default="127.0.0.1", help="Dirección donde escuchar")
+    parser.add_argument("--puerto", type=int, default=8502, help="Puerto")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count() or 1, help="Procesos que generan documentos")
+    parser.add_argument("--max-concurrentes", type=int, help="Peticiones simultáneas antes de responder 503 "
+                                                             "(por defecto, 4 por proceso)")
+    argumentos = parser.parse_args()
+
+    # El pool de procesos necesita las funciones del módulo importado, no de __main__
+    from api import ServicioDocumentos, ServidorAPI
+
+    servicio_api = ServicioDocumentos(argumentos.procesos, argumentos.max_concurrentes or argumentos.procesos * 4)
+    print(f"Iniciando {argumentos.procesos} procesos...")
+    print(f"Procesos listos: {servicio_api.precalentar()}")
+
+    servidor = ServidorAPI((argumentos.host, argumentos.puerto), servicio_api)
+    print(f"Escuchando en http://{argumentos.host}:{argumentos.puerto}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servicio_api.cerrar()
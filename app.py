@@ -4,11 +4,22 @@ Aplicación Streamlit - Sistema de Membretes, Cotizaciones y Comprobantes de Pag
 import streamlit as st
 import os
 import io
-import json
+import tempfile
+import threading
+import importlib
+import time
 from datetime import datetime
-from utils.pdf_utils import aplicar_membrete_pdf, validar_documento, convertir_word_a_pdf
-from utils.cotizacion_utils import generar_cotizacion_pdf
-from utils.comprobante_utils import generar_comprobante_pdf
+from utils.archivo_utils import archivar_documento, buscar_documentos, leer_pdf_archivado
+from utils.artefacto_utils import guardar_artefacto, guardar_artefacto_desde_archivo, leer_artefacto
+from utils.exportacion_utils import contar_paginas
+from utils.folio_utils import asignar_folio, consultar_siguiente_folio
+from utils.recursos_utils import (obtener_configuracion, obtener_errores_configuracion,
+                                  listar_membretes, obtener_catalogo)
+from utils.metricas_utils import iniciar_servidor_metricas, obtener_resumen, reiniciar_metricas
+from utils.perfil_utils import activar_perfil, obtener_ultimo_reporte
+from utils.lote_utils import leer_pagos, agrupar_pagos, indexar_adjuntos, generar_lote_comprobantes
+from utils.items_utils import (COLUMNAS_COTIZACION, COLUMNAS_COMPROBANTE, items_a_columnas,
+                               columnas_a_items, parsear_tabla_pegada)
 
 
 # Configuración de la página
@@ -31,28 +42,354 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
+# Segundos sin cambios en los datos antes de actualizar la vista previa en vivo
+ESPERA_VISTA_PREVIA = 0.4
+
+# Módulos pesados (ReportLab, PyPDF2, PIL, pandas) que cada sección importa al
+# usarlos por primera vez; precargar_modulos los carga en segundo plano después del
+# primer render
+MODULOS_PRECARGA = (
+    "pandas",
+    "utils.pdf_utils",
+    "utils.imagen_utils",
+    "utils.plantilla_utils",
+    "utils.cotizacion_utils",
+    "utils.comprobante_utils"
+)
+
+
+@st.cache_resource(show_spinner=False)
+def precargar_modulos():
+    """
+    Importa en segundo plano los módulos pesados, una sola vez por proceso.
+    
+    Se llama al final del primer render para que la barra lateral y el módulo
+    abierto aparezcan sin esperar a ReportLab y PyPDF2, y que el primer PDF no
+    pague el costo de importarlos. Con DOCUMENTADOR_PRECARGA=0 no se precarga.
+    """
+    if os.environ.get("DOCUMENTADOR_PRECARGA", "1") == "0":
+        return None
+    
+    def importar():
+        for nombre in MODULOS_PRECARGA:
+            try:
+                importlib.import_module(nombre)
+            except Exception as e:
+                print(f"Error al precargar {nombre}: {e}")
+    
+    hilo = threading.Thread(target=importar, name="precarga-modulos", daemon=True)
+    hilo.start()
+    return hilo
+
+
+@st.cache_resource(show_spinner=False)
+def iniciar_metricas():
+    """
+    Sirve las métricas en formato Prometheus, una sola vez por proceso.
+    
+    Solo si se definió DOCUMENTADOR_METRICAS_PUERTO (por ejemplo 9464); el
+    endpoint queda en http://127.0.0.1:<puerto>/metrics.
+    """
+    puerto = os.environ.get("DOCUMENTADOR_METRICAS_PUERTO")
+    if not puerto:
+        return None
+    try:
+        return iniciar_servidor_metricas(int(puerto))
+    except (OSError, ValueError) as e:
+        print(f"Error al iniciar el servidor de métricas: {e}")
+        return None
+
+
+def modo_administrador():
+    """Indica si se muestran las herramientas de administración (DOCUMENTADOR_ADMIN=1)"""
+    return os.environ.get("DOCUMENTADOR_ADMIN", "0") == "1"
+
+
+def panel_metricas():
+    """Panel de la barra lateral con los tiempos, tamaños y cachés de este proceso"""
+    with st.sidebar.expander("📊 Métricas"):
+        resumen = obtener_resumen()
+        if not resumen['etapas'] and not resumen['caches']:
+            st.caption("Sin datos todavía")
+            return
+        
+        st.markdown("**Etapas**")
+        st.dataframe(
+            [{
+                'Etapa': e['etapa'],
+                'Veces': e['cantidad'],
+                'Promedio (ms)': round(e['promedio'] * 1000, 1),
+                'p95 (ms)': round(e['p95'] * 1000, 1)
+            } for e in resumen['etapas']],
+            hide_index=True
+        )
+        
+        st.markdown("**Tamaños**")
+        st.dataframe(
+            [{
+                'Operación': t['operacion'],
+                'Sentido': t['sentido'],
+                'Veces': t['cantidad'],
+                'Promedio (KB)': round(t['promedio'] / 1024, 1)
+            } for t in resumen['tamanos']],
+            hide_index=True
+        )
+        
+        st.markdown("**Cachés**")
+        st.dataframe(
+            [{
+                'Caché': c['cache'],
+                'Aciertos': c['aciertos'],
+                'Fallos': c['fallos'],
+                'Tasa': f"{c['tasa']:.0%}"
+            } for c in resumen['caches']],
+            hide_index=True
+        )
+        
+        if st.button("Reiniciar métricas", key="reiniciar_metricas"):
+            reiniciar_metricas()
+            st.rerun()
+
 
 def cargar_configuracion():
-    """Carga la configuración desde el archivo JSON"""
-    config_path = "data/config.json"
-    if os.path.exists(config_path):
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return None
+    """
+    Obtiene la configuración del registro de recursos.
+    
+    El archivo se lee una sola vez por cambio; si tiene errores de estructura se
+    avisan en pantalla y se sigue usando la última configuración válida.
+    """
+    config = obtener_configuracion()
+    for error in obtener_errores_configuracion():
+        st.warning(f"⚠️ data/config.json: {error}")
+    return config
 
 
 def obtener_membretes_disponibles():
     """Obtiene la lista de membretes disponibles en la carpeta"""
-    membretes_dir = "membretes"
-    if not os.path.exists(membretes_dir):
-        return []
+    return listar_membretes()
+
+
+def selector_membrete(clave):
+    """Selector opcional de membrete para dibujarlo como fondo del documento generado"""
+    membretes = obtener_membretes_disponibles()
+    opciones = [None] + membretes
+    return st.selectbox(
+        "Membrete (opcional):",
+        opciones,
+        format_func=lambda m: "Sin membrete" if m is None else os.path.basename(m),
+        key=clave,
+        help="El documento se genera directamente sobre el membrete, sin pasarlo después por el módulo de membretes"
+    )
+
+
+def boton_descarga(label, contenido, file_name, mime="application/pdf", **opciones):
+    """
+    Botón de descarga servido desde la carpeta de artefactos.
+    
+    El archivo se escribe a disco y se lee solo cuando el usuario lo descarga, así
+    los bytes no quedan en la memoria de la sesión entre reruns. Devuelve el ID del
+    artefacto para que otros botones (botones_imagen) usen el mismo archivo.
+    """
+    artefacto_id = guardar_artefacto(contenido, file_name)
+    st.download_button(
+        label=label,
+        data=lambda: leer_artefacto(artefacto_id),
+        file_name=file_name,
+        mime=mime,
+        **opciones
+    )
+    return artefacto_id
+
+
+def botones_imagen(artefacto_id, nombre_base, paginas):
+    """
+    Botones para descargar el documento como imagen (para WhatsApp y otras apps de mensajería).
+    
+    La imagen se genera solo si el usuario la descarga, a partir del PDF que
+    boton_descarga ya guardó como artefacto; con varias páginas se ofrece un ZIP
+    con una imagen por página o una sola imagen larga. El formato y la resolución
+    salen de configuracion.formato_exportacion y configuracion.dpi_exportacion.
+    Sin pypdfium2 no se muestra nada.
+    """
+    from utils.exportacion_utils import DPI_EXPORTACION, PYPDFIUM2_DISPONIBLE, FORMATOS, exportar_imagenes
+    
+    if not PYPDFIUM2_DISPONIBLE:
+        return
+    
+    opciones = obtener_configuracion().get('configuracion', {})
+    formato = opciones.get('formato_exportacion', 'JPEG').upper()
+    dpi = opciones.get('dpi_exportacion', DPI_EXPORTACION)
+    extension, mime, _ = FORMATOS[formato]
     
-    membretes = []
-    for archivo in os.listdir(membretes_dir):
-        if archivo.lower().endswith('.png'):
-            membretes.append(os.path.join(membretes_dir, archivo))
+    def exportar(modo):
+        return lambda: exportar_imagenes(leer_artefacto(artefacto_id), formato, dpi, modo)[0]
     
-    return sorted(membretes)
+    if paginas == 1:
+        st.download_button(
+            label=f"📱 Descargar como imagen ({formato})",
+            data=exportar('zip'),
+            file_name=f"{nombre_base}.{extension}",
+            mime=mime,
+            on_click="ignore",
+            use_container_width=True
+        )
+        return
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            label=f"🗜️ {paginas} imágenes en ZIP",
+            data=exportar('zip'),
+            file_name=f"{nombre_base}.zip",
+            mime="application/zip",
+            on_click="ignore",
+            use_container_width=True
+        )
+    with col2:
+        st.download_button(
+            label="📜 Una imagen larga",
+            data=exportar('larga'),
+            file_name=f"{nombre_base}.{extension}",
+            mime=mime,
+            on_click="ignore",
+            use_container_width=True
+        )
+
+
+def mostrar_vista_previa(pdf, titulo="Vista previa (página 1)", sha256=None):
+    """
+    Muestra la primera página de un PDF en baja resolución.
+    
+    Las imágenes se guardan en caché por contenido; sin pypdfium2 no se muestra nada.
+    Con sha256, pdf puede ser una función que lo lee y solo se llama si la imagen
+    no está en caché.
+    """
+    from utils.miniatura_utils import obtener_vista_previa_pdf
+    
+    imagen = obtener_vista_previa_pdf(pdf, sha256=sha256)
+    if imagen:
+        st.image(imagen, caption=titulo, width=250)
+
+
+def vista_previa_en_vivo(tipo, datos, config):
+    """
+    Primera página del documento en la barra lateral, actualizada mientras se captura.
+    
+    Después de un cambio espera ESPERA_VISTA_PREVIA segundos antes de generarla: si
+    en ese tiempo llega otro cambio, Streamlit interrumpe esta ejecución en la
+    siguiente llamada a st y solo se genera la vista del último estado. Sin
+    pypdfium2 no se muestra nada.
+    """
+    from utils.miniatura_utils import PYPDFIUM2_DISPONIBLE
+    from utils.vista_previa_utils import calcular_clave_vista_previa, generar_vista_previa
+    
+    if not PYPDFIUM2_DISPONIBLE:
+        return
+    
+    if not st.sidebar.toggle("👁️ Vista previa en vivo", value=True, key=f"vista_previa_{tipo}",
+                             help="Muestra la primera página del documento mientras lo capturas"):
+        return
+    
+    clave = calcular_clave_vista_previa(tipo, datos, config)
+    clave_sesion = f"clave_vista_previa_{tipo}"
+    if st.session_state.get(clave_sesion) != clave:
+        # Mientras tanto se sigue viendo la vista anterior
+        time.sleep(ESPERA_VISTA_PREVIA)
+    
+    espacio = st.sidebar.empty()
+    imagen = generar_vista_previa(tipo, datos, config)
+    if imagen:
+        st.session_state[clave_sesion] = clave
+        espacio.image(imagen, caption="Vista previa (página 1)", width="stretch")
+
+
+def obtener_fecha_folio(folio):
+    """
+    Fecha fija para un folio durante la sesión.
+    
+    Con una fecha estable el render es determinista, así que regenerar o volver a
+    descargar un documento sin cambios se sirve desde la caché de PDFs.
+    """
+    fechas = st.session_state.setdefault('fechas_folio', {})
+    return fechas.setdefault(folio, datetime.now().replace(microsecond=0))
+
+
+def obtener_folio_asignado(tipo, datos, config):
+    """
+    Asigna el siguiente folio de la serie, uno por contenido del documento durante la sesión.
+    
+    Volver a generar el mismo documento sin cambios reutiliza su folio en lugar de
+    consumir otro número de la serie; cualquier cambio en los datos (cliente, items,
+    conceptos, imágenes, membrete) es un documento nuevo y recibe un folio nuevo.
+    """
+    from utils.cache_utils import calcular_clave_cache
+    
+    asignados = st.session_state.setdefault('folios_asignados', {})
+    contenido = {clave: valor for clave, valor in datos.items() if clave not in ('folio', 'fecha')}
+    clave = calcular_clave_cache(tipo, contenido, config)
+    if clave not in asignados:
+        asignados[clave] = asignar_folio(datos['empresa'], tipo)
+    return asignados[clave]
+
+
+def archivar_generado(tipo, datos, pdf_bytes, config):
+    """Guarda el documento generado en el archivo local sin interrumpir la descarga si falla"""
+    try:
+        archivar_documento(tipo, datos, pdf_bytes, config)
+    except Exception as e:
+        st.warning(f"⚠️ El documento no se pudo guardar en el archivo: {str(e)}")
+
+
+def editor_tabla_items(clave, columnas, column_config):
+    """
+    Editor en modo tabla para la lista de items guardada en st.session_state[clave].
+    
+    Usa un solo st.data_editor respaldado por un almacén columnar, así el tiempo de
+    cada rerun no crece con el número de items. Permite pegar filas desde Excel.
+    
+    Args:
+        clave: Clave de session_state con la lista de items
+        columnas: Dict {nombre_columna: tipo} (ver utils.items_utils)
+        column_config: Configuración de columnas para st.data_editor
+    """
+    clave_tabla = f"{clave}_tabla"
+    clave_version = f"{clave}_tabla_version"
+    clave_salida = f"{clave}_tabla_salida"
+    
+    # Si los items cambiaron fuera del editor (catálogo, modo lista, importación),
+    # reconstruir el almacén columnar y reiniciar el estado del widget
+    if clave_tabla not in st.session_state or st.session_state[clave] != st.session_state.get(clave_salida):
+        import pandas as pd
+        datos_columnas = items_a_columnas(st.session_state[clave], columnas)
+        tipos = {nombre: ('string' if tipo is str else tipo) for nombre, tipo in columnas.items()}
+        st.session_state[clave_tabla] = pd.DataFrame(datos_columnas).astype(tipos)
+        st.session_state[clave_version] = st.session_state.get(clave_version, 0) + 1
+    
+    editado = st.data_editor(
+        st.session_state[clave_tabla],
+        num_rows="dynamic",
+        column_config=column_config,
+        use_container_width=True,
+        key=f"editor_{clave}_{st.session_state[clave_version]}"
+    )
+    
+    items = columnas_a_items(editado.to_dict('list'), columnas)
+    st.session_state[clave] = items
+    st.session_state[clave_salida] = [dict(item) for item in items]
+    
+    st.caption(f"**Total de filas:** {len(items)}")
+    
+    with st.expander("📋 Pegar filas desde hoja de cálculo"):
+        st.caption("Columnas en orden: " + ", ".join(columnas) + ". Se aceptan encabezados, también los de la tabla.")
+        texto_pegado = st.text_area("Filas", key=f"pegar_{clave}", label_visibility="collapsed")
+        
+        if st.button("📥 Importar filas", key=f"importar_{clave}", use_container_width=True):
+            nuevos = parsear_tabla_pegada(texto_pegado, columnas)
+            if nuevos:
+                st.session_state[clave].extend(nuevos)
+                st.rerun()
+            else:
+                st.error("No se encontraron filas válidas")
 
 
 def modulo_membretes():
@@ -80,9 +417,12 @@ def modulo_membretes():
         
         membrete_path = membretes[membrete_seleccionado_idx]
         
-        # Previsualización del membrete
-        st.image(membrete_path, caption=f"Previsualización: {membrete_nombres[membrete_seleccionado_idx]}", 
-            width=250)
+        # Previsualización del membrete (miniatura en caché, no el PNG completo)
+        from utils.miniatura_utils import obtener_miniatura_membrete
+        miniatura = obtener_miniatura_membrete(membrete_path)
+        if miniatura:
+            st.image(miniatura, caption=f"Previsualización: {membrete_nombres[membrete_seleccionado_idx]}", 
+                width=250)
     
     with col2:
         st.subheader("2. Sube tu documento")
@@ -94,6 +434,8 @@ def modulo_membretes():
         )
         
         if documento_file:
+            from utils.pdf_utils import aplicar_membrete_pdf, validar_documento, convertir_word_a_pdf
+            
             st.success(f"✅ Archivo cargado: {documento_file.name}")
             
             # Validar documento
@@ -106,6 +448,8 @@ def modulo_membretes():
             # Mostrar información según el tipo
             if tipo_archivo == 'docx':
                 st.info("📄 Documento Word detectado - se convertirá a PDF antes de aplicar el membrete")
+            else:
+                mostrar_vista_previa(documento_file, "Documento original (página 1)")
 
             # Botón para procesar
             if st.button("🎨 Aplicar Membrete", type="primary", use_container_width=True):
@@ -131,14 +475,16 @@ def modulo_membretes():
                         nombre_salida = f"{nombre_base}_con_membrete.pdf"
                         
                         # Botón de descarga
-                        st.download_button(
+                        artefacto_id = boton_descarga(
                             label="📥 Descargar PDF con Membrete",
-                            data=pdf_con_membrete,
+                            contenido=pdf_con_membrete,
                             file_name=nombre_salida,
-                            mime="application/pdf",
                             type="primary",
                             use_container_width=True
                         )
+                        botones_imagen(artefacto_id, os.path.splitext(nombre_salida)[0], contar_paginas(pdf_con_membrete))
+                        
+                        mostrar_vista_previa(pdf_con_membrete, "Con membrete (página 1)")
                         
                     except Exception as e:
                         st.error(f"❌ Error al procesar el PDF: {str(e)}")
@@ -191,7 +537,9 @@ def modulo_cotizaciones():
     with col2:
         cliente_telefono = st.text_input("Teléfono", placeholder="+52 123 456 7890")
         cliente_direccion = st.text_area("Dirección", placeholder="Calle, Ciudad, CP")
-        folio = st.text_input("Folio de Cotización *", value=f"COT-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+        folio = st.text_input("Folio de Cotización",
+                              placeholder=f"Automático: {consultar_siguiente_folio(empresa_seleccionada, 'cotizacion')}",
+                              help="Déjalo vacío para asignar el siguiente folio de la serie de la empresa")
     
     # SECCIÓN 3: Productos/Servicios
     st.subheader("3. Productos y Servicios")
@@ -201,8 +549,8 @@ def modulo_cotizaciones():
     with col_agregar:
         st.markdown("### ➕ Agregar Items")
         
-        catalogo = config['catalogo_productos']
-        producto_opciones = [f"{p['codigo']} - {p['descripcion']}" for p in catalogo]
+        catalogo = obtener_catalogo()['productos']
+        producto_opciones = obtener_catalogo()['opciones']
         
         producto_idx = st.selectbox(
             "",
@@ -248,7 +596,17 @@ def modulo_cotizaciones():
     with col_items:
         st.markdown("### 📋 Items en Cotización")
         
-        if st.session_state.items_cotizacion:
+        modo_tabla = st.toggle("Modo tabla", key="modo_tabla_cotizacion",
+                               help="Edita todos los items en una sola tabla y pega filas desde Excel")
+        
+        if modo_tabla:
+            editor_tabla_items('items_cotizacion', COLUMNAS_COTIZACION, {
+                'codigo': st.column_config.TextColumn("Código"),
+                'descripcion': st.column_config.TextColumn("Descripción", width="large"),
+                'cantidad': st.column_config.NumberColumn("Cantidad", min_value=1, step=1, default=1),
+                'precio_unitario': st.column_config.NumberColumn("Precio Unit.", min_value=0.0, step=10.0, format="$%.2f")
+            })
+        elif st.session_state.items_cotizacion:
             st.write(f"**Total de items:** {len(st.session_state.items_cotizacion)}")
             
             # Mostrar items con opción de editar
@@ -357,6 +715,8 @@ def modulo_cotizaciones():
     # SECCIÓN 5: Generar PDF
     st.subheader("5. Generar Cotización")
     
+    membrete_cotizacion = selector_membrete("membrete_cotizacion")
+    
     col_btn1, col_btn2 = st.columns([5,1])
     
     with col_btn1:
@@ -365,6 +725,30 @@ def modulo_cotizaciones():
     with col_btn2:
         generar_prueba = st.button("PDF de Prueba", use_container_width=True, help="Genera un PDF con datos de ejemplo para ver el diseño")
     
+    if not (generar_pdf or generar_prueba):
+        folio_vista = folio or consultar_siguiente_folio(empresa_seleccionada, 'cotizacion')
+        datos_vista = {
+            'empresa': empresa_seleccionada,
+            'folio': folio_vista,
+            'fecha': obtener_fecha_folio(folio_vista),
+            'cliente': {
+                'nombre': cliente_nombre,
+                'empresa': cliente_empresa,
+                'direccion': cliente_direccion,
+                'telefono': cliente_telefono,
+                'email': cliente_email
+            },
+            'items': st.session_state.items_cotizacion,
+            'descuento': {
+                'aplicar': aplicar_descuento,
+                'tipo': tipo_descuento if aplicar_descuento else 'Porcentaje',
+                'valor': valor_descuento if aplicar_descuento else 0
+            }
+        }
+        if membrete_cotizacion:
+            datos_vista['membrete'] = membrete_cotizacion
+        vista_previa_en_vivo('cotizacion', datos_vista, config)
+    
     if generar_prueba:
         with st.spinner("Generando PDF de prueba..."):
             try:
@@ -372,6 +756,7 @@ def modulo_cotizaciones():
                 datos_prueba = {
                     'empresa': empresa_seleccionada,
                     'folio': f"PRUEBA-{datetime.now().strftime('%Y%m%d-%H%M%S')}",
+                    'fecha': datetime.now().replace(microsecond=0),
                     'cliente': {
                         'nombre': 'Cliente de Prueba',
                         'empresa': 'Empresa Demo S.A. de C.V.',
@@ -406,21 +791,27 @@ def modulo_cotizaciones():
                     }
                 }
                 
+                if membrete_cotizacion:
+                    datos_prueba['membrete'] = membrete_cotizacion
+                
                 # Generar PDF de prueba
+                from utils.cotizacion_utils import generar_cotizacion_pdf
                 pdf_bytes = generar_cotizacion_pdf(datos_prueba, config)
                 
                 st.success("✅ ¡PDF de prueba generado!")
                 
                 # Botón de descarga
                 nombre_archivo = f"Cotizacion_PRUEBA_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-                st.download_button(
+                artefacto_id = boton_descarga(
                     label="📥 Descargar PDF de Prueba",
-                    data=pdf_bytes,
+                    contenido=pdf_bytes,
                     file_name=nombre_archivo,
-                    mime="application/pdf",
                     type="primary",
                     use_container_width=True
                 )
+                botones_imagen(artefacto_id, os.path.splitext(nombre_archivo)[0], contar_paginas(pdf_bytes))
+                
+                mostrar_vista_previa(pdf_bytes)
                 
             except Exception as e:
                 st.error(f"❌ Error al generar PDF de prueba: {str(e)}")
@@ -433,10 +824,6 @@ def modulo_cotizaciones():
             st.error("❌ Ingresa el nombre del cliente")
             return
         
-        if not folio:
-            st.error("❌ Ingresa el folio de la cotización")
-            return
-        
         if not st.session_state.items_cotizacion:
             st.error("❌ Agrega al menos un item a la cotización")
             return
@@ -446,7 +833,6 @@ def modulo_cotizaciones():
                 # Preparar datos
                 datos_cotizacion = {
                     'empresa': empresa_seleccionada,
-                    'folio': folio,
                     'cliente': {
                         'nombre': cliente_nombre,
                         'empresa': cliente_empresa,
@@ -462,21 +848,33 @@ def modulo_cotizaciones():
                     }
                 }
                 
+                if membrete_cotizacion:
+                    datos_cotizacion['membrete'] = membrete_cotizacion
+                
+                if not folio:
+                    folio = obtener_folio_asignado('cotizacion', datos_cotizacion, config)
+                datos_cotizacion['folio'] = folio
+                datos_cotizacion['fecha'] = obtener_fecha_folio(folio)
+                
                 # Generar PDF
+                from utils.cotizacion_utils import generar_cotizacion_pdf
                 pdf_bytes = generar_cotizacion_pdf(datos_cotizacion, config)
+                archivar_generado('cotizacion', datos_cotizacion, pdf_bytes, config)
                 
                 st.success("✅ ¡Cotización generada correctamente!")
                 
                 # Botón de descarga
                 nombre_archivo = f"Cotizacion_{folio}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                st.download_button(
+                artefacto_id = boton_descarga(
                     label="📥 Descargar Cotización PDF",
-                    data=pdf_bytes,
+                    contenido=pdf_bytes,
                     file_name=nombre_archivo,
-                    mime="application/pdf",
                     type="primary",
                     use_container_width=True
                 )
+                botones_imagen(artefacto_id, os.path.splitext(nombre_archivo)[0], contar_paginas(pdf_bytes))
+                
+                mostrar_vista_previa(pdf_bytes)
                 
             except Exception as e:
                 st.error(f"❌ Error al generar la cotización: {str(e)}")
@@ -517,6 +915,9 @@ def modulo_comprobantes():
         st.write(f"**Teléfono:** {empresa_seleccionada['telefono']}")
         st.write(f"**Email:** {empresa_seleccionada['email']}")
     
+    with st.expander("📦 Generar comprobantes por lote (exportación de pagos CSV/XLSX)"):
+        seccion_lote_comprobantes(config, empresa_seleccionada)
+    
     # SECCIÓN 2: Información del Cliente
     st.subheader("2. Datos del Cliente")
     
@@ -528,7 +929,9 @@ def modulo_comprobantes():
     with col2:
         cliente_telefono = st.text_input("Número celular *", placeholder="+52 844 123 4567")
     
-    folio = st.text_input("Folio del Comprobante *", value=f"COMP-{datetime.now().strftime('%Y%m%d-%H%M%S')}")
+    folio = st.text_input("Folio del Comprobante",
+                          placeholder=f"Automático: {consultar_siguiente_folio(empresa_seleccionada, 'comprobante')}",
+                          help="Déjalo vacío para asignar el siguiente folio de la serie de la división")
     
     # SECCIÓN 3: Conceptos
     st.subheader("3. Conceptos de Pago")
@@ -554,7 +957,15 @@ def modulo_comprobantes():
     with col_conceptos:
         st.markdown("### 📋 Conceptos Agregados")
         
-        if st.session_state.conceptos_comprobante:
+        modo_tabla = st.toggle("Modo tabla", key="modo_tabla_comprobante",
+                               help="Edita todos los conceptos en una sola tabla y pega filas desde Excel")
+        
+        if modo_tabla:
+            editor_tabla_items('conceptos_comprobante', COLUMNAS_COMPROBANTE, {
+                'descripcion': st.column_config.TextColumn("Descripción", width="large"),
+                'monto': st.column_config.NumberColumn("Monto", min_value=0.0, step=50.0, format="$%.2f")
+            })
+        elif st.session_state.conceptos_comprobante:
             st.write(f"**Total de conceptos:** {len(st.session_state.conceptos_comprobante)}")
             
             # Mostrar conceptos con opción de editar
@@ -620,22 +1031,53 @@ def modulo_comprobantes():
     st.markdown("---")
     st.subheader("5. Adjuntar Comprobante de Pago (Opcional)")
     
-    comprobante_imagen = st.file_uploader(
-        "Sube una captura del comprobante de pago",
-        type=['png', 'jpg', 'jpeg'],
-        help="Adjunta una imagen del comprobante bancario o transferencia"
+    comprobantes_subidos = st.file_uploader(
+        "Sube las capturas o los PDF del comprobante de pago",
+        type=['png', 'jpg', 'jpeg', 'pdf'],
+        accept_multiple_files=True,
+        help="Adjunta una o varias imágenes o PDF del comprobante bancario o transferencias (pagos en parcialidades)"
     )
     
-    if comprobante_imagen:
-        st.success("✅ Comprobante cargado")
-        st.image(comprobante_imagen, caption="Vista previa del comprobante", width=300)
+    comprobantes_subidos = comprobantes_subidos or []
+    comprobante_imagenes = [f for f in comprobantes_subidos if not f.name.lower().endswith('.pdf')]
+    comprobantes_pdf = [f for f in comprobantes_subidos if f.name.lower().endswith('.pdf')]
+    
+    if comprobantes_subidos:
+        st.success(f"✅ Comprobantes cargados: {len(comprobantes_subidos)}")
+    if comprobante_imagenes:
+        st.image(comprobante_imagenes, caption=[img.name for img in comprobante_imagenes], width=150)
+    if comprobantes_pdf:
+        st.caption("PDF anexados como páginas: " + ", ".join(f.name for f in comprobantes_pdf))
+        ajustar_anexos = st.checkbox(
+            "Ajustar comprobantes PDF al recuadro de 4×5 pulgadas",
+            value=False,
+            help="Si no se marca, cada página del PDF del banco se anexa con su tamaño original"
+        )
     
     # SECCIÓN 6: Generar PDF
     st.markdown("---")
     st.subheader("6. Generar Comprobante de Pago")
     
+    membrete_comprobante = selector_membrete("membrete_comprobante")
+    
     generar_pdf = st.button("📄 Generar PDF de Comprobante", type="primary", use_container_width=True)
     
+    if not generar_pdf:
+        folio_vista = folio or consultar_siguiente_folio(empresa_seleccionada, 'comprobante')
+        datos_vista = {
+            'empresa': empresa_seleccionada,
+            'folio': folio_vista,
+            'fecha': obtener_fecha_folio(folio_vista),
+            'cliente': {
+                'nombre': cliente_nombre,
+                'telefono': cliente_telefono
+            },
+            'conceptos': st.session_state.conceptos_comprobante
+        }
+        if membrete_comprobante:
+            datos_vista['membrete'] = membrete_comprobante
+        vista_previa_en_vivo('comprobante', datos_vista, config)
+    
     if generar_pdf:
         # Validaciones
         if not cliente_nombre:
@@ -646,10 +1088,6 @@ def modulo_comprobantes():
             st.error("❌ Ingresa el número celular del cliente")
             return
         
-        if not folio:
-            st.error("❌ Ingresa el folio del comprobante")
-            return
-        
         if not st.session_state.conceptos_comprobante:
             st.error("❌ Agrega al menos un concepto al comprobante")
             return
@@ -659,7 +1097,6 @@ def modulo_comprobantes():
                 # Preparar datos
                 datos_comprobante = {
                     'empresa': empresa_seleccionada,
-                    'folio': folio,
                     'cliente': {
                         'nombre': cliente_nombre,
                         'telefono': cliente_telefono
@@ -667,25 +1104,40 @@ def modulo_comprobantes():
                     'conceptos': st.session_state.conceptos_comprobante
                 }
                 
-                # Agregar imagen si existe
-                if comprobante_imagen:
-                    datos_comprobante['comprobante_imagen'] = comprobante_imagen
+                if membrete_comprobante:
+                    datos_comprobante['membrete'] = membrete_comprobante
+                
+                # Agregar imágenes si existen
+                if comprobante_imagenes:
+                    datos_comprobante['comprobante_imagenes'] = comprobante_imagenes
+                if comprobantes_pdf:
+                    datos_comprobante['anexos_pdf'] = comprobantes_pdf
+                    datos_comprobante['anexos_ajustar'] = ajustar_anexos
+                
+                if not folio:
+                    folio = obtener_folio_asignado('comprobante', datos_comprobante, config)
+                datos_comprobante['folio'] = folio
+                datos_comprobante['fecha'] = obtener_fecha_folio(folio)
                 
                 # Generar PDF
+                from utils.comprobante_utils import generar_comprobante_pdf
                 pdf_bytes = generar_comprobante_pdf(datos_comprobante, config)
+                archivar_generado('comprobante', datos_comprobante, pdf_bytes, config)
                 
                 st.success("✅ ¡Comprobante de pago generado correctamente!")
                 
                 # Botón de descarga
                 nombre_archivo = f"Comprobante_{folio}_{datetime.now().strftime('%Y%m%d')}.pdf"
-                st.download_button(
+                artefacto_id = boton_descarga(
                     label="📥 Descargar Comprobante PDF",
-                    data=pdf_bytes,
+                    contenido=pdf_bytes,
                     file_name=nombre_archivo,
-                    mime="application/pdf",
                     type="primary",
                     use_container_width=True
                 )
+                botones_imagen(artefacto_id, os.path.splitext(nombre_archivo)[0], contar_paginas(pdf_bytes))
+                
+                mostrar_vista_previa(pdf_bytes)
                 
             except Exception as e:
                 st.error(f"❌ Error al generar el comprobante: {str(e)}")
@@ -693,6 +1145,205 @@ def modulo_comprobantes():
                 st.code(traceback.format_exc())
 
 
+def seccion_lote_comprobantes(config, empresa):
+    """Genera un ZIP de comprobantes a partir de una exportación de pagos"""
+    st.markdown(
+        "Columnas: **referencia, cliente, telefono, concepto, monto** y, opcionalmente, "
+        "**email, empresa, folio, fecha**. Las filas con la misma referencia son conceptos de un "
+        "mismo comprobante. La fecha puede ser AAAA-MM-DD, dd/mm/aaaa o dd-mm-aaaa. Las imágenes o PDF "
+        "se relacionan por nombre: `REF.jpg`, `REF_2.jpg`."
+    )
+    
+    archivo_pagos = st.file_uploader("Exportación de pagos", type=['csv', 'xlsx'], key="lote_pagos")
+    archivos_adjuntos = st.file_uploader(
+        "Imágenes y PDF de los comprobantes (opcional)",
+        type=['png', 'jpg', 'jpeg', 'pdf'],
+        accept_multiple_files=True,
+        key="lote_adjuntos"
+    )
+    archivar = st.checkbox("Guardar los comprobantes en el archivo", value=True, key="lote_archivar")
+    
+    if not st.button("📦 Generar lote", disabled=archivo_pagos is None):
+        return
+    
+    try:
+        filas = leer_pagos(archivo_pagos, archivo_pagos.name)
+    except Exception as e:
+        st.error(f"❌ No se pudo leer la exportación de pagos: {str(e)}")
+        return
+    
+    if not filas:
+        st.warning("⚠️ El archivo no tiene filas de pagos")
+        return
+    
+    comprobantes = agrupar_pagos(filas, empresa, config)
+    barra = st.progress(0.0, text=f"Generando {len(comprobantes)} comprobantes...")
+    
+    # Los adjuntos se escriben a disco para que los procesos del pool los lean por ruta
+    with tempfile.TemporaryDirectory() as carpeta:
+        for adjunto in archivos_adjuntos or []:
+            with open(os.path.join(carpeta, os.path.basename(adjunto.name)), 'wb') as f:
+                f.write(adjunto.getbuffer())
+        
+        ruta_zip = os.path.join(carpeta, "comprobantes.zip")
+        resultado = generar_lote_comprobantes(
+            comprobantes, config, ruta_zip,
+            adjuntos=indexar_adjuntos(carpeta, [c['referencia'] for c in comprobantes]),
+            archivar=archivar,
+            progreso=lambda hechos, total: barra.progress(hechos / total, text=f"{hechos} de {total}")
+        )
+        nombre_zip = f"Comprobantes_{datetime.now().strftime('%Y%m%d_%H%M')}.zip"
+        zip_id = guardar_artefacto_desde_archivo(ruta_zip, nombre_zip)
+    
+    if resultado['errores']:
+        st.warning(f"⚠️ {resultado['generados']} comprobantes generados, {resultado['errores']} con error "
+                   f"({resultado['segundos']:.1f} s)")
+    else:
+        st.success(f"✅ {resultado['generados']} comprobantes generados ({resultado['segundos']:.1f} s)")
+    
+    st.dataframe(resultado['filas'], use_container_width=True, hide_index=True)
+    st.download_button(
+        label="📥 Descargar ZIP de comprobantes",
+        data=lambda: leer_artefacto(zip_id),
+        file_name=nombre_zip,
+        mime="application/zip"
+    )
+
+
+def seccion_envio_correo(documentos, config):
+    """
+    Envía los documentos encontrados al correo de cada cliente.
+    
+    Los mensajes se envían por conexiones SMTP persistentes (ver envio_utils); los
+    documentos ya enviados a ese correo se omiten salvo que se pida reenviarlos.
+    """
+    from utils.envio_utils import consultar_enviados, enviar_documentos, obtener_config_smtp
+    
+    try:
+        smtp = obtener_config_smtp(config)
+    except ValueError as e:
+        st.info(f"📝 {str(e)}")
+        return
+    
+    con_correo = [doc for doc in documentos if doc['cliente_email'].strip()]
+    enviados = consultar_enviados([doc['id'] for doc in con_correo])
+    sin_enviar = [doc for doc in con_correo if (doc['id'], doc['cliente_email'].strip().lower()) not in enviados]
+    st.write(f"{len(con_correo)} de {len(documentos)} documentos tienen correo del cliente; "
+             f"{len(sin_enviar)} sin enviar. Remitente: {smtp['remitente']}")
+    
+    reenviar = st.checkbox("Reenviar también los ya enviados", key="envio_reenviar")
+    por_enviar = con_correo if reenviar else sin_enviar
+    if not st.button(f"📧 Enviar {len(por_enviar)} documentos", disabled=not por_enviar, use_container_width=True):
+        return
+    
+    barra = st.progress(0.0, text=f"Enviando {len(por_enviar)} documentos...")
+    resultado = enviar_documentos(
+        por_enviar, config,
+        reenviar=reenviar,
+        progreso=lambda hechos, total: barra.progress(hechos / total, text=f"{hechos} de {total}")
+    )
+    
+    if resultado['errores']:
+        st.warning(f"⚠️ {resultado['enviados']} documentos enviados, {resultado['errores']} con error "
+                   f"({resultado['segundos']:.1f} s)")
+        st.dataframe([fila for fila in resultado['filas'] if fila['estado'] == 'error'],
+                     use_container_width=True, hide_index=True)
+    else:
+        st.success(f"✅ {resultado['enviados']} documentos enviados ({resultado['segundos']:.1f} s)")
+
+
+def modulo_archivo():
+    """Módulo para buscar y descargar documentos generados anteriormente"""
+    
+    config = cargar_configuracion()
+    if not config:
+        st.error("❌ No se pudo cargar la configuración. Verifica el archivo data/config.json")
+        return
+    
+    st.subheader("Buscar documentos")
+    
+    texto = st.text_input("Buscar en el contenido", placeholder="Ej: informe ATS, consultoría 1786, nombre de la empresa cliente",
+                          help="Busca en descripciones, conceptos, montos y datos del cliente")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        folio = st.text_input("Folio", placeholder="COT-2025...")
+        tipo = st.selectbox("Tipo", ["Todos", "Cotizaciones", "Comprobantes"])
+    
+    with col2:
+        cliente = st.text_input("Cliente", placeholder="Nombre del cliente")
+        telefono = st.text_input("Teléfono", placeholder="844...")
+    
+    with col3:
+        empresa_nombres = ["Todas"] + [emp['nombre'] for emp in config['empresas']]
+        empresa = st.selectbox("Empresa", empresa_nombres)
+        rango = st.date_input("Fechas", value=(), help="Selecciona fecha inicial y final")
+    
+    tipos = {"Todos": None, "Cotizaciones": 'cotizacion', "Comprobantes": 'comprobante'}
+    desde = rango[0] if len(rango) > 0 else None
+    hasta = rango[1] if len(rango) > 1 else desde
+    
+    documentos = buscar_documentos(
+        folio=folio or None,
+        cliente=cliente or None,
+        telefono=telefono or None,
+        empresa=None if empresa == "Todas" else empresa,
+        tipo=tipos[tipo],
+        desde=desde,
+        hasta=hasta,
+        texto=texto or None
+    )
+    
+    if not documentos:
+        st.info("No se encontraron documentos")
+        return
+    
+    st.write(f"**Resultados:** {len(documentos)}")
+    st.dataframe(
+        [{
+            'Folio': doc['folio'],
+            'Tipo': doc['tipo'].capitalize(),
+            'Fecha': doc['fecha'].replace('T', ' '),
+            'Cliente': doc['cliente_nombre'],
+            'Teléfono': doc['cliente_telefono'],
+            'Correo': doc['cliente_email'],
+            'Empresa': doc['empresa'],
+            'Total': f"${doc['total']:,.2f} {doc['moneda']}"
+        } for doc in documentos],
+        use_container_width=True,
+        hide_index=True
+    )
+    
+    with st.expander("📧 Enviar por correo a los clientes"):
+        seccion_envio_correo(documentos, config)
+    
+    doc_idx = st.selectbox(
+        "Documento a descargar:",
+        range(len(documentos)),
+        format_func=lambda x: f"{documentos[x]['folio']} - {documentos[x]['cliente_nombre']} ({documentos[x]['fecha'][:10]})"
+    )
+    documento = documentos[doc_idx]
+    
+    if not os.path.isfile(documento['pdf_ruta']):
+        st.error(f"❌ No se encontró el PDF archivado: {documento['pdf_ruta']}")
+        return
+    
+    prefijo = "Cotizacion" if documento['tipo'] == 'cotizacion' else "Comprobante"
+    # El PDF ya está en disco: se vuelve a leer solo al descargarlo o si su vista
+    # previa no está en caché (se busca por el hash guardado en el archivo)
+    st.download_button(
+        label="📥 Descargar PDF",
+        data=lambda: leer_pdf_archivado(documento),
+        file_name=f"{prefijo}_{documento['folio']}_{documento['fecha'][:10].replace('-', '')}.pdf",
+        mime="application/pdf",
+        type="primary",
+        use_container_width=True
+    )
+    
+    mostrar_vista_previa(lambda: leer_pdf_archivado(documento), sha256=documento['pdf_sha256'])
+
+
 def main():
     """Función principal de la aplicación"""
     # Sidebar
@@ -701,20 +1352,43 @@ def main():
     
     modulo = st.sidebar.radio(
         "Selecciona un módulo:",
-        ["📄 Aplicar Membretes", "💼 Generar Cotizaciones", "💳 Comp. de Pago"],
+        ["📄 Aplicar Membretes", "💼 Generar Cotizaciones", "💳 Comp. de Pago", "🗂️ Archivo"],
         label_visibility="collapsed"
     )
 
     st.sidebar.markdown("---")
     
+    iniciar_metricas()
+    
+    # Perfilado por sesión (DOCUMENTADOR_PERFIL=1 lo activa para todo el proceso)
+    if modo_administrador():
+        activar_perfil(st.sidebar.toggle(
+            "🔬 Perfilar documentos",
+            key="perfilar_documentos",
+            help="Guarda en perfiles/ un reporte de cProfile y tracemalloc de cada documento generado"
+        ))
+    else:
+        activar_perfil(False)
     
     # Mostrar el módulo seleccionado
     if modulo == "📄 Aplicar Membretes":
         modulo_membretes()
     elif modulo == "💼 Generar Cotizaciones":
         modulo_cotizaciones()
-    else:
+    elif modulo == "💳 Comp. de Pago":
         modulo_comprobantes()
+    else:
+        modulo_archivo()
+    
+    # Al final, para que incluya lo que se generó en esta ejecución
+    if modo_administrador():
+        ultimo_reporte = obtener_ultimo_reporte()
+        if ultimo_reporte:
+            st.sidebar.caption(f"🔬 Último perfil: `{ultimo_reporte}`")
+        panel_metricas()
+    
+    # Después del primer render, cargar lo que usarán los demás módulos
+    precargar_modulos()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,155 @@
+"""
+Benchmark de arranque de la aplicación Streamlit
+
+Mide, cada vez en un proceso nuevo:
+- El tiempo de importar streamlit y los módulos que app.py importa al inicio
+- El tiempo del primer render de la aplicación y el de abrir cada módulo por
+  primera vez (con streamlit.testing.AppTest)
+- Qué dependencias pesadas quedaron cargadas después de ese primer render
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/arranque.py
+    python benchmarks/arranque.py --repeticiones 5 --json arranque.json
+
+La precarga en segundo plano se desactiva (DOCUMENTADOR_PRECARGA=0) para que no
+se mezcle con lo que se mide.
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULOS_APP = ["📄 Aplicar Membretes", "💼 Generar Cotizaciones", "💳 Comp. de Pago", "🗂️ Archivo"]
+
+# Dependencias que no deberían cargarse antes de que se usen
+DEPENDENCIAS_PESADAS = ["reportlab", "PyPDF2", "PIL", "openpyxl", "docx2pdf", "pandas"]
+
+# Código que corre en cada proceso de medición
+MEDICION = """
+import importlib, json, sys, time
+t = time.perf_counter()
+import streamlit
+t_streamlit = time.perf_counter() - t
+t = time.perf_counter()
+for nombre in {imports!r}:
+    importlib.import_module(nombre)
+t_app = time.perf_counter() - t
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=120)
+t = time.perf_counter()
+at.run()
+t_arranque = time.perf_counter() - t
+modulo = {modulo!r}
+if modulo != {inicial!r}:
+    t = time.perf_counter()
+    at.sidebar.radio[0].set_value(modulo).run()
+    t_render = time.perf_counter() - t
+else:
+    t_render = t_arranque
+print(json.dumps({{
+    "streamlit": t_streamlit,
+    "importacion": t_app,
+    "arranque": t_arranque,
+    "render": t_render,
+    "excepciones": len(at.exception),
+    "cargadas": [m for m in {pesadas!r} if m in sys.modules]
+}}))
+"""
+
+
+def modulos_importados_app():
+    """
+    Módulos del proyecto que app.py importa al inicio (fuera de funciones).
+
+    Returns:
+        list: Nombres de módulo, por ejemplo 'utils.folio_utils'
+    """
+    with open(os.path.join(RAIZ, "app.py"), 'r', encoding='utf-8') as f:
+        arbol = ast.parse(f.read())
+
+    nombres = []
+    for nodo in arbol.body:
+        if isinstance(nodo, ast.ImportFrom) and nodo.module and nodo.module.startswith("utils."):
+            nombres.append(nodo.module)
+        elif isinstance(nodo, ast.Import):
+            nombres.extend(a.name for a in nodo.names if a.name.startswith("utils."))
+    return nombres
+
+
+def medir(modulo):
+    """
+    Mide el arranque en un proceso nuevo abriendo el módulo indicado.
+
+    Args:
+        modulo: Opción del menú lateral que se abre
+
+    Returns:
+        dict: Tiempos en segundos y dependencias pesadas cargadas
+    """
+    codigo = MEDICION.format(
+        imports=modulos_importados_app(),
+        modulo=modulo,
+        inicial=MODULOS_APP[0],
+        pesadas=DEPENDENCIAS_PESADAS
+    )
+    entorno = dict(os.environ, DOCUMENTADOR_PRECARGA="0")
+    resultado = subprocess.run(
+        [sys.executable, "-c", codigo],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True, check=True
+    )
+    return json.loads(resultado.stdout.strip().splitlines()[-1])
+
+
+def ejecutar(repeticiones):
+    """
+    Ejecuta todas las mediciones.
+
+    Args:
+        repeticiones: Procesos por módulo; se reporta la mediana
+
+    Returns:
+        dict: {modulo: {'streamlit', 'importacion', 'arranque', 'render', 'excepciones', 'cargadas'}}
+    """
+    resultados = {}
+    for modulo in MODULOS_APP:
+        medidas = [medir(modulo) for _ in range(repeticiones)]
+        resultados[modulo] = {
+            'streamlit': statistics.median(m['streamlit'] for m in medidas),
+            'importacion': statistics.median(m['importacion'] for m in medidas),
+            'arranque': statistics.median(m['arranque'] for m in medidas),
+            'render': statistics.median(m['render'] for m in medidas),
+            'excepciones': max(m['excepciones'] for m in medidas),
+            'cargadas': medidas[-1]['cargadas']
+        }
+    return resultados
+
+
+def imprimir(resultados):
+    """Tabla con los resultados"""
+    print(f"{'Módulo':<26}{'streamlit':>11}{'imports app':>13}{'1er render':>12}{'abrir módulo':>14}"
+          f"  Dependencias cargadas")
+    for modulo, r in resultados.items():
+        cargadas = ", ".join(r['cargadas']) or "-"
+        aviso = f"  ({r['excepciones']} excepciones)" if r['excepciones'] else ""
+        print(f"{modulo:<26}{r['streamlit']*1000:>9.0f}ms{r['importacion']*1000:>11.0f}ms"
+              f"{r['arranque']*1000:>10.0f}ms{r['render']*1000:>12.0f}ms  {cargadas}{aviso}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide el tiempo de arranque de la aplicación")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Procesos por módulo (se usa la mediana)")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    argumentos = parser.parse_args()
+
+    resultados = ejecutar(argumentos.repeticiones)
+    imprimir(resultados)
+
+    if argumentos.json:
+        with open(argumentos.json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
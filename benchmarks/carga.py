@@ -0,0 +1,476 @@
+"""
+Prueba de carga de la aplicación Streamlit con N usuarios simultáneos
+
+Levanta `streamlit run app.py` en un puerto libre y cada usuario simulado abre su
+propia sesión por websocket, igual que un navegador: envía los valores de los
+widgets, sube archivos por /_stcore/upload_file y espera a que termine cada
+rerun del script. Cada recorrido es una sesión nueva:
+- Cotización: pega M partidas en el modo tabla, captura el cliente y genera el PDF
+- Comprobante: captura cliente y concepto, sube K fotos y genera el PDF
+- Membrete: sube un PDF de P páginas y aplica el membrete
+
+Para cada nivel de usuarios reporta la latencia p50, p95 y p99 de todas las
+interacciones (cada clic, captura o subida es un rerun del script) y de las que
+generan un documento, los documentos por minuto y la memoria RSS pico del
+proceso del servidor.
+
+El servidor corre en un directorio temporal con copia de data/, membretes/ y
+logos/: los documentos, folios y cachés no se escriben en el archivo real. Antes
+del primer nivel se hace un recorrido de calentamiento que no se mide.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/carga.py --usuarios 1,2,4,8 --items 50 --imagenes 2 --paginas 10
+    python benchmarks/carga.py --usuarios 4 --recorridos 5 --pausa 1 --json carga.json
+    python benchmarks/carga.py --url http://servidor:8501 --usuarios 2
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+import uuid
+
+import corpus
+
+
+RAIZ = corpus.RAIZ
+
+MODULO_COTIZACION = "💼 Generar Cotizaciones"
+MODULO_COMPROBANTE = "💳 Comp. de Pago"
+MODULO_MEMBRETE = "📄 Aplicar Membretes"
+
+# Segundos máximos de espera por un rerun o por el arranque del servidor
+TIEMPO_MAXIMO = 600
+TIEMPO_ARRANQUE = 60
+
+
+class UsuarioSimulado:
+    """Un usuario que repite el recorrido, con una sesión de websocket por recorrido"""
+
+    def __init__(self, url, entradas, pausa):
+        self.url = url.rstrip('/')
+        self.entradas = entradas
+        self.pausa = pausa
+        self.conexion = None
+        self.id_sesion = None
+        self.elementos = {}
+        self.valores = {}
+        self.errores_rerun = []
+        self.interacciones = []
+        self.generaciones = []
+        self.errores = []
+
+    def recorrido(self):
+        """Cotización, comprobante y membrete, una vez cada uno, en una sesión nueva"""
+        from websockets.sync.client import connect
+
+        url_ws = self.url.replace('http', 'ws', 1) + "/_stcore/stream"
+        self.elementos = {}
+        self.valores = {}
+        try:
+            with connect(url_ws, subprotocols=["streamlit"], max_size=None,
+                         open_timeout=TIEMPO_ARRANQUE) as self.conexion:
+                # La primera interacción de la sesión es abrir la aplicación
+                self._interactuar()
+                for paso in (self._cotizacion, self._comprobante, self._membrete):
+                    try:
+                        paso()
+                    except Exception as e:
+                        self.errores.append(f"{paso.__name__}: {type(e).__name__}: {e}")
+        except Exception as e:
+            self.errores.append(f"conexión: {type(e).__name__}: {e}")
+
+    def _cotizacion(self):
+        self._cambiar('radio', None, string_value=MODULO_COTIZACION)
+        self._cambiar('checkbox', "Modo tabla", bool_value=True)
+        self._cambiar('text_input', "Nombre del cliente *", string_value="Cliente de carga")
+        self._cambiar('text_area', "Filas", string_value=self.entradas['filas_cotizacion'])
+        self._presionar("📥 Importar filas")
+        self._generar("📄 Generar PDF de Cotización")
+
+    def _comprobante(self):
+        self._cambiar('radio', None, string_value=MODULO_COMPROBANTE)
+        self._cambiar('text_input', "Nombre completo *", string_value="Cliente de carga")
+        self._cambiar('text_input', "Número celular *", string_value="8440000000")
+        self._cambiar('text_area', "", string_value="Pago de servicio")
+        self._cambiar('number_input', "Monto", double_value=1500.0)
+        self._presionar("➕ Agregar Concepto")
+        if self.entradas['fotos']:
+            self._subir("Sube las capturas o los PDF del comprobante de pago", self.entradas['fotos'])
+        self._generar("📄 Generar PDF de Comprobante")
+
+    def _membrete(self):
+        self._cambiar('radio', None, string_value=MODULO_MEMBRETE)
+        self._subir("Selecciona el archivo PDF o Word", [self.entradas['pdf']])
+        self._generar("🎨 Aplicar Membrete")
+
+    def _id(self, tipo, etiqueta):
+        """Id del primer widget del tipo con la etiqueta indicada (None: el primero del tipo)"""
+        for tipo_elemento, etiqueta_elemento, id_widget in self.elementos.values():
+            if tipo_elemento == tipo and (etiqueta is None or etiqueta_elemento == etiqueta):
+                return id_widget
+        raise LookupError(f"No se encontró {tipo} '{etiqueta}'")
+
+    def _cambiar(self, tipo, etiqueta, **campo):
+        """Cambia el valor de un widget, como lo haría el usuario, y ejecuta el rerun"""
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        id_widget = self._id(tipo, etiqueta)
+        self.valores[id_widget] = WidgetState(id=id_widget, **campo)
+        self._interactuar()
+
+    def _presionar(self, etiqueta):
+        """Presiona un botón y ejecuta el rerun"""
+        self._interactuar(self._id('button', etiqueta))
+
+    def _subir(self, etiqueta, archivos):
+        """Sube archivos al file_uploader indicado y ejecuta el rerun (se mide junto)"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        id_widget = self._id('file_uploader', etiqueta)
+        if self.pausa:
+            time.sleep(self.pausa)
+        inicio = time.perf_counter()
+
+        solicitud = BackMsg()
+        solicitud.file_urls_request.request_id = uuid.uuid4().hex
+        solicitud.file_urls_request.session_id = self.id_sesion
+        solicitud.file_urls_request.file_names.extend(nombre for nombre, _, _ in archivos)
+        self.conexion.send(solicitud.SerializeToString())
+        respuesta = self._recibir_hasta(
+            lambda mensaje: mensaje.WhichOneof('type') == 'file_urls_response'
+            and mensaje.file_urls_response.response_id == solicitud.file_urls_request.request_id
+        ).file_urls_response
+        if respuesta.error_msg:
+            raise RuntimeError(respuesta.error_msg)
+
+        estado = WidgetState(id=id_widget)
+        for (nombre, contenido, tipo), urls in zip(archivos, respuesta.file_urls):
+            # El servidor acepta exactamente un archivo por petición
+            cuerpo, frontera = _multipart(nombre, contenido, tipo)
+            peticion = urllib.request.Request(
+                self.url + urls.upload_url, data=cuerpo, method='PUT',
+                headers={'Content-Type': f"multipart/form-data; boundary={frontera}"}
+            )
+            urllib.request.urlopen(peticion, timeout=TIEMPO_MAXIMO).close()
+            info = estado.file_uploader_state_value.uploaded_file_info.add()
+            info.file_id = urls.file_id
+            info.name = nombre
+            info.size = len(contenido)
+            info.file_urls.CopyFrom(urls)
+        self.valores[id_widget] = estado
+
+        self._rerun()
+        self.interacciones.append(time.perf_counter() - inicio)
+
+    def _interactuar(self, disparador=None):
+        """Ejecuta un rerun con los valores actuales (y un botón presionado) y mide su latencia"""
+        if self.pausa:
+            time.sleep(self.pausa)
+        inicio = time.perf_counter()
+        self._rerun(disparador)
+        segundos = time.perf_counter() - inicio
+        self.interacciones.append(segundos)
+        return segundos
+
+    def _generar(self, etiqueta):
+        """Presiona el botón que genera un documento"""
+        segundos = self._interactuar(self._id('button', etiqueta))
+        self.generaciones.append(segundos)
+
+    def _rerun(self, disparador=None):
+        """Envía rerun_script y espera el fin del script (incluidos los st.rerun encadenados)"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        mensaje = BackMsg()
+        estado = mensaje.rerun_script
+        estado.SetInParent()
+        # Como el navegador: solo los widgets montados en el último rerun
+        ids_montados = {id_widget for _, _, id_widget in self.elementos.values()}
+        for id_widget, valor in self.valores.items():
+            if id_widget in ids_montados:
+                estado.widget_states.widgets.append(valor)
+        if disparador:
+            estado.widget_states.widgets.add(id=disparador, trigger_value=True)
+        self.conexion.send(mensaje.SerializeToString())
+
+        self.errores_rerun = []
+        while True:
+            final = self._recibir_hasta(lambda m: m.WhichOneof('type') == 'script_finished')
+            if final.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                break
+
+        if self.errores_rerun:
+            raise RuntimeError(self.errores_rerun[0])
+        # Los valores de widgets que ya no están se descartan, como en el navegador
+        ids_montados = {id_widget for _, _, id_widget in self.elementos.values()}
+        self.valores = {k: v for k, v in self.valores.items() if k in ids_montados}
+
+    def _recibir_hasta(self, condicion):
+        """Procesa mensajes del servidor hasta el primero que cumpla la condición"""
+        from streamlit.proto.Alert_pb2 import Alert
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        while True:
+            mensaje = ForwardMsg()
+            mensaje.ParseFromString(self.conexion.recv(timeout=TIEMPO_MAXIMO))
+            tipo = mensaje.WhichOneof('type')
+
+            if tipo == 'new_session':
+                # Cada rerun empieza con new_session y vuelve a enviar todos los elementos
+                if mensaje.new_session.initialize.session_id:
+                    self.id_sesion = mensaje.new_session.initialize.session_id
+                self.elementos = {}
+            elif tipo == 'delta' and mensaje.delta.WhichOneof('type') == 'new_element':
+                elemento = mensaje.delta.new_element
+                tipo_elemento = elemento.WhichOneof('type')
+                widget = getattr(elemento, tipo_elemento)
+                ruta = tuple(mensaje.metadata.delta_path)
+                if hasattr(widget, 'id') and hasattr(widget, 'label'):
+                    self.elementos[ruta] = (tipo_elemento, widget.label, widget.id)
+                else:
+                    self.elementos.pop(ruta, None)
+                if tipo_elemento == 'exception':
+                    self.errores_rerun.append(f"{elemento.exception.type}: {elemento.exception.message}")
+                elif tipo_elemento == 'alert' and elemento.alert.format == Alert.ERROR:
+                    self.errores_rerun.append(elemento.alert.body)
+
+            if condicion(mensaje):
+                return mensaje
+
+
+def _multipart(nombre, contenido, tipo):
+    """Cuerpo multipart/form-data con un archivo; devuelve (bytes, frontera)"""
+    frontera = uuid.uuid4().hex
+    cuerpo = (
+        f"--{frontera}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{nombre}"\r\n'
+        f"Content-Type: {tipo}\r\n\r\n"
+    ).encode('utf-8') + contenido + f"\r\n--{frontera}--\r\n".encode('utf-8')
+    return cuerpo, frontera
+
+
+def preparar_entradas(items, imagenes, paginas):
+    """
+    Archivos y texto que suben o pegan los usuarios.
+
+    Returns:
+        dict: {'filas_cotizacion': str, 'fotos': list, 'pdf': tuple} (archivos como (nombre, bytes, tipo))
+    """
+    from utils.recursos_utils import obtener_configuracion
+
+    datos = corpus.datos_cotizacion(items, obtener_configuracion())
+    filas = "\n".join(
+        f"{item['codigo']}\t{item['descripcion']}\t{item['cantidad']}\t{item['precio_unitario']}"
+        for item in datos['items']
+    )
+
+    fotos = []
+    for ruta in corpus.generar_imagenes(imagenes):
+        with open(ruta, 'rb') as f:
+            fotos.append((os.path.basename(ruta), f.read(), "image/jpeg"))
+
+    with open(corpus.generar_pdf(paginas, 'texto'), 'rb') as f:
+        pdf = (f"documento_{paginas}p.pdf", f.read(), "application/pdf")
+
+    return {'filas_cotizacion': filas, 'fotos': fotos, 'pdf': pdf}
+
+
+def memoria_rss(pid):
+    """RSS actual del proceso en bytes, o None si no se puede saber"""
+    if pid is None:
+        return None
+    ruta = f"/proc/{pid}/status"
+    if os.path.exists(ruta):
+        with open(ruta) as f:
+            for linea in f:
+                if linea.startswith('VmRSS:'):
+                    return int(linea.split()[1]) * 1024
+        return None
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss
+    except (ImportError, OSError):
+        return None
+
+
+def percentil(valores, q):
+    """Percentil por rango más cercano"""
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(q * len(ordenados)))]
+
+
+def ejecutar_nivel(url, pid, usuarios, recorridos, entradas, pausa):
+    """
+    Corre un nivel de carga: usuarios simultáneos que repiten el recorrido.
+
+    Args:
+        url: URL base del servidor
+        pid: Proceso del servidor para medir su memoria (None si es remoto)
+        usuarios: Número de usuarios simultáneos
+        recorridos: Recorridos completos por usuario
+        entradas: Dict de preparar_entradas
+        pausa: Segundos de espera antes de cada interacción
+
+    Returns:
+        dict: Latencias, documentos por minuto, memoria y errores del nivel
+    """
+    sesiones = [UsuarioSimulado(url, entradas, pausa) for _ in range(usuarios)]
+    pico = {'rss': memoria_rss(pid) or 0}
+    terminado = threading.Event()
+
+    def monitorear():
+        while not terminado.wait(0.2):
+            pico['rss'] = max(pico['rss'], memoria_rss(pid) or 0)
+
+    def usuario(sesion):
+        for _ in range(recorridos):
+            sesion.recorrido()
+
+    monitor = threading.Thread(target=monitorear, daemon=True)
+    monitor.start()
+    hilos = [threading.Thread(target=usuario, args=(sesion,)) for sesion in sesiones]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+    terminado.set()
+    monitor.join()
+
+    interacciones = [s for sesion in sesiones for s in sesion.interacciones]
+    generaciones = [s for sesion in sesiones for s in sesion.generaciones]
+    errores = [e for sesion in sesiones for e in sesion.errores]
+    return {
+        'usuarios': usuarios,
+        'segundos': duracion,
+        'interacciones': len(interacciones),
+        'p50': percentil(interacciones, 0.50),
+        'p95': percentil(interacciones, 0.95),
+        'p99': percentil(interacciones, 0.99),
+        'documentos': len(generaciones),
+        'generacion_p50': percentil(generaciones, 0.50),
+        'generacion_p95': percentil(generaciones, 0.95),
+        'generacion_p99': percentil(generaciones, 0.99),
+        'documentos_por_minuto': len(generaciones) / duracion * 60,
+        'rss_pico_mb': pico['rss'] / 1024 / 1024 if pico['rss'] else None,
+        'errores': errores
+    }
+
+
+def imprimir(resultado):
+    """Línea de resultados de un nivel"""
+    ms = lambda valor: f"{valor * 1000:>7.0f}" if valor is not None else f"{'-':>7}"
+    print(f"{resultado['usuarios']:>8}{ms(resultado['p50'])}{ms(resultado['p95'])}{ms(resultado['p99'])}"
+          f"{ms(resultado['generacion_p50'])}{ms(resultado['generacion_p95'])}{ms(resultado['generacion_p99'])}"
+          f"{resultado['documentos_por_minuto']:>10.1f}{resultado['rss_pico_mb'] or 0:>9.0f}"
+          f"{len(resultado['errores']):>8}")
+
+
+def preparar_directorio():
+    """Directorio temporal de trabajo con la configuración, membretes y logos del proyecto"""
+    directorio = tempfile.mkdtemp(prefix="documentador_carga_")
+    for carpeta in ("data", "membretes", "logos"):
+        shutil.copytree(os.path.join(RAIZ, carpeta), os.path.join(directorio, carpeta))
+    return directorio
+
+
+def iniciar_servidor(directorio):
+    """
+    Levanta `streamlit run app.py` en un puerto libre con el directorio de trabajo indicado.
+
+    Returns:
+        tuple: (proceso, url)
+    """
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        puerto = s.getsockname()[1]
+
+    # Los clientes no tienen cookie de XSRF; el perfilado cambiaría los tiempos
+    entorno = dict(os.environ, DOCUMENTADOR_PERFIL="0")
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", os.path.join(RAIZ, "app.py"),
+         "--server.headless", "true", "--server.port", str(puerto), "--server.address", "127.0.0.1",
+         "--server.enableXsrfProtection", "false", "--server.fileWatcherType", "none",
+         "--browser.gatherUsageStats", "false"],
+        cwd=directorio, env=entorno, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+    url = f"http://127.0.0.1:{puerto}"
+    limite = time.monotonic() + TIEMPO_ARRANQUE
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"El servidor terminó con código {proceso.returncode}")
+        try:
+            urllib.request.urlopen(f"{url}/_stcore/health", timeout=1).close()
+            return proceso, url
+        except OSError:
+            time.sleep(0.5)
+    proceso.terminate()
+    raise RuntimeError(f"El servidor no respondió en {TIEMPO_ARRANQUE} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba de carga con usuarios simultáneos")
+    parser.add_argument("--usuarios", default="1,2,4,8", help="Niveles de usuarios simultáneos, separados por comas")
+    parser.add_argument("--recorridos", type=int, default=2, help="Recorridos completos por usuario en cada nivel")
+    parser.add_argument("--items", type=int, default=50, help="Partidas de cada cotización")
+    parser.add_argument("--imagenes", type=int, default=2, help="Fotos de cada comprobante")
+    parser.add_argument("--paginas", type=int, default=10, help="Páginas del PDF al que se aplica el membrete")
+    parser.add_argument("--pausa", type=float, default=0, help="Segundos que cada usuario espera entre interacciones")
+    parser.add_argument("--url", help="Usa un servidor ya levantado (sin medir su memoria) en lugar de uno local")
+    parser.add_argument("--json", help="Guarda los resultados en este archivo")
+    argumentos = parser.parse_args()
+
+    ruta_json = os.path.abspath(argumentos.json) if argumentos.json else None
+    sys.path.insert(0, RAIZ)
+    os.chdir(RAIZ)
+    entradas = preparar_entradas(argumentos.items, argumentos.imagenes, argumentos.paginas)
+
+    proceso = directorio = None
+    if argumentos.url:
+        url, pid = argumentos.url, None
+    else:
+        directorio = preparar_directorio()
+        proceso, url = iniciar_servidor(directorio)
+        pid = proceso.pid
+
+    try:
+        calentamiento = UsuarioSimulado(url, entradas, 0)
+        calentamiento.recorrido()
+        for error in calentamiento.errores:
+            print(f"[calentamiento] {error}")
+
+        resultados = []
+        print(f"{'':>8}{'interacción (ms)':^21}{'generación (ms)':^21}")
+        print(f"{'Usuarios':>8}{'p50':>7}{'p95':>7}{'p99':>7}{'p50':>7}{'p95':>7}{'p99':>7}"
+              f"{'docs/min':>10}{'RSS MB':>9}{'errores':>8}")
+        for usuarios in [int(n) for n in argumentos.usuarios.split(',')]:
+            resultado = ejecutar_nivel(url, pid, usuarios, argumentos.recorridos, entradas, argumentos.pausa)
+            resultados.append(resultado)
+            imprimir(resultado)
+    finally:
+        if proceso:
+            proceso.terminate()
+            proceso.wait()
+        if directorio:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    for resultado in resultados:
+        for error in sorted(set(resultado['errores'])):
+            print(f"[{resultado['usuarios']} usuarios] {error}")
+
+    if ruta_json:
+        with open(ruta_json, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
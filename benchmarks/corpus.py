@@ -0,0 +1,217 @@
+"""
+Corpus sintético para los benchmarks de generación de documentos
+
+Genera (una sola vez, en DIRECTORIO_CORPUS) los archivos de entrada:
+- PDFs de texto: páginas de tamaños mezclados (carta, A4, oficio, carta
+  horizontal) con varias líneas de texto cada una
+- PDFs escaneados: cada página es una imagen JPEG de la página completa; se
+  reparten IMAGENES_ESCANEO imágenes distintas entre las páginas para que los
+  PDFs de miles de páginas no ocupen gigabytes
+- Fotos de comprobantes (JPEG de 2000x1500 pixeles, todas distintas)
+y arma los datos de cotizaciones y comprobantes de cualquier tamaño.
+
+Todo se genera con semilla fija: el mismo corpus en cada máquina.
+
+Uso (desde la raíz del proyecto, para generarlo antes de medir):
+    python benchmarks/corpus.py
+"""
+import io
+import os
+import random
+import time
+
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRECTORIO_CORPUS = os.path.join(RAIZ, "benchmarks", "corpus")
+
+PAGINAS_PDF = (1, 10, 100, 1000, 5000)
+ITEMS_COTIZACION = (1, 10, 100, 1000, 10000)
+IMAGENES_COMPROBANTE = (0, 1, 5, 20)
+
+IMAGENES_ESCANEO = 16
+SEMILLA = 2024
+
+# Palabras del texto de relleno
+PALABRAS = (
+    "servicio", "consultoría", "capacitación", "evaluación", "psicológica", "norma", "taller",
+    "sesión", "individual", "grupal", "diagnóstico", "organizacional", "seguimiento", "reporte",
+    "mensual", "curso", "certificación", "horas", "material", "didáctico", "instalaciones",
+    "personal", "riesgo", "psicosocial", "entorno", "laboral", "favorable", "programa"
+)
+
+
+def generar_pdf(paginas, tipo='texto'):
+    """
+    Obtiene un PDF sintético, generándolo si todavía no existe.
+
+    Args:
+        paginas: Número de páginas
+        tipo: 'texto' o 'escaneado'
+
+    Returns:
+        str: Ruta del PDF
+    """
+    ruta = os.path.join(DIRECTORIO_CORPUS, f"pdf_{tipo}_{paginas}.pdf")
+    if os.path.exists(ruta):
+        return ruta
+
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.pagesizes import letter, A4, legal, landscape
+    from reportlab.lib.utils import ImageReader
+
+    os.makedirs(DIRECTORIO_CORPUS, exist_ok=True)
+    tamanos = [letter, A4, legal, landscape(letter)]
+    aleatorio = random.Random(SEMILLA + paginas)
+    escaneos = [ImageReader(io.BytesIO(_imagen_escaneo(i))) for i in range(IMAGENES_ESCANEO)] if tipo == 'escaneado' else []
+
+    ruta_tmp = f"{ruta}.{os.getpid()}.tmp"
+    c = canvas.Canvas(ruta_tmp)
+    for numero in range(paginas):
+        ancho, alto = tamanos[numero % len(tamanos)]
+        c.setPageSize((ancho, alto))
+        if tipo == 'escaneado':
+            c.drawImage(escaneos[numero % len(escaneos)], 0, 0, width=ancho, height=alto)
+        else:
+            c.setFont("Helvetica", 10)
+            y = alto - 180
+            while y > 72:
+                c.drawString(72, y, _frase(aleatorio, 12))
+                y -= 14
+        c.showPage()
+    c.save()
+    os.replace(ruta_tmp, ruta)
+    return ruta
+
+
+def generar_imagenes(cantidad):
+    """
+    Obtiene fotos sintéticas de comprobantes, todas distintas.
+
+    Args:
+        cantidad: Número de imágenes
+
+    Returns:
+        list: Rutas de los JPEG
+    """
+    rutas = []
+    for indice in range(cantidad):
+        ruta = os.path.join(DIRECTORIO_CORPUS, "imagenes", f"foto_{indice}.jpg")
+        if not os.path.exists(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, 'wb') as f:
+                f.write(_imagen_foto(indice))
+        rutas.append(ruta)
+    return rutas
+
+
+def datos_cotizacion(items, config):
+    """
+    Datos de una cotización con el número de partidas indicado.
+
+    Sin 'fecha', para que el render no se sirva desde la caché de PDFs.
+
+    Args:
+        items: Número de partidas
+        config: Configuración del sistema
+
+    Returns:
+        dict: Datos para generar_cotizacion_pdf
+    """
+    aleatorio = random.Random(SEMILLA + items)
+    return {
+        'empresa': config['empresas'][0],
+        'folio': f"BENCH-{items}",
+        'cliente': {
+            'nombre': "Cliente de prueba",
+            'empresa': "Empresa de prueba S.A. de C.V.",
+            'direccion': "Calle 123, Colonia Centro",
+            'telefono': "8440000000",
+            'email': "cliente@ejemplo.com"
+        },
+        'items': [{
+            'codigo': f"P{indice:05d}",
+            'descripcion': _frase(aleatorio, aleatorio.randint(3, 20)),
+            'cantidad': aleatorio.randint(1, 50),
+            'precio_unitario': round(aleatorio.uniform(10, 5000), 2)
+        } for indice in range(items)],
+        'descuento': {'aplicar': True, 'tipo': 'Porcentaje', 'valor': 5}
+    }
+
+
+def datos_comprobante(imagenes, config):
+    """
+    Datos de un comprobante con el número de fotos indicado.
+
+    Sin 'fecha', para que el render no se sirva desde la caché de PDFs.
+
+    Args:
+        imagenes: Número de fotos de comprobante
+        config: Configuración del sistema
+
+    Returns:
+        dict: Datos para generar_comprobante_pdf
+    """
+    return {
+        'empresa': config['empresas'][-1],
+        'folio': f"BENCH-{imagenes}",
+        'cliente': {'nombre': "Cliente de prueba", 'telefono': "8440000000"},
+        'conceptos': [{'descripcion': f"Concepto {indice + 1}", 'monto': 1500.0} for indice in range(3)],
+        'comprobante_imagenes': generar_imagenes(imagenes)
+    }
+
+
+def generar_corpus():
+    """Genera todos los archivos del corpus"""
+    for tipo in ('texto', 'escaneado'):
+        for paginas in PAGINAS_PDF:
+            inicio = time.perf_counter()
+            ruta = generar_pdf(paginas, tipo)
+            segundos = time.perf_counter() - inicio
+            print(f"{ruta}: {os.path.getsize(ruta) / 1024 / 1024:.1f} MB ({segundos:.1f} s)")
+    generar_imagenes(max(IMAGENES_COMPROBANTE))
+    print(f"{max(IMAGENES_COMPROBANTE)} imágenes en {os.path.join(DIRECTORIO_CORPUS, 'imagenes')}")
+
+
+def _frase(aleatorio, palabras):
+    """Texto de relleno"""
+    return " ".join(aleatorio.choice(PALABRAS) for _ in range(palabras))
+
+
+def _imagen_escaneo(indice):
+    """JPEG en escala de grises de una página escaneada a 150 dpi"""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    aleatorio = random.Random(SEMILLA + indice)
+    imagen = Image.new('L', (1275, 1650), 245)
+    dibujo = ImageDraw.Draw(imagen)
+    y = 200
+    while y < 1500:
+        # Renglones de "texto" de largo variable
+        dibujo.rectangle([150, y, 150 + aleatorio.randint(400, 975), y + 14], fill=aleatorio.randint(30, 90))
+        y += aleatorio.choice((28, 28, 28, 56))
+    imagen = imagen.filter(ImageFilter.GaussianBlur(1))
+    ruido = Image.effect_noise(imagen.size, 12)
+    imagen = Image.blend(imagen, ruido, 0.08)
+    buffer = io.BytesIO()
+    imagen.save(buffer, format='JPEG', quality=75)
+    return buffer.getvalue()
+
+
+def _imagen_foto(indice):
+    """JPEG a color del tamaño de una foto de celular reducida"""
+    from PIL import Image
+
+    aleatorio = random.Random(SEMILLA + 1000 + indice)
+    base = Image.linear_gradient('L').resize((2000, 1500))
+    imagen = Image.merge('RGB', (
+        base,
+        Image.effect_noise((2000, 1500), 40),
+        Image.new('L', (2000, 1500), aleatorio.randint(0, 255))
+    ))
+    buffer = io.BytesIO()
+    imagen.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+if __name__ == "__main__":
+    generar_corpus()
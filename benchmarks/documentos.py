@@ -0,0 +1,260 @@
+"""
+Benchmark de generación de documentos con un corpus sintético
+
+Mide aplicar_membrete_pdf (PDFs de texto y escaneados de 1 a 5000 páginas),
+crear_overlay_membrete (cada membrete de membretes/), generar_cotizacion_pdf
+(1 a 10000 partidas) y generar_comprobante_pdf (0 a 20 fotos). Cada caso corre en
+un proceso nuevo y reporta:
+- Tiempo de la primera llamada (cachés de membretes, logos y plantillas vacías)
+  y mediana de las siguientes
+- Rendimiento: páginas, partidas o documentos por segundo (con la mediana)
+- Memoria RSS pico del proceso y tamaño del PDF generado
+
+Los resultados se pueden guardar como línea base y comparar con ella; con
+regresiones mayores a la tolerancia el script termina con código 1.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/documentos.py --rapido
+    python benchmarks/documentos.py --guardar-base benchmarks/base.json
+    python benchmarks/documentos.py --base benchmarks/base.json --tolerancia 0.15
+    python benchmarks/documentos.py --solo cotizacion
+
+El corpus se genera la primera vez en benchmarks/corpus/ (ver corpus.py); los
+PDFs de 5000 páginas tardan varios minutos.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+import corpus
+
+
+RAIZ = corpus.RAIZ
+
+# Casos rápidos (--rapido): los más chicos de cada operación
+LIMITE_RAPIDO = {'membrete': 100, 'cotizacion': 100, 'comprobante': 5}
+
+# Código que corre en cada proceso de medición
+MEDICION = """
+import io, json, os, sys, time
+sys.path.insert(0, "benchmarks")
+import corpus
+from utils.recursos_utils import obtener_configuracion
+
+caso = {caso!r}
+repeticiones = {repeticiones!r}
+tiempo_maximo = {tiempo_maximo!r}
+config = obtener_configuracion()
+
+if caso['operacion'] == 'membrete':
+    from utils.pdf_utils import aplicar_membrete_pdf
+    with open(caso['pdf'], 'rb') as f:
+        contenido = f.read()
+    ejecutar = lambda: aplicar_membrete_pdf(io.BytesIO(contenido), caso['membrete'])
+elif caso['operacion'] == 'overlay':
+    from utils.pdf_utils import crear_overlay_membrete
+    ejecutar = lambda: crear_overlay_membrete(caso['membrete']).getvalue()
+elif caso['operacion'] == 'cotizacion':
+    from utils.cotizacion_utils import generar_cotizacion_pdf
+    datos = corpus.datos_cotizacion(caso['cantidad'], config)
+    ejecutar = lambda: generar_cotizacion_pdf(datos, config)
+else:
+    from utils.comprobante_utils import generar_comprobante_pdf
+    datos = corpus.datos_comprobante(caso['cantidad'], config)
+    ejecutar = lambda: generar_comprobante_pdf(datos, config)
+
+tiempos = []
+inicio_total = time.perf_counter()
+while len(tiempos) < repeticiones:
+    inicio = time.perf_counter()
+    salida = ejecutar()
+    tiempos.append(time.perf_counter() - inicio)
+    if time.perf_counter() - inicio_total > tiempo_maximo:
+        break
+
+# Pico de memoria de este proceso: en Linux ru_maxrss arrastra el del proceso
+# padre, así que se usa VmHWM; en macOS ru_maxrss (bytes); en Windows psutil
+rss = None
+if os.path.exists('/proc/self/status'):
+    with open('/proc/self/status') as f:
+        for linea in f:
+            if linea.startswith('VmHWM:'):
+                rss = int(linea.split()[1]) * 1024
+elif sys.platform == 'darwin':
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+else:
+    try:
+        import psutil
+        rss = psutil.Process().memory_info().peak_wset
+    except (ImportError, AttributeError):
+        pass
+
+print(json.dumps({{'tiempos': tiempos, 'rss': rss, 'bytes_salida': len(salida)}}))
+"""
+
+
+def casos(rapido=False, solo=None):
+    """
+    Lista de casos del benchmark.
+
+    Args:
+        rapido: Solo los casos chicos de cada operación
+        solo: Limita a una operación ('membrete', 'overlay', 'cotizacion', 'comprobante')
+
+    Returns:
+        list: Dicts con 'nombre', 'operacion', 'unidades' y los datos de entrada
+    """
+    membretes = sorted(
+        os.path.join("membretes", nombre)
+        for nombre in os.listdir(os.path.join(RAIZ, "membretes"))
+        if nombre.lower().endswith('.png')
+    )
+    # Se filtra antes de armar cada caso: las entradas del corpus se generan solo
+    # para las operaciones que se van a medir (los PDFs grandes tardan minutos)
+    operaciones = [solo] if solo else ['membrete', 'overlay', 'cotizacion', 'comprobante']
+    lista = []
+    for tipo in ('texto', 'escaneado'):
+        for paginas in corpus.PAGINAS_PDF:
+            if 'membrete' in operaciones and (not rapido or paginas <= LIMITE_RAPIDO['membrete']):
+                lista.append({
+                    'nombre': f"membrete/{tipo}/{paginas}p",
+                    'operacion': 'membrete',
+                    'unidades': paginas,
+                    'pdf': corpus.generar_pdf(paginas, tipo),
+                    'membrete': membretes[0]
+                })
+    for membrete in membretes if 'overlay' in operaciones else []:
+        lista.append({
+            'nombre': f"overlay/{os.path.basename(membrete)}",
+            'operacion': 'overlay',
+            'unidades': 1,
+            'membrete': membrete
+        })
+    for items in corpus.ITEMS_COTIZACION:
+        if 'cotizacion' in operaciones and (not rapido or items <= LIMITE_RAPIDO['cotizacion']):
+            lista.append({
+                'nombre': f"cotizacion/{items}items",
+                'operacion': 'cotizacion',
+                'unidades': items,
+                'cantidad': items
+            })
+    for imagenes in corpus.IMAGENES_COMPROBANTE:
+        if 'comprobante' in operaciones and (not rapido or imagenes <= LIMITE_RAPIDO['comprobante']):
+            corpus.generar_imagenes(imagenes)
+            lista.append({
+                'nombre': f"comprobante/{imagenes}img",
+                'operacion': 'comprobante',
+                'unidades': 1,
+                'cantidad': imagenes
+            })
+
+    return lista
+
+
+def medir(caso, repeticiones, tiempo_maximo):
+    """
+    Mide un caso en un proceso nuevo.
+
+    Args:
+        caso: Dict devuelto por casos()
+        repeticiones: Llamadas a la función (la primera incluye las cachés vacías)
+        tiempo_maximo: Segundos después de los cuales no se repite más
+
+    Returns:
+        dict: {'primera', 'mediana', 'rendimiento', 'rss_mb', 'bytes_salida'}
+    """
+    codigo = MEDICION.format(caso=caso, repeticiones=repeticiones, tiempo_maximo=tiempo_maximo)
+    # El perfilado cambiaría los tiempos aunque esté activo en el entorno
+    entorno = dict(os.environ, DOCUMENTADOR_PERFIL="0")
+    resultado = subprocess.run(
+        [sys.executable, "-c", codigo],
+        cwd=RAIZ, env=entorno, capture_output=True, text=True
+    )
+    if resultado.returncode != 0:
+        raise RuntimeError(f"{caso['nombre']}: {resultado.stderr.strip().splitlines()[-1]}")
+
+    medida = json.loads(resultado.stdout.strip().splitlines()[-1])
+    tiempos = medida['tiempos']
+    siguientes = sorted(tiempos[1:]) or tiempos
+    mediana = siguientes[len(siguientes) // 2]
+    return {
+        'primera': tiempos[0],
+        'mediana': mediana,
+        'rendimiento': caso['unidades'] / mediana if mediana else None,
+        'rss_mb': medida['rss'] / 1024 / 1024 if medida['rss'] else None,
+        'bytes_salida': medida['bytes_salida']
+    }
+
+
+def comparar(resultados, base, tolerancia):
+    """
+    Compara los resultados con una línea base.
+
+    Args:
+        resultados: Dict {nombre: medida} de esta ejecución
+        base: Dict {nombre: medida} guardado con --guardar-base
+        tolerancia: Fracción de aumento de tiempo o memoria que se acepta (0.1 = 10 %)
+
+    Returns:
+        list: Nombres de los casos con regresión
+    """
+    regresiones = []
+    print(f"\n{'Caso':<28}{'tiempo':>10}{'base':>10}{'cambio':>9}{'RSS':>9}{'base':>9}")
+    for nombre, medida in resultados.items():
+        anterior = base.get(nombre)
+        if not anterior:
+            print(f"{nombre:<28}{medida['mediana']:>9.3f}s{'-':>10}")
+            continue
+
+        cambio_tiempo = medida['mediana'] / anterior['mediana'] - 1
+        cambio_rss = (medida['rss_mb'] / anterior['rss_mb'] - 1) if medida['rss_mb'] and anterior['rss_mb'] else 0
+        regresion = cambio_tiempo > tolerancia or cambio_rss > tolerancia
+        if regresion:
+            regresiones.append(nombre)
+        print(f"{nombre:<28}{medida['mediana']:>9.3f}s{anterior['mediana']:>9.3f}s{cambio_tiempo:>+9.0%}"
+              f"{medida['rss_mb'] or 0:>7.0f}MB{anterior['rss_mb'] or 0:>7.0f}MB"
+              f"{'  REGRESIÓN' if regresion else ''}")
+    return regresiones
+
+
+def imprimir(nombre, medida):
+    """Línea de resultados de un caso"""
+    unidad = {'membrete': 'pág/s', 'cotizacion': 'part/s'}.get(nombre.split('/')[0], 'doc/s')
+    print(f"{nombre:<28}{medida['primera']:>9.3f}s{medida['mediana']:>9.3f}s"
+          f"{medida['rendimiento']:>11.1f} {unidad:<7}{medida['rss_mb'] or 0:>7.0f}MB"
+          f"{medida['bytes_salida'] / 1024:>10.0f}KB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mide la generación de documentos con un corpus sintético")
+    parser.add_argument("--rapido", action="store_true", help="Solo los casos chicos (hasta 100 páginas o partidas)")
+    parser.add_argument("--solo", choices=['membrete', 'overlay', 'cotizacion', 'comprobante'],
+                        help="Mide solo una operación")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Llamadas por caso (se usa la mediana)")
+    parser.add_argument("--tiempo-maximo", type=float, default=60, help="Segundos por caso antes de dejar de repetir")
+    parser.add_argument("--base", help="Compara con esta línea base")
+    parser.add_argument("--tolerancia", type=float, default=0.1, help="Aumento aceptado contra la base (0.1 = 10 %%)")
+    parser.add_argument("--guardar-base", help="Guarda los resultados como línea base en este archivo")
+    argumentos = parser.parse_args()
+
+    resultados = {}
+    print(f"{'Caso':<28}{'primera':>10}{'mediana':>10}{'rendimiento':>19}{'RSS':>9}{'salida':>12}")
+    for caso in casos(argumentos.rapido, argumentos.solo):
+        resultados[caso['nombre']] = medida = medir(caso, argumentos.repeticiones, argumentos.tiempo_maximo)
+        imprimir(caso['nombre'], medida)
+
+    if argumentos.guardar_base:
+        with open(argumentos.guardar_base, 'w', encoding='utf-8') as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+        print(f"\nLínea base guardada en {argumentos.guardar_base}")
+
+    if argumentos.base:
+        with open(argumentos.base, 'r', encoding='utf-8') as f:
+            base = json.load(f)
+        regresiones = comparar(resultados, base, argumentos.tolerancia)
+        if regresiones:
+            print(f"\n{len(regresiones)} casos más lentos o con más memoria que la base (tolerancia {argumentos.tolerancia:.0%})")
+            sys.exit(1)
@@ -0,0 +1,178 @@
+"""
+Benchmark del envío por correo contra un servidor SMTP local
+
+Levanta un servidor SMTP de prueba en un puerto libre (sin dependencias: acepta
+los mensajes y los descarta) y envía N documentos con enviar_documentos. Reporta
+mensajes por minuto, conexiones abiertas (con conexiones persistentes debe ser
+una por hilo, más las reconexiones) y reintentos. El servidor puede simular la
+latencia de un servidor remoto, errores temporales y cierres de sesión para
+comprobar los reintentos y las reconexiones.
+
+El archivo y la bitácora de envíos se escriben en un directorio temporal, no en
+el archivo real.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/envio.py --mensajes 500 --conexiones 1,4
+    python benchmarks/envio.py --mensajes 300 --latencia 20 --fallar-cada 25 --cerrar-cada 100
+    python benchmarks/envio.py --mensajes 200 --por-minuto 600
+"""
+import argparse
+import os
+import shutil
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+
+import corpus
+
+
+RAIZ = corpus.RAIZ
+
+
+class ServidorSMTPLocal(socketserver.ThreadingTCPServer):
+    """
+    Servidor SMTP mínimo (EHLO, MAIL, RCPT, DATA, RSET, NOOP, QUIT) que cuenta conexiones y mensajes.
+
+    Args:
+        latencia: Segundos de espera antes de cada respuesta
+        fallar_cada: Responde 451 (error temporal) a uno de cada N mensajes
+        cerrar_cada: Cierra la sesión con 421 después de N mensajes en la misma conexión
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latencia=0, fallar_cada=0, cerrar_cada=0):
+        super().__init__(("127.0.0.1", 0), _SesionSMTP)
+        self.latencia = latencia
+        self.fallar_cada = fallar_cada
+        self.cerrar_cada = cerrar_cada
+        self.conexiones = 0
+        self.mensajes = 0
+        self.rechazados = 0
+        self.lock = threading.Lock()
+
+    @property
+    def puerto(self):
+        return self.server_address[1]
+
+
+class _SesionSMTP(socketserver.StreamRequestHandler):
+    """Una conexión con el servidor de prueba"""
+
+    def responder(self, linea):
+        if self.server.latencia:
+            time.sleep(self.server.latencia)
+        self.wfile.write(f"{linea}\r\n".encode('ascii'))
+
+    def handle(self):
+        servidor = self.server
+        with servidor.lock:
+            servidor.conexiones += 1
+        mensajes_sesion = 0
+        self.responder("220 localhost SMTP de prueba")
+
+        for linea in self.rfile:
+            comando = linea.decode('utf-8', 'replace').strip().upper()
+            if comando.startswith(("EHLO", "HELO")):
+                self.responder("250-localhost\r\n250-8BITMIME\r\n250 SIZE 52428800")
+            elif comando.startswith(("MAIL", "RCPT", "RSET", "NOOP")):
+                self.responder("250 OK")
+            elif comando == "DATA":
+                self.responder("354 Fin con <CRLF>.<CRLF>")
+                for contenido in self.rfile:
+                    if contenido == b".\r\n":
+                        break
+                with servidor.lock:
+                    servidor.mensajes += 1
+                    fallar = servidor.fallar_cada and servidor.mensajes % servidor.fallar_cada == 0
+                    if fallar:
+                        servidor.rechazados += 1
+                mensajes_sesion += 1
+                if fallar:
+                    self.responder("451 Intente mas tarde")
+                elif servidor.cerrar_cada and mensajes_sesion >= servidor.cerrar_cada:
+                    self.responder("421 Demasiados mensajes en esta sesion")
+                    return
+                else:
+                    self.responder("250 OK")
+            elif comando == "QUIT":
+                self.responder("221 Adios")
+                return
+            else:
+                self.responder("502 Comando no implementado")
+
+
+def documentos_sinteticos(cantidad, ruta_pdf):
+    """Documentos como los de buscar_documentos, todos con el mismo PDF"""
+    return [{
+        'id': numero,
+        'tipo': 'cotizacion' if numero % 2 else 'comprobante',
+        'folio': f"COT-PRUEBA-{numero:06d}",
+        'fecha': '2025-01-15T10:00:00',
+        'empresa': 'Empresa de prueba',
+        'cliente_nombre': f"Cliente {numero}",
+        'cliente_email': f"cliente{numero}@ejemplo.com",
+        'pdf_ruta': ruta_pdf
+    } for numero in range(1, cantidad + 1)]
+
+
+def ejecutar(mensajes, conexiones, por_minuto, latencia, fallar_cada, cerrar_cada):
+    """Envía los mensajes a un servidor de prueba nuevo; devuelve el resultado"""
+    from utils.envio_utils import enviar_documentos
+
+    servidor = ServidorSMTPLocal(latencia, fallar_cada, cerrar_cada)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    config = {'smtp': {'servidor': '127.0.0.1', 'puerto': servidor.puerto, 'seguridad': 'ninguna',
+                       'remitente': 'Pruebas <pruebas@ejemplo.com>'}}
+    try:
+        resultado = enviar_documentos(documentos_sinteticos(mensajes, RUTA_PDF), config,
+                                      conexiones=conexiones, por_minuto=por_minuto, reenviar=True)
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+    return {
+        'conexiones': conexiones,
+        'enviados': resultado['enviados'],
+        'errores': resultado['errores'],
+        'segundos': resultado['segundos'],
+        'por_minuto': resultado['enviados'] / resultado['segundos'] * 60,
+        'conexiones_abiertas': servidor.conexiones,
+        'reintentos': sum(fila['intentos'] - 1 for fila in resultado['filas'] if fila['intentos'] > 1)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark del envío por correo con un servidor SMTP local")
+    parser.add_argument("--mensajes", type=int, default=500, help="Documentos a enviar en cada nivel")
+    parser.add_argument("--conexiones", default="1,4", help="Niveles de conexiones simultáneas, separados por comas")
+    parser.add_argument("--por-minuto", type=int, default=0, help="Límite de mensajes por minuto (0 sin límite)")
+    parser.add_argument("--paginas", type=int, default=1, help="Páginas del PDF adjunto")
+    parser.add_argument("--latencia", type=float, default=0, help="Milisegundos antes de cada respuesta del servidor")
+    parser.add_argument("--fallar-cada", type=int, default=0, help="Responde 451 a uno de cada N mensajes")
+    parser.add_argument("--cerrar-cada", type=int, default=0, help="Cierra cada sesión después de N mensajes")
+    argumentos = parser.parse_args()
+
+    sys.path.insert(0, RAIZ)
+    RUTA_PDF = corpus.generar_pdf(argumentos.paginas)
+
+    # El archivo y la bitácora de envíos van a un directorio temporal
+    directorio = tempfile.mkdtemp(prefix="documentador_envio_")
+    os.chdir(directorio)
+
+    import utils.envio_utils
+    # Los reintentos del benchmark no esperan segundos como con un servidor real
+    utils.envio_utils.ESPERA_REINTENTO = 0.01
+
+    try:
+        print(f"{'Conexiones':>10}{'enviados':>10}{'errores':>9}{'segundos':>10}{'msj/min':>10}"
+              f"{'abiertas':>10}{'reintentos':>12}")
+        for nivel in [int(n) for n in argumentos.conexiones.split(',')]:
+            fila = ejecutar(argumentos.mensajes, nivel, argumentos.por_minuto, argumentos.latencia / 1000,
+                            argumentos.fallar_cada, argumentos.cerrar_cada)
+            print(f"{fila['conexiones']:>10}{fila['enviados']:>10}{fila['errores']:>9}{fila['segundos']:>10.2f}"
+                  f"{fila['por_minuto']:>10.0f}{fila['conexiones_abiertas']:>10}{fila['reintentos']:>12}")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
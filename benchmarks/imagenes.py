@@ -0,0 +1,99 @@
+"""
+Comprobación de la caché de imágenes codificadas de plantilla_utils
+
+La caché reutiliza entre documentos los XObject de imágenes que ReportLab ya
+codificó, y para eso usa partes internas de ReportLab. Este script genera
+cotizaciones y comprobantes (con membrete, logo en cada página, fotos JPEG y un
+PNG con transparencia) sin la caché y con ella, con la caché vacía y ya llena,
+y comprueba que los PDF son idénticos byte por byte. Termina con código 1 si
+alguno difiere.
+
+Correrlo al cambiar de versión de ReportLab antes de ampliar
+VERSIONES_REPORTLAB en plantilla_utils.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/imagenes.py
+"""
+import os
+import sys
+import tempfile
+from datetime import datetime
+
+import corpus
+
+
+RAIZ = corpus.RAIZ
+
+# Fecha fija: con ella el render es determinista y los PDF se pueden comparar
+FECHA = datetime(2025, 1, 15, 10, 30)
+
+
+def imagen_transparente(ruta):
+    """PNG con canal alfa (la máscara se codifica como un XObject aparte)"""
+    from PIL import Image, ImageDraw
+
+    imagen = Image.new('RGBA', (800, 600), (0, 0, 0, 0))
+    dibujo = ImageDraw.Draw(imagen)
+    dibujo.ellipse((100, 100, 700, 500), fill=(30, 90, 160, 200))
+    dibujo.rectangle((300, 250, 500, 350), fill=(200, 40, 40, 255))
+    imagen.save(ruta)
+    return ruta
+
+
+def documentos(config, membrete, transparente):
+    """Casos a comparar: (nombre, función que genera el PDF)"""
+    from utils.cotizacion_utils import _construir_cotizacion_pdf
+    from utils.comprobante_utils import _construir_comprobante_pdf
+
+    def cotizacion(items, con_membrete):
+        datos = dict(corpus.datos_cotizacion(items, config), fecha=FECHA)
+        if con_membrete:
+            datos['membrete'] = membrete
+        return lambda: _construir_cotizacion_pdf(datos, config)
+
+    def comprobante(imagenes, extra=()):
+        datos = dict(corpus.datos_comprobante(imagenes, config), fecha=FECHA, membrete=membrete)
+        datos['comprobante_imagenes'] = datos['comprobante_imagenes'] + list(extra)
+        return lambda: _construir_comprobante_pdf(datos, config)
+
+    return [
+        ("cotizacion/1 partida", cotizacion(1, False)),
+        ("cotizacion/200 partidas con membrete", cotizacion(200, True)),
+        ("comprobante/2 fotos", comprobante(2)),
+        ("comprobante/PNG transparente", comprobante(1, [transparente])),
+    ]
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, RAIZ)
+    os.chdir(RAIZ)
+
+    import reportlab
+    from utils import plantilla_utils
+    from utils.recursos_utils import obtener_configuracion, listar_membretes
+
+    if not plantilla_utils.CACHE_IMAGENES:
+        print(f"ReportLab {reportlab.Version} está fuera de VERSIONES_REPORTLAB: se compara de todos modos")
+
+    config_prueba = obtener_configuracion()
+    with tempfile.TemporaryDirectory() as directorio:
+        casos = documentos(config_prueba, listar_membretes()[0],
+                           imagen_transparente(os.path.join(directorio, "transparente.png")))
+
+        plantilla_utils.CACHE_IMAGENES = False
+        referencias = [generar() for _, generar in casos]
+
+        plantilla_utils.CACHE_IMAGENES = True
+        plantilla_utils.limpiar_imagenes_codificadas()
+        # Dos vueltas: la primera llena la caché y la segunda toma todo de ella
+        diferencias = 0
+        for vuelta in ("caché vacía", "caché llena"):
+            for (nombre, generar), referencia in zip(casos, referencias):
+                pdf = generar()
+                igual = pdf == referencia
+                diferencias += not igual
+                print(f"{'ok' if igual else 'DIFERENTE':>10}  {nombre} ({vuelta}, {len(pdf) / 1024:.0f} KB)")
+
+    print(f"ReportLab {reportlab.Version}: "
+          + ("PDF idénticos con y sin la caché" if not diferencias else f"{diferencias} PDF diferentes"))
+    sys.exit(1 if diferencias else 0)
@@ -0,0 +1,70 @@
+"""
+Comprobación del escape de los datos en los párrafos de las plantillas
+
+Los valores enlazados en los párrafos (cliente, conceptos, datos de la empresa)
+llegan de la aplicación, de los lotes de pagos y de api.py. Este script genera
+cotizaciones y comprobantes con '<', '>' y '&' en el nombre del cliente, la
+descripción de las partidas y los conceptos, y comprueba que el PDF se genera y
+que el texto extraído los contiene completos. Termina con código 1 si alguno falla.
+
+Uso (desde la raíz del proyecto):
+    python benchmarks/marcado.py
+"""
+import io
+import os
+import sys
+
+import corpus
+
+
+RAIZ = corpus.RAIZ
+
+TEXTOS = ["A<B", "Luis & Co <b", "Distribuidora <Norte>", "Soporte <24h>", "Renta &amp; luz"]
+
+
+def texto_pdf(pdf_bytes):
+    """Texto de todas las páginas de un PDF, sin saltos de línea"""
+    from PyPDF2 import PdfReader
+
+    return " ".join(pagina.extract_text() for pagina in PdfReader(io.BytesIO(pdf_bytes)).pages).replace("\n", " ")
+
+
+def casos(config):
+    """(nombre, texto esperado, función que genera el PDF) por cada texto y documento"""
+    from utils.cotizacion_utils import _construir_cotizacion_pdf
+    from utils.comprobante_utils import _construir_comprobante_pdf
+
+    lista = []
+    for texto in TEXTOS:
+        cotizacion = corpus.datos_cotizacion(1, config)
+        cotizacion['cliente'] = dict(cotizacion['cliente'], nombre=texto, empresa=texto)
+        cotizacion['items'][0]['descripcion'] = texto
+
+        comprobante = corpus.datos_comprobante(0, config)
+        comprobante['cliente'] = dict(comprobante['cliente'], nombre=texto)
+        comprobante['conceptos'][0]['descripcion'] = texto
+
+        lista.append((f"cotizacion {texto!r}", texto, lambda d=cotizacion: _construir_cotizacion_pdf(d, config)))
+        lista.append((f"comprobante {texto!r}", texto, lambda d=comprobante: _construir_comprobante_pdf(d, config)))
+    return lista
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, RAIZ)
+    os.chdir(RAIZ)
+
+    from utils.recursos_utils import obtener_configuracion
+
+    fallas = 0
+    for nombre, esperado, generar in casos(obtener_configuracion()):
+        try:
+            extraido = texto_pdf(generar())
+            # Nombre del cliente y concepto: el texto aparece al menos dos veces
+            resultado = "ok" if extraido.count(esperado) >= 2 else "INCOMPLETO"
+        except Exception as e:
+            resultado = f"ERROR {type(e).__name__}: {e}"
+        fallas += resultado != "ok"
+        print(f"{resultado[:60]:>12}  {nombre}")
+
+    print("Todos los textos completos" if not fallas else f"{fallas} casos con error")
+    sys.exit(1 if fallas else 0)
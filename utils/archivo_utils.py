@@ -0,0 +1,438 @@
+"""
+Utilidades para el archivo local de documentos generados (SQLite)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from utils.cache_utils import obtener_fecha_documento
+from utils.recursos_utils import obtener_configuracion
+
+
+DIRECTORIO_ARCHIVO = "archivo"
+RUTA_BASE_DATOS = os.path.join(DIRECTORIO_ARCHIVO, "documentos.db")
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS documentos (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    tipo TEXT NOT NULL,
+    folio TEXT NOT NULL,
+    fecha TEXT NOT NULL,
+    empresa TEXT NOT NULL,
+    cliente_nombre TEXT NOT NULL DEFAULT '',
+    cliente_telefono TEXT NOT NULL DEFAULT '',
+    cliente_email TEXT NOT NULL DEFAULT '',
+    cliente_empresa TEXT NOT NULL DEFAULT '',
+    subtotal REAL,
+    total REAL NOT NULL,
+    moneda TEXT NOT NULL,
+    datos_json TEXT NOT NULL,
+    pdf_sha256 TEXT NOT NULL,
+    pdf_ruta TEXT NOT NULL,
+    pdf_tamano INTEGER NOT NULL,
+    creado TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documentos_folio ON documentos(folio COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_documentos_cliente ON documentos(cliente_nombre COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_documentos_telefono ON documentos(cliente_telefono COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS idx_documentos_empresa_fecha ON documentos(empresa, fecha);
+CREATE INDEX IF NOT EXISTS idx_documentos_fecha ON documentos(fecha);
+CREATE VIRTUAL TABLE IF NOT EXISTS documentos_fts USING fts5(
+    folio, cliente, empresa, contenido,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS envios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    documento_id INTEGER NOT NULL,
+    destinatario TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    intentos INTEGER NOT NULL,
+    error TEXT NOT NULL DEFAULT '',
+    segundos REAL NOT NULL,
+    creado TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_envios_documento ON envios(documento_id, destinatario);
+"""
+
+# Columnas que se devuelven en las búsquedas (sin los datos de entrada)
+COLUMNAS_RESUMEN = ", ".join(f"documentos.{columna}" for columna in (
+    "id", "tipo", "folio", "fecha", "empresa", "cliente_nombre", "cliente_telefono", "cliente_email",
+    "cliente_empresa", "subtotal", "total", "moneda", "pdf_sha256", "pdf_ruta", "pdf_tamano", "creado"
+))
+
+_local = threading.local()
+
+
+def archivar_documento(tipo, datos, pdf_bytes, config):
+    """
+    Guarda un documento generado en el archivo local.
+
+    El PDF y los adjuntos se guardan como archivos con nombre igual a su hash
+    (un mismo PDF se guarda una sola vez) y los datos de entrada, totales y
+    metadatos en la base de datos. Si el mismo PDF ya está archivado con ese folio
+    no se duplica el registro.
+
+    Args:
+        tipo: 'cotizacion' o 'comprobante'
+        datos: Dict con los datos usados para generar el documento
+        pdf_bytes: PDF generado
+        config: Configuración del sistema
+
+    Returns:
+        int: ID del documento en el archivo
+    """
+    from utils.cotizacion_utils import calcular_totales_cotizacion
+    from utils.comprobante_utils import calcular_total_comprobante
+
+    if tipo == 'cotizacion':
+        totales = calcular_totales_cotizacion(datos, config)
+        subtotal, total = totales['subtotal'], totales['total']
+    else:
+        subtotal, total = None, calcular_total_comprobante(datos)
+
+    fecha, _ = obtener_fecha_documento(datos)
+    cliente = datos.get('cliente', {})
+    pdf_sha256, pdf_ruta = guardar_archivo_contenido(pdf_bytes, '.pdf')
+
+    conexion = obtener_conexion()
+
+    # Regenerar un documento sin cambios (acierto de caché) no crea otro registro
+    existente = conexion.execute(
+        "SELECT id FROM documentos WHERE folio = ? COLLATE NOCASE AND tipo = ? AND pdf_sha256 = ?",
+        (datos['folio'], tipo, pdf_sha256)
+    ).fetchone()
+    if existente:
+        return existente['id']
+
+    with conexion:
+        cursor = conexion.execute(
+            """INSERT INTO documentos (tipo, folio, fecha, empresa, cliente_nombre, cliente_telefono,
+                   cliente_email, cliente_empresa, subtotal, total, moneda, datos_json,
+                   pdf_sha256, pdf_ruta, pdf_tamano, creado)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            (
+                tipo,
+                datos['folio'],
+                fecha.isoformat(timespec='seconds'),
+                datos['empresa']['nombre'],
+                cliente.get('nombre', ''),
+                cliente.get('telefono', ''),
+                cliente.get('email', ''),
+                cliente.get('empresa', ''),
+                subtotal,
+                total,
+                config['configuracion']['moneda'],
+                json.dumps(_serializar_datos(datos), ensure_ascii=False),
+                pdf_sha256,
+                pdf_ruta,
+                len(pdf_bytes),
+                datetime.now().isoformat(timespec='seconds')
+            )
+        )
+        _indexar_texto(conexion, cursor.lastrowid, tipo, datos, config)
+    return cursor.lastrowid
+
+
+def buscar_documentos(folio=None, cliente=None, telefono=None, empresa=None, tipo=None,
+                      desde=None, hasta=None, texto=None, limite=100):
+    """
+    Busca documentos en el archivo. Todos los filtros son opcionales.
+
+    Args:
+        folio: Folio exacto o prefijo
+        cliente: Prefijo del nombre del cliente (sin distinguir mayúsculas)
+        telefono: Prefijo del teléfono del cliente
+        empresa: Nombre exacto de la empresa emisora
+        tipo: 'cotizacion' o 'comprobante'
+        desde: date/datetime inicial (incluida)
+        hasta: date/datetime final (incluida)
+        texto: Palabras a buscar en el contenido (descripciones, conceptos, datos del
+            cliente, montos). Cada palabra se busca como prefijo y sin acentos
+        limite: Número máximo de resultados
+
+    Returns:
+        list: Lista de dicts con el resumen de cada documento, más recientes primero
+    """
+    condiciones = []
+    parametros = []
+
+    # Los filtros por prefijo usan LIKE 'x%' para aprovechar los índices NOCASE
+    if folio:
+        condiciones.append("documentos.folio LIKE ? ESCAPE '\\'")
+        parametros.append(_prefijo_like(folio))
+    if cliente:
+        condiciones.append("documentos.cliente_nombre LIKE ? ESCAPE '\\'")
+        parametros.append(_prefijo_like(cliente))
+    if telefono:
+        condiciones.append("documentos.cliente_telefono LIKE ? ESCAPE '\\'")
+        parametros.append(_prefijo_like(telefono))
+    if empresa:
+        condiciones.append("documentos.empresa = ?")
+        parametros.append(empresa)
+    if tipo:
+        condiciones.append("documentos.tipo = ?")
+        parametros.append(tipo)
+    if desde:
+        condiciones.append("documentos.fecha >= ?")
+        parametros.append(desde.isoformat())
+    if hasta:
+        condiciones.append("documentos.fecha < ?")
+        parametros.append(f"{hasta.isoformat()}~")
+
+    consulta_fts = _consulta_fts(texto) if texto else ''
+    if consulta_fts:
+        # Recorrer el índice de texto en orden de id descendente permite cortar en
+        # cuanto se juntan `limite` resultados, sin ordenar todas las coincidencias
+        condiciones.insert(0, "documentos_fts MATCH ?")
+        parametros.insert(0, consulta_fts)
+        consulta = (f"SELECT {COLUMNAS_RESUMEN} FROM documentos_fts "
+                    f"JOIN documentos ON documentos.id = documentos_fts.rowid "
+                    f"WHERE {' AND '.join(condiciones)} ORDER BY documentos_fts.rowid DESC LIMIT ?")
+    else:
+        consulta = f"SELECT {COLUMNAS_RESUMEN} FROM documentos"
+        if condiciones:
+            consulta += " WHERE " + " AND ".join(condiciones)
+        consulta += " ORDER BY fecha DESC, id DESC LIMIT ?"
+    parametros.append(limite)
+
+    filas = obtener_conexion().execute(consulta, parametros).fetchall()
+    return [dict(fila) for fila in filas]
+
+
+def obtener_documento(documento_id):
+    """
+    Obtiene un documento del archivo con sus datos de entrada.
+
+    Args:
+        documento_id: ID del documento
+
+    Returns:
+        dict: Documento con la clave 'datos' ya decodificada, o None si no existe
+    """
+    fila = obtener_conexion().execute(
+        f"SELECT {COLUMNAS_RESUMEN}, datos_json FROM documentos WHERE id = ?",
+        (documento_id,)
+    ).fetchone()
+
+    if fila is None:
+        return None
+
+    documento = dict(fila)
+    documento['datos'] = json.loads(documento.pop('datos_json'))
+    return documento
+
+
+def leer_pdf_archivado(documento):
+    """
+    Lee el PDF de un documento archivado.
+
+    Args:
+        documento: Dict devuelto por buscar_documentos u obtener_documento
+
+    Returns:
+        bytes: Contenido del PDF
+    """
+    with open(documento['pdf_ruta'], 'rb') as f:
+        return f.read()
+
+
+def guardar_archivo_contenido(contenido, extension):
+    """
+    Guarda bytes en el archivo con nombre igual a su hash SHA-256.
+
+    Args:
+        contenido: Bytes a guardar
+        extension: Extensión del archivo (con punto)
+
+    Returns:
+        tuple: (str: hash SHA-256, str: ruta del archivo)
+    """
+    sha256 = hashlib.sha256(contenido).hexdigest()
+    ruta = os.path.join(DIRECTORIO_ARCHIVO, "contenido", sha256[:2], f"{sha256}{extension}")
+
+    if not os.path.exists(ruta):
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(ruta_tmp, 'wb') as f:
+            f.write(contenido)
+        os.replace(ruta_tmp, ruta)
+
+    return sha256, ruta
+
+
+def obtener_conexion():
+    """
+    Devuelve la conexión SQLite del hilo actual, creando el esquema si hace falta.
+
+    Returns:
+        sqlite3.Connection: Conexión con row_factory = sqlite3.Row
+    """
+    conexion = getattr(_local, 'conexion', None)
+    if conexion is None:
+        os.makedirs(DIRECTORIO_ARCHIVO, exist_ok=True)
+        conexion = sqlite3.connect(RUTA_BASE_DATOS, timeout=30)
+        conexion.row_factory = sqlite3.Row
+        # WAL permite leer mientras otro proceso escribe
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.executescript(ESQUEMA)
+        _local.conexion = conexion
+    return conexion
+
+
+def reindexar_archivo(completo=False):
+    """
+    Indexa en el buscador de texto los documentos archivados que aún no lo están.
+
+    Sirve para documentos archivados antes de que existiera el índice de texto.
+
+    Args:
+        completo: Si es True, borra el índice y lo reconstruye desde cero
+
+    Returns:
+        int: Número de documentos indexados
+    """
+    config = _cargar_config_reindexado()
+    conexion = obtener_conexion()
+
+    with conexion:
+        if completo:
+            conexion.execute("DELETE FROM documentos_fts")
+
+        filas = conexion.execute(
+            """SELECT id, tipo, datos_json FROM documentos
+               WHERE id NOT IN (SELECT rowid FROM documentos_fts)"""
+        ).fetchall()
+
+        for fila in filas:
+            _indexar_texto(conexion, fila['id'], fila['tipo'], json.loads(fila['datos_json']), config)
+
+    return len(filas)
+
+
+def texto_indexable(tipo, datos, config):
+    """
+    Extrae el texto de un documento para el buscador.
+
+    Args:
+        tipo: 'cotizacion' o 'comprobante'
+        datos: Dict con los datos del documento
+        config: Configuración del sistema
+
+    Returns:
+        dict: {'folio', 'cliente', 'empresa', 'contenido'}
+    """
+    cliente = datos.get('cliente', {})
+    partes = []
+
+    if tipo == 'cotizacion':
+        for item in datos.get('items', []):
+            precio = float(item.get('precio_unitario', 0))
+            partes.append(f"{item.get('codigo', '')} {item.get('descripcion', '')} "
+                          f"{item.get('cantidad', '')} {_formatear_monto(precio)}")
+    else:
+        for concepto in datos.get('conceptos', []):
+            monto = float(concepto.get('monto', 0))
+            partes.append(f"{concepto.get('descripcion', '')} {_formatear_monto(monto)}")
+
+    try:
+        if tipo == 'cotizacion':
+            from utils.cotizacion_utils import calcular_totales_cotizacion
+            partes.append(_formatear_monto(calcular_totales_cotizacion(datos, config)['total']))
+        else:
+            from utils.comprobante_utils import calcular_total_comprobante
+            partes.append(_formatear_monto(calcular_total_comprobante(datos)))
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    return {
+        'folio': datos.get('folio', ''),
+        'cliente': " ".join(str(cliente.get(campo) or '') for campo in
+                            ('nombre', 'empresa', 'telefono', 'email', 'direccion')),
+        'empresa': datos.get('empresa', {}).get('nombre', ''),
+        'contenido': "\n".join(partes)
+    }
+
+
+def _indexar_texto(conexion, documento_id, tipo, datos, config):
+    """Agrega (o reemplaza) un documento en el índice de texto"""
+    campos = texto_indexable(tipo, datos, config)
+    conexion.execute("DELETE FROM documentos_fts WHERE rowid = ?", (documento_id,))
+    conexion.execute(
+        "INSERT INTO documentos_fts (rowid, folio, cliente, empresa, contenido) VALUES (?, ?, ?, ?, ?)",
+        (documento_id, campos['folio'], campos['cliente'], campos['empresa'], campos['contenido'])
+    )
+
+
+def _consulta_fts(texto):
+    """
+    Convierte el texto del usuario en una consulta FTS5 segura: cada palabra entre
+    comillas y como prefijo, todas requeridas.
+    """
+    palabras = [palabra.replace('"', '') for palabra in texto.split()]
+    return " ".join(f'"{palabra}"*' for palabra in palabras if palabra)
+
+
+def _formatear_monto(monto):
+    """Monto en los dos formatos que suele buscar el usuario: 1234.50 y $1,234.50"""
+    return f"{monto:.2f} ${monto:,.2f}"
+
+
+def _cargar_config_reindexado():
+    """Configuración del registro de recursos para calcular totales al reindexar"""
+    return obtener_configuracion() or {'configuracion': {'iva': 0}}
+
+
+def _prefijo_like(texto):
+    """Escapa comodines de LIKE y agrega '%' al final"""
+    texto = texto.strip().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return texto + '%'
+
+
+def _serializar_datos(valor):
+    """
+    Convierte los datos de entrada a JSON. Los archivos subidos se guardan en el
+    archivo por contenido y se reemplazan por una referencia.
+    """
+    if isinstance(valor, dict):
+        return {str(k): _serializar_datos(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_serializar_datos(v) for v in valor]
+    if isinstance(valor, datetime):
+        return valor.isoformat(timespec='seconds')
+    if isinstance(valor, (bytes, bytearray)) or hasattr(valor, 'getvalue'):
+        contenido = bytes(valor) if isinstance(valor, (bytes, bytearray)) else valor.getvalue()
+        nombre = getattr(valor, 'name', '')
+        extension = os.path.splitext(nombre)[1].lower() if nombre else ''
+        sha256, ruta = guardar_archivo_contenido(contenido, extension)
+        return {'adjunto': ruta, 'nombre': nombre, 'sha256': sha256}
+    if valor is None or isinstance(valor, (str, int, float, bool)):
+        return valor
+    return str(valor)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Mantenimiento del archivo de documentos")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    reindexar = subcomandos.add_parser("reindexar", help="Indexa en el buscador los documentos existentes")
+    reindexar.add_argument("--completo", action="store_true", help="Reconstruye el índice desde cero")
+
+    buscar = subcomandos.add_parser("buscar", help="Busca documentos por texto")
+    buscar.add_argument("texto")
+    buscar.add_argument("--limite", type=int, default=20)
+
+    argumentos = parser.parse_args()
+
+    if argumentos.comando == "reindexar":
+        total = reindexar_archivo(completo=argumentos.completo)
+        print(f"Documentos indexados: {total}")
+    else:
+        for documento in buscar_documentos(texto=argumentos.texto, limite=argumentos.limite):
+            print(f"{documento['fecha']}  {documento['folio']:<24} {documento['cliente_nombre']:<30} "
+                  f"${documento['total']:,.2f}")
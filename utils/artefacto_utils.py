@@ -0,0 +1,223 @@
+"""
+Utilidades para guardar en disco los archivos generados mientras se descargan
+
+Los PDFs y ZIPs generados se escriben en DIRECTORIO_ARTEFACTOS y la descarga se
+sirve abriendo el archivo, en lugar de mantener los bytes en la memoria de la
+sesión de Streamlit. Un índice SQLite compartido registra tamaño y último uso de
+cada archivo, así varios procesos del servidor pueden usar la misma carpeta:
+los artefactos vencidos (TTL_ARTEFACTOS) se borran y, si la carpeta pasa de
+MAX_BYTES_ARTEFACTOS, se borran los de uso más antiguo.
+"""
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+
+DIRECTORIO_ARTEFACTOS = os.path.join("cache", "artefactos")
+RUTA_INDICE = os.path.join(DIRECTORIO_ARTEFACTOS, "artefactos.db")
+
+# Segundos que un artefacto se conserva desde su último uso
+TTL_ARTEFACTOS = 60 * 60
+
+# Tamaño máximo de la carpeta; al pasarlo se borran los de uso más antiguo
+MAX_BYTES_ARTEFACTOS = 1024 * 1024 * 1024
+
+# Segundos entre limpiezas de cada proceso
+INTERVALO_LIMPIEZA = 60
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS artefactos (
+    id TEXT PRIMARY KEY,
+    nombre TEXT NOT NULL,
+    tamano INTEGER NOT NULL,
+    creado REAL NOT NULL,
+    usado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_artefactos_usado ON artefactos(usado);
+"""
+
+_estado = {'limpieza': 0.0}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def guardar_artefacto(contenido, nombre):
+    """
+    Guarda un archivo generado en la carpeta de artefactos.
+
+    Args:
+        contenido: Bytes del archivo
+        nombre: Nombre con el que se descargará (solo se usa la extensión)
+
+    Returns:
+        str: Identificador del artefacto para abrir_artefacto
+    """
+    artefacto_id, ruta = _nueva_ruta(nombre)
+    ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(ruta_tmp, 'wb') as f:
+        f.write(contenido)
+    os.replace(ruta_tmp, ruta)
+
+    _registrar(artefacto_id, nombre, len(contenido))
+    return artefacto_id
+
+
+def guardar_artefacto_desde_archivo(ruta_origen, nombre):
+    """
+    Mueve un archivo ya escrito en disco (por ejemplo un ZIP) a la carpeta de artefactos.
+
+    Args:
+        ruta_origen: Ruta del archivo; deja de existir en esa ruta
+        nombre: Nombre con el que se descargará
+
+    Returns:
+        str: Identificador del artefacto para abrir_artefacto
+    """
+    artefacto_id, ruta = _nueva_ruta(nombre)
+    ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    # shutil.move copia si el origen está en otro sistema de archivos
+    shutil.move(ruta_origen, ruta_tmp)
+    os.replace(ruta_tmp, ruta)
+
+    _registrar(artefacto_id, nombre, os.path.getsize(ruta))
+    return artefacto_id
+
+
+def abrir_artefacto(artefacto_id):
+    """
+    Abre un artefacto para leerlo y marca su uso.
+
+    Args:
+        artefacto_id: Identificador devuelto por guardar_artefacto
+
+    Returns:
+        file: Archivo abierto en modo binario (quien lo recibe lo cierra)
+
+    Raises:
+        FileNotFoundError: Si el artefacto venció y ya se borró
+    """
+    archivo = open(_ruta_artefacto(artefacto_id), 'rb')
+    try:
+        conexion = _obtener_conexion()
+        with conexion:
+            conexion.execute("UPDATE artefactos SET usado = ? WHERE id = ?", (time.time(), artefacto_id))
+    except sqlite3.Error as e:
+        print(f"Error al actualizar artefacto: {e}")
+    return archivo
+
+
+def leer_artefacto(artefacto_id):
+    """
+    Lee un artefacto completo (para descargas que necesitan los bytes).
+
+    Args:
+        artefacto_id: Identificador devuelto por guardar_artefacto
+
+    Returns:
+        bytes: Contenido del archivo
+
+    Raises:
+        FileNotFoundError: Si el artefacto venció y ya se borró
+    """
+    with abrir_artefacto(artefacto_id) as archivo:
+        return archivo.read()
+
+
+def limpiar_artefactos(ttl=None, max_bytes=None):
+    """
+    Borra los artefactos vencidos y, si se pasa la cuota, los de uso más antiguo.
+
+    Es seguro con varios procesos: la selección y el borrado del índice se hacen
+    con el candado de escritura de SQLite tomado.
+
+    Args:
+        ttl: Segundos desde el último uso (por defecto TTL_ARTEFACTOS)
+        max_bytes: Cuota de la carpeta (por defecto MAX_BYTES_ARTEFACTOS)
+
+    Returns:
+        int: Número de artefactos borrados
+    """
+    ttl = TTL_ARTEFACTOS if ttl is None else ttl
+    max_bytes = MAX_BYTES_ARTEFACTOS if max_bytes is None else max_bytes
+
+    conexion = _obtener_conexion()
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        filas = conexion.execute("SELECT id, tamano, usado FROM artefactos ORDER BY usado").fetchall()
+
+        limite = time.time() - ttl
+        total = sum(fila['tamano'] for fila in filas)
+        borrados = []
+        for fila in filas:
+            if fila['usado'] >= limite and total <= max_bytes:
+                break
+            try:
+                os.remove(_ruta_artefacto(fila['id']))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                # En Windows no se puede borrar un archivo abierto: se intenta en la siguiente limpieza
+                continue
+            borrados.append((fila['id'],))
+            total -= fila['tamano']
+
+        conexion.executemany("DELETE FROM artefactos WHERE id = ?", borrados)
+        conexion.execute("COMMIT")
+    except BaseException:
+        conexion.execute("ROLLBACK")
+        raise
+
+    return len(borrados)
+
+
+def _registrar(artefacto_id, nombre, tamano):
+    """Agrega el artefacto al índice y limpia la carpeta si ya toca"""
+    ahora = time.time()
+    conexion = _obtener_conexion()
+    with conexion:
+        conexion.execute(
+            "INSERT INTO artefactos (id, nombre, tamano, creado, usado) VALUES (?, ?, ?, ?, ?)",
+            (artefacto_id, nombre, tamano, ahora, ahora)
+        )
+
+    with _lock:
+        if ahora - _estado['limpieza'] < INTERVALO_LIMPIEZA:
+            return
+        _estado['limpieza'] = ahora
+    try:
+        limpiar_artefactos()
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error al limpiar artefactos: {e}")
+
+
+def _nueva_ruta(nombre):
+    """Identificador nuevo y su ruta en disco (conserva la extensión del nombre)"""
+    extension = os.path.splitext(nombre)[1].lower()
+    artefacto_id = f"{uuid.uuid4().hex}{extension}"
+    ruta = _ruta_artefacto(artefacto_id)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    return artefacto_id, ruta
+
+
+def _ruta_artefacto(artefacto_id):
+    """Ruta en disco de un artefacto, repartida en subcarpetas por prefijo"""
+    if os.path.basename(artefacto_id) != artefacto_id:
+        raise ValueError(f"Identificador de artefacto no válido: {artefacto_id}")
+    return os.path.join(DIRECTORIO_ARTEFACTOS, artefacto_id[:2], artefacto_id)
+
+
+def _obtener_conexion():
+    """Conexión SQLite del hilo actual en modo de transacciones manual"""
+    conexion = getattr(_local, 'conexion', None)
+    if conexion is None:
+        os.makedirs(DIRECTORIO_ARTEFACTOS, exist_ok=True)
+        conexion = sqlite3.connect(RUTA_INDICE, timeout=30, isolation_level=None)
+        conexion.row_factory = sqlite3.Row
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.executescript(ESQUEMA)
+        _local.conexion = conexion
+    return conexion
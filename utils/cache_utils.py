@@ -0,0 +1,346 @@
+"""
+Utilidades para render determinista y caché de PDFs generados
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, date
+
+from utils.recursos_utils import obtener_configuracion, obtener_version_recursos
+from utils.metricas_utils import medir, registrar_bytes, registrar_cache
+
+
+DIRECTORIO_CACHE = "cache/pdf"
+MAX_ENTRADAS_MEMORIA = 32
+
+# Límites de la caché en disco: se borran los archivos sin usar en MAX_EDAD_DISCO
+# segundos y, si la carpeta pasa de MAX_BYTES_DISCO, los de uso más antiguo
+MAX_BYTES_DISCO = 512 * 1024 * 1024
+MAX_EDAD_DISCO = 30 * 24 * 60 * 60
+
+# Segundos entre limpiezas de cada carpeta en cada proceso
+INTERVALO_LIMPIEZA = 60
+
+# Los temporales de una escritura interrumpida se borran después de este tiempo
+EDAD_TEMPORALES = 60 * 60
+
+_cache_memoria = OrderedDict()
+_lock = threading.Lock()
+_ultimas_limpiezas = {}
+
+
+def obtener_fecha_documento(datos):
+    """
+    Obtiene la fecha del documento a partir de los datos de entrada.
+
+    Args:
+        datos: Dict con los datos del documento (clave opcional 'fecha')
+
+    Returns:
+        tuple: (datetime: fecha del documento, bool: True si viene de los datos)
+    """
+    fecha = datos.get('fecha')
+    if isinstance(fecha, str) and fecha:
+        return datetime.fromisoformat(fecha), True
+    if isinstance(fecha, datetime):
+        return fecha, True
+    if isinstance(fecha, date):
+        return datetime(fecha.year, fecha.month, fecha.day), True
+    return datetime.now(), False
+
+
+def crear_canvas_determinista(fecha):
+    """
+    Crea una clase de canvas que produce bytes idénticos para datos idénticos.
+
+    ReportLab usa la hora actual como fecha de creación y calcula el ID del documento
+    a partir de ella. En modo invariante el ID depende solo del contenido y de los
+    metadatos (el título lleva el folio), y la fecha de creación se toma de los datos.
+
+    Args:
+        fecha: datetime que se usará como fecha de creación del PDF
+
+    Returns:
+        type: Subclase de canvas.Canvas para usar como canvasmaker en doc.build
+    """
+    # ReportLab se importa aquí para que obtener_fecha_documento no lo cargue
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.utils import TimeStamp
+
+    class CanvasDeterminista(canvas.Canvas):
+        def __init__(self, *args, **kwargs):
+            kwargs['invariant'] = 1
+            super().__init__(*args, **kwargs)
+            marca = TimeStamp(invariant=1)
+            marca.t = fecha.timestamp()
+            marca.lt = fecha.timetuple()
+            marca.YMDhms = tuple(marca.lt)[:6]
+            self._doc._timeStamp = marca
+
+    return CanvasDeterminista
+
+
+def calcular_clave_cache(tipo, datos, config, archivos=()):
+    """
+    Calcula la clave de caché de un documento.
+
+    La clave es el hash del dict de datos canonizado, de la versión de la
+    configuración y de la fecha de modificación de los archivos que usa el render
+    (logos, membretes).
+
+    Args:
+        tipo: Tipo de documento ('cotizacion', 'comprobante')
+        datos: Dict con los datos del documento
+        config: Configuración del sistema
+        archivos: Rutas de archivos que afectan el resultado
+
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    estado_archivos = []
+    for ruta in archivos:
+        if ruta and os.path.exists(ruta):
+            info = os.stat(ruta)
+            estado_archivos.append([ruta, info.st_mtime_ns, info.st_size])
+
+    contenido = {
+        'tipo': tipo,
+        'datos': canonizar(datos),
+        'config': obtener_version_config(config),
+        'archivos': estado_archivos
+    }
+    texto = json.dumps(contenido, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def obtener_version_config(config):
+    """
+    Calcula la versión de la configuración como hash de su contenido.
+
+    Args:
+        config: Configuración del sistema
+
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    # La configuración del registro de recursos ya tiene su versión calculada
+    if config is obtener_configuracion():
+        return obtener_version_recursos()
+
+    texto = json.dumps(config, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def render_con_cache(tipo, datos, config, generar, archivos=()):
+    """
+    Devuelve el PDF desde la caché (memoria LRU y disco) o lo genera y lo guarda.
+
+    Args:
+        tipo: Tipo de documento ('cotizacion', 'comprobante')
+        datos: Dict con los datos del documento
+        config: Configuración del sistema
+        generar: Función (datos, config) -> bytes que construye el PDF
+        archivos: Rutas de archivos que afectan el resultado
+
+    Returns:
+        bytes: PDF generado o recuperado de la caché
+    """
+    clave = calcular_clave_cache(tipo, datos, config, archivos)
+
+    pdf_bytes = obtener_pdf_cache(clave)
+    registrar_cache('pdf', pdf_bytes is not None)
+    if pdf_bytes is not None:
+        return pdf_bytes
+
+    with medir(tipo):
+        pdf_bytes = generar(datos, config)
+    registrar_bytes(tipo, 'salida', len(pdf_bytes))
+    guardar_pdf_cache(clave, pdf_bytes)
+    return pdf_bytes
+
+
+def obtener_pdf_cache(clave):
+    """
+    Busca un PDF en la caché, primero en memoria y después en disco.
+
+    Args:
+        clave: Clave calculada con calcular_clave_cache
+
+    Returns:
+        bytes: PDF en caché, o None si no existe
+    """
+    with _lock:
+        if clave in _cache_memoria:
+            _cache_memoria.move_to_end(clave)
+            return _cache_memoria[clave]
+
+    ruta = _ruta_cache(clave)
+    try:
+        with open(ruta, 'rb') as f:
+            pdf_bytes = f.read()
+    except OSError:
+        return None
+
+    marcar_uso(ruta)
+    _guardar_en_memoria(clave, pdf_bytes)
+    return pdf_bytes
+
+
+def guardar_pdf_cache(clave, pdf_bytes):
+    """
+    Guarda un PDF en la caché en memoria y en disco.
+
+    Args:
+        clave: Clave calculada con calcular_clave_cache
+        pdf_bytes: PDF generado
+    """
+    _guardar_en_memoria(clave, pdf_bytes)
+
+    ruta = _ruta_cache(clave)
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Escritura atómica para que otro proceso nunca lea un archivo a medias
+        ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(ruta_tmp, 'wb') as f:
+            f.write(pdf_bytes)
+        os.replace(ruta_tmp, ruta)
+    except OSError as e:
+        print(f"Error al guardar PDF en caché: {e}")
+
+    programar_limpieza(DIRECTORIO_CACHE)
+
+
+def marcar_uso(ruta):
+    """Actualiza la fecha de modificación de un archivo en caché (la limpieza borra primero los menos usados)"""
+    try:
+        os.utime(ruta)
+    except OSError:
+        pass
+
+
+def programar_limpieza(directorio, max_bytes=MAX_BYTES_DISCO, max_edad=MAX_EDAD_DISCO):
+    """
+    Limpia una carpeta de caché si pasaron INTERVALO_LIMPIEZA segundos desde la última vez.
+
+    Se llama después de cada escritura; los errores solo se avisan.
+    """
+    ahora = time.monotonic()
+    with _lock:
+        if ahora - _ultimas_limpiezas.get(directorio, -INTERVALO_LIMPIEZA) < INTERVALO_LIMPIEZA:
+            return
+        _ultimas_limpiezas[directorio] = ahora
+    try:
+        limpiar_directorio_cache(directorio, max_bytes, max_edad)
+    except OSError as e:
+        print(f"Error al limpiar la caché {directorio}: {e}")
+
+
+def limpiar_directorio_cache(directorio, max_bytes=MAX_BYTES_DISCO, max_edad=MAX_EDAD_DISCO):
+    """
+    Borra los archivos vencidos de una carpeta de caché y, si pasa de la cuota, los de uso más antiguo.
+
+    El último uso es la fecha de modificación (ver marcar_uso). Es seguro con
+    varios procesos: un archivo que otro proceso ya borró se ignora, y quien lo
+    busque después solo tiene un fallo de caché.
+
+    Args:
+        directorio: Carpeta de la caché (se recorren las subcarpetas)
+        max_bytes: Tamaño máximo de la carpeta
+        max_edad: Segundos sin usar después de los cuales se borra un archivo
+
+    Returns:
+        int: Número de archivos borrados
+    """
+    ahora = time.time()
+    archivos = []
+    borrados = 0
+    for raiz, _, nombres in os.walk(directorio):
+        for nombre in nombres:
+            ruta = os.path.join(raiz, nombre)
+            try:
+                info = os.stat(ruta)
+            except OSError:
+                continue
+            if nombre.endswith('.tmp'):
+                # Un temporal reciente puede ser una escritura en curso de otro proceso
+                if ahora - info.st_mtime > EDAD_TEMPORALES:
+                    borrados += _borrar(ruta)
+                continue
+            archivos.append((info.st_mtime, info.st_size, ruta))
+
+    archivos.sort()
+    total = sum(tamano for _, tamano, _ in archivos)
+    for usado, tamano, ruta in archivos:
+        if ahora - usado <= max_edad and total <= max_bytes:
+            break
+        borrados += _borrar(ruta)
+        total -= tamano
+    return borrados
+
+
+def limpiar_cache_memoria():
+    """Vacía la caché en memoria (la caché en disco se conserva)"""
+    with _lock:
+        _cache_memoria.clear()
+
+
+def _guardar_en_memoria(clave, pdf_bytes):
+    """Agrega un PDF a la caché LRU en memoria"""
+    with _lock:
+        _cache_memoria[clave] = pdf_bytes
+        _cache_memoria.move_to_end(clave)
+        while len(_cache_memoria) > MAX_ENTRADAS_MEMORIA:
+            _cache_memoria.popitem(last=False)
+
+
+def _borrar(ruta):
+    """Borra un archivo de caché; devuelve 1 si se borró"""
+    try:
+        os.remove(ruta)
+    except OSError:
+        return 0
+    return 1
+
+
+def _ruta_cache(clave):
+    """Ruta en disco de un PDF en caché, repartida en subcarpetas por prefijo"""
+    return os.path.join(DIRECTORIO_CACHE, clave[:2], f"{clave}.pdf")
+
+
+def canonizar(valor):
+    """
+    Convierte los datos a una forma serializable y estable para calcular un hash.
+
+    Los bytes y los archivos (subidos, BytesIO o abiertos) se reemplazan por el
+    SHA-256 de su contenido; los archivos abiertos se leen sin mover su posición.
+
+    Args:
+        valor: Dicts, listas, fechas, bytes, archivos y valores simples anidados
+
+    Returns:
+        Valor equivalente que json.dumps serializa siempre igual
+    """
+    if isinstance(valor, dict):
+        return {str(k): canonizar(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [canonizar(v) for v in valor]
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, (bytes, bytearray)):
+        return {'sha256': hashlib.sha256(valor).hexdigest()}
+    if hasattr(valor, 'getvalue'):
+        # Archivos subidos (UploadedFile, BytesIO): se identifican por su contenido
+        return {'sha256': hashlib.sha256(valor.getvalue()).hexdigest()}
+    if hasattr(valor, 'read') and hasattr(valor, 'seek'):
+        posicion = valor.tell()
+        contenido = valor.read()
+        valor.seek(posicion)
+        return {'sha256': hashlib.sha256(contenido).hexdigest()}
+    if isinstance(valor, float):
+        return repr(valor)
+    if valor is None or isinstance(valor, (str, int, bool)):
+        return valor
+    return str(valor)
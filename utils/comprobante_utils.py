@@ -4,18 +4,34 @@ Utilidades para generación de comprobantes de pago
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.platypus import Table, TableStyle, Paragraph, Spacer, Image, PageBreak
 from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-from datetime import datetime
-import io
-from PIL import Image as PILImage
+import os
+from xml.sax.saxutils import escape
+from utils.imagen_utils import imagenes_distintas, preparar_imagenes, DPI_IMPRESION
+from utils.pdf_utils import anexar_pdfs
+from utils.cache_utils import render_con_cache
+from utils.fuente_utils import rutas_fuentes
+from utils.perfil_utils import perfil_activo, perfilado
+from utils.plantilla_utils import renderizar_plantilla
 
 
 def generar_comprobante_pdf(datos, config):
     """
     Genera un PDF de comprobante de pago
     
+    Si datos incluye 'fecha' (datetime o ISO), el render es determinista: los mismos
+    datos producen los mismos bytes y el PDF se sirve desde la caché (salvo con el
+    perfilado activo, que siempre genera el documento para perfilarlo).
+    
+    Las imágenes de comprobante van en 'comprobante_imagenes' (lista) o en
+    'comprobante_imagen'; las repetidas se insertan una sola vez. Los comprobantes
+    en PDF van en 'anexos_pdf' y se anexan como páginas; con 'anexos_ajustar' se
+    reducen al recuadro de 4x5 pulgadas.
+    
+    Si datos incluye 'membrete' (ruta a un PNG de membretes/), se dibuja como fondo
+    de cada página en el mismo render.
+    
     Args:
         datos (dict): Diccionario con la información del comprobante
         config (dict): Configuración general del sistema
@@ -23,264 +39,279 @@ def generar_comprobante_pdf(datos, config):
     Returns:
         bytes: PDF generado en bytes
     """
-    buffer = io.BytesIO()
-    
-    # Crear documento
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=letter,
-        rightMargin=0.5*inch,
-        leftMargin=0.5*inch,
-        topMargin=0.5*inch,
-        bottomMargin=0.5*inch
-    )
-    
-    # Contenedor de elementos
-    elements = []
-    
-    # Estilos
-    styles = getSampleStyleSheet()
-    
-    # Estilos personalizados
-    titulo_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#2C3E50'),
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    subtitulo_style = ParagraphStyle(
-        'CustomSubtitle',
-        parent=styles['Normal'],
-        fontSize=14,
-        textColor=colors.HexColor('#34495E'),
-        spaceAfter=20,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    texto_normal = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#2C3E50'),
-        alignment=TA_LEFT
-    )
-    
-    texto_derecha = ParagraphStyle(
-        'CustomRight',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.HexColor('#2C3E50'),
-        alignment=TA_RIGHT
-    )
-    
-    # ===== ENCABEZADO =====
-    empresa = datos['empresa']
-    
-    # Logo (25%) y Título (75%) en la parte superior
-    try:
-        logo = Image(empresa['logo'], width=1.2*inch, height=1.2*inch)
-        encabezado_data = [
-            [logo, Paragraph("COMPROBANTE DE PAGO", titulo_style)]
-        ]
-        
-        tabla_encabezado = Table(encabezado_data, colWidths=[1.75*inch, 5.25*inch])
-        tabla_encabezado.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ('ALIGN', (0, 0), (0, 0), 'CENTER'),
-            ('ALIGN', (1, 0), (1, 0), 'LEFT'),
-        ]))
-        
-        elements.append(tabla_encabezado)
-    except:
-        # Si no hay logo, solo mostrar título
-        elements.append(Paragraph("COMPROBANTE DE PAGO", titulo_style))
-    
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Folio y fecha
-    info_folio = [
-        [Paragraph(f"<b>Folio:</b> {datos['folio']}", texto_normal),
-         Paragraph(f"<b>Fecha:</b> {datetime.now().strftime('%d/%m/%Y')}", texto_derecha)]
-    ]
-    tabla_folio = Table(info_folio, colWidths=[3.5*inch, 3.5*inch])
-    tabla_folio.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-    ]))
-    elements.append(tabla_folio)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # ===== INFORMACIÓN DEL CLIENTE =====
-    elements.append(Paragraph("DATOS DEL CLIENTE", subtitulo_style))
-    
-    cliente = datos['cliente']
-    datos_cliente = [
-        [Paragraph("<b>Nombre completo:</b>", texto_normal), 
-         Paragraph(cliente['nombre'], texto_normal)],
-        [Paragraph("<b>Número celular:</b>", texto_normal), 
-         Paragraph(cliente['telefono'], texto_normal)]
-    ]
-    
-    tabla_cliente = Table(datos_cliente, colWidths=[2*inch, 5*inch])
-    tabla_cliente.setStyle(TableStyle([
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#ECF0F1')),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 8),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
-    ]))
+    # Un acierto de caché no generaría nada que perfilar
+    if datos.get('fecha') and not perfil_activo():
+        # Los adjuntos dados como ruta se identifican por su fecha de modificación
+        adjuntos = _obtener_imagenes(datos) + list(datos.get('anexos_pdf') or [])
+        archivos = [datos['empresa'].get('logo', ''), datos.get('membrete')] + [a for a in adjuntos if isinstance(a, str)]
+        archivos += rutas_fuentes(datos['empresa'])
+        return render_con_cache('comprobante', datos, config, _construir_comprobante_pdf,
+                                archivos=archivos)
+    
+    return _construir_comprobante_pdf(datos, config)
+
+
+@perfilado('comprobante')
+def _construir_comprobante_pdf(datos, config):
+    """Construye el PDF del comprobante a partir de su plantilla (sin caché)"""
+    pdf_bytes = renderizar_plantilla(PLANTILLA_COMPROBANTE, datos, config)
     
-    elements.append(tabla_cliente)
-    elements.append(Spacer(1, 0.3*inch))
+    # Comprobantes en PDF: sus páginas se anexan tal cual, sin rasterizar
+    if datos.get('anexos_pdf'):
+        pdf_bytes = anexar_pdfs(pdf_bytes, datos['anexos_pdf'], ajustar=datos.get('anexos_ajustar', False))
     
-    # ===== CONCEPTOS =====
-    elements.append(Paragraph("CONCEPTOS", subtitulo_style))
+    return pdf_bytes
+
+
+def calcular_total_comprobante(datos):
+    """
+    Calcula el total de los conceptos de un comprobante.
     
-    # Encabezado de tabla de conceptos
-    datos_conceptos = [[
-        Paragraph("<b>No</b>", texto_normal),
-        Paragraph("<b>Concepto</b>", texto_normal),
-        Paragraph("<b>Monto</b>", texto_derecha)
-    ]]
+    Args:
+        datos (dict): Diccionario con la información del comprobante
     
-    # Agregar conceptos
+    Returns:
+        float: Suma de los montos de los conceptos
+    """
     total_conceptos = 0
-    for idx, concepto in enumerate(datos['conceptos'], 1):
-        monto = float(concepto['monto'])
-        total_conceptos += monto
-        
-        datos_conceptos.append([
-            Paragraph(str(idx), texto_normal),
-            Paragraph(concepto['descripcion'], texto_normal),
-            Paragraph(f"${monto:,.2f}", texto_derecha)
-        ])
-    
-    # Agregar fila de total
-    datos_conceptos.append([
-        Paragraph("", texto_normal),
-        Paragraph("<b>TOTAL:</b>", texto_derecha),
-        Paragraph(f"<b>${total_conceptos:,.2f} {config['configuracion']['moneda']}</b>", texto_derecha)
-    ])
-    
-    tabla_conceptos = Table(datos_conceptos, colWidths=[0.5*inch, 4.5*inch, 2*inch])
-    tabla_conceptos.setStyle(TableStyle([
-        ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498DB')),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-        ('ALIGN', (2, 0), (2, -1), 'RIGHT'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('TOPPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -2), colors.white),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-        ('TOPPADDING', (0, 1), (-1, -2), 8),
-        ('BOTTOMPADDING', (0, 1), (-1, -2), 8),
-        # Fila de total
-        ('BACKGROUND', (1, -1), (-1, -1), colors.HexColor('#ECF0F1')),
-        ('FONTNAME', (1, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (1, -1), (-1, -1), 12),
-        ('TOPPADDING', (1, -1), (-1, -1), 10),
-        ('BOTTOMPADDING', (1, -1), (-1, -1), 10),
-        ('LINEABOVE', (1, -1), (-1, -1), 2, colors.HexColor('#2C3E50')),
-    ]))
-    
-    elements.append(tabla_conceptos)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # ===== DATOS DE LA EMPRESA AL FINAL DE LA HOJA 1 =====
-    
-    # Información de la empresa
-    info_empresa_data = [
-        [Paragraph("<b>Datos de la empresa:</b>", texto_normal)],
-        [Paragraph(f"<b>{empresa['razon_social']}</b>", texto_normal)],
-        [Paragraph(f"RFC: {empresa['rfc']}", texto_normal)],
-        [Paragraph(f"{empresa['direccion']}", texto_normal)],
-        [Paragraph(f"Tel: {empresa['telefono']} | Email: {empresa['email']}", texto_normal)]
-    ]
-    
-    tabla_info_empresa = Table(info_empresa_data, colWidths=[7*inch])
-    tabla_info_empresa.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#F8F9FA')),
-        ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#DEE2E6')),
-        ('LEFTPADDING', (0, 0), (-1, -1), 10),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 10),
-        ('TOPPADDING', (0, 0), (-1, -1), 6),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+    for concepto in datos['conceptos']:
+        total_conceptos += float(concepto['monto'])
+    return total_conceptos
+
+
+def _obtener_imagenes(datos):
+    """Imágenes de comprobante: lista 'comprobante_imagenes' y/o 'comprobante_imagen' individual"""
+    imagenes = list(datos.get('comprobante_imagenes') or [])
+    if datos.get('comprobante_imagen'):
+        imagenes.insert(0, datos['comprobante_imagen'])
+    return imagenes
+
+
+def _bloque_imagenes(contexto, estilos):
+    """Comprobantes de pago (imágenes) a partir de la hoja 2"""
+    imagenes = imagenes_distintas(_obtener_imagenes(contexto['datos']))
+    if not imagenes:
+        return []
+    
+    elements = [PageBreak()]
+    
+    titulo = "COMPROBANTE DE PAGO" if len(imagenes) == 1 else "COMPROBANTES DE PAGO"
+    elements.append(Paragraph(titulo, estilos['CustomSubtitle']))
+    
+    # Una imagen ocupa el recuadro de 4x5 pulgadas; varias van en cuadrícula de 2 columnas
+    columnas = 1 if len(imagenes) == 1 else 2
+    max_width, max_height = (4*inch, 5*inch) if columnas == 1 else (3.3*inch, 4.2*inch)
+    
+    # Orientar, reducir y recomprimir las imágenes en paralelo
+    dpi = contexto['configuracion'].get('dpi_imagenes', DPI_IMPRESION)
+    celdas = []
+    for resultado in preparar_imagenes(imagenes, max_width, max_height, dpi=dpi):
+        if isinstance(resultado, Exception):
+            celdas.append(Paragraph(f"<i>Error al cargar comprobante: {escape(str(resultado))}</i>", estilos['CustomNormal']))
+        else:
+            imagen, new_width, new_height = resultado
+            celdas.append(Image(imagen, width=new_width, height=new_height))
+    
+    # Centrar imágenes; la tabla se reparte en las páginas que hagan falta
+    filas = [celdas[i:i + columnas] for i in range(0, len(celdas), columnas)]
+    filas[-1] += [''] * (columnas - len(filas[-1]))
+    
+    tabla_img = Table(filas, colWidths=[7*inch / columnas] * columnas)
+    tabla_img.setStyle(TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
         ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
     ]))
     
-    elements.append(tabla_info_empresa)
-    
-    # ===== COMPROBANTE DE PAGO EN HOJA 2 =====
-    if 'comprobante_imagen' in datos and datos['comprobante_imagen']:
-        # Salto de página
-        elements.append(PageBreak())
+    elements.append(tabla_img)
+    elements.append(Spacer(1, 0.2*inch))
+    return elements
+
+
+# Plantilla del comprobante de pago (ver utils/plantilla_utils.py)
+PLANTILLA_COMPROBANTE = {
+    'nombre': 'comprobante',
+    'titulo': 'Comprobante de pago {datos[folio]}',
+    'pagina': {
+        'tamano': letter,
+        'margenes': (0.5*inch, 0.5*inch, 0.5*inch, 0.5*inch)
+    },
+    'estilos': {
+        'CustomTitle': {
+            'parent': 'Heading1',
+            'fontSize': 24,
+            'textColor': colors.HexColor('#2C3E50'),
+            'spaceAfter': 30,
+            'alignment': TA_CENTER,
+            'fontName': 'Helvetica-Bold'
+        },
+        'CustomSubtitle': {
+            'fontSize': 14,
+            'textColor': colors.HexColor('#34495E'),
+            'spaceAfter': 20,
+            'alignment': TA_CENTER,
+            'fontName': 'Helvetica-Bold'
+        },
+        'CustomNormal': {
+            'fontSize': 10,
+            'textColor': colors.HexColor('#2C3E50'),
+            'alignment': TA_LEFT
+        },
+        'CustomRight': {
+            'fontSize': 10,
+            'textColor': colors.HexColor('#2C3E50'),
+            'alignment': TA_RIGHT
+        }
+    },
+    'calculos': {
+        'total': lambda contexto: calcular_total_comprobante(contexto['datos'])
+    },
+    'secciones': [
+        # ===== ENCABEZADO =====
+        # Logo (25%) y Título (75%) en la parte superior; sin logo, solo el título
+        {
+            'tipo': 'tabla',
+            'si': lambda contexto: bool(contexto['empresa']['logo']) and os.path.exists(contexto['empresa']['logo']),
+            'filas': [[
+                {'imagen': '{empresa[logo]}', 'ancho': 1.2*inch, 'alto': 1.2*inch},
+                {'parrafo': 'COMPROBANTE DE PAGO', 'estilo': 'CustomTitle'}
+            ]],
+            'anchos': [1.75*inch, 5.25*inch],
+            'estilo': [
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('ALIGN', (0, 0), (0, 0), 'CENTER'),
+                ('ALIGN', (1, 0), (1, 0), 'LEFT'),
+            ],
+            'alternativa': [
+                {'tipo': 'parrafo', 'texto': 'COMPROBANTE DE PAGO', 'estilo': 'CustomTitle'}
+            ]
+        },
+        {'tipo': 'espacio', 'alto': 0.2*inch},
         
-        elements.append(Paragraph("COMPROBANTE DE PAGO", subtitulo_style))
+        # Folio y fecha
+        {
+            'tipo': 'tabla',
+            'filas': [[
+                {'parrafo': '<b>Folio:</b> {datos[folio]}', 'estilo': 'CustomNormal'},
+                {'parrafo': '<b>Fecha:</b> {fecha:%d/%m/%Y}', 'estilo': 'CustomRight'}
+            ]],
+            'anchos': [3.5*inch, 3.5*inch],
+            'estilo': [
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ]
+        },
+        {'tipo': 'espacio', 'alto': 0.3*inch},
         
-        try:
-            # Cargar y redimensionar imagen
-            img = PILImage.open(datos['comprobante_imagen'])
-            
-            # Calcular dimensiones manteniendo proporción
-            max_width = 4 * inch
-            max_height = 5 * inch
-            
-            img_width, img_height = img.size
-            aspect_ratio = img_width / img_height
-            
-            if img_width > img_height:
-                new_width = min(max_width, img_width)
-                new_height = new_width / aspect_ratio
-            else:
-                new_height = min(max_height, img_height)
-                new_width = new_height * aspect_ratio
-            
-            # Agregar imagen al PDF
-            img_reportlab = Image(datos['comprobante_imagen'], width=new_width, height=new_height)
-            
-            # Centrar imagen
-            tabla_img = Table([[img_reportlab]], colWidths=[7*inch])
-            tabla_img.setStyle(TableStyle([
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        # ===== INFORMACIÓN DEL CLIENTE =====
+        {'tipo': 'parrafo', 'texto': 'DATOS DEL CLIENTE', 'estilo': 'CustomSubtitle'},
+        {
+            'tipo': 'tabla',
+            'filas': [
+                [{'parrafo': '<b>Nombre completo:</b>', 'estilo': 'CustomNormal'},
+                 {'parrafo': '{cliente[nombre]}', 'estilo': 'CustomNormal'}],
+                [{'parrafo': '<b>Número celular:</b>', 'estilo': 'CustomNormal'},
+                 {'parrafo': '{cliente[telefono]}', 'estilo': 'CustomNormal'}]
+            ],
+            'anchos': [2*inch, 5*inch],
+            'estilo': [
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#ECF0F1')),
                 ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-            ]))
-            
-            elements.append(tabla_img)
-            elements.append(Spacer(1, 0.2*inch))
-            
-        except Exception as e:
-            elements.append(Paragraph(f"<i>Error al cargar comprobante: {str(e)}</i>", texto_normal))
-    
-    # ===== PIE DE PÁGINA =====
-    elements.append(Spacer(1, 0.2*inch))
-    
-    pie_texto = f"""
+                ('LEFTPADDING', (0, 0), (-1, -1), 10),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+                ('TOPPADDING', (0, 0), (-1, -1), 8),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 8),
+            ]
+        },
+        {'tipo': 'espacio', 'alto': 0.3*inch},
+        
+        # ===== CONCEPTOS =====
+        {'tipo': 'parrafo', 'texto': 'CONCEPTOS', 'estilo': 'CustomSubtitle'},
+        {
+            'tipo': 'tabla',
+            'filas': [
+                [{'parrafo': '<b>No</b>', 'estilo': 'CustomNormal'},
+                 {'parrafo': '<b>Concepto</b>', 'estilo': 'CustomNormal'},
+                 {'parrafo': '<b>Monto</b>', 'estilo': 'CustomRight'}],
+                {
+                    'por_cada': '{datos[conceptos]}',
+                    'calculos': {'monto': lambda contexto: float(contexto['item']['monto'])},
+                    'celdas': [
+                        {'parrafo': '{indice!s}', 'estilo': 'CustomNormal'},
+                        {'parrafo': '{item[descripcion]}', 'estilo': 'CustomNormal'},
+                        {'parrafo': '${monto:,.2f}', 'estilo': 'CustomRight'}
+                    ]
+                },
+                # Fila de total
+                [{'parrafo': '', 'estilo': 'CustomNormal'},
+                 {'parrafo': '<b>TOTAL:</b>', 'estilo': 'CustomRight'},
+                 {'parrafo': '<b>${total:,.2f} {configuracion[moneda]}</b>', 'estilo': 'CustomRight'}]
+            ],
+            'anchos': [0.5*inch, 4.5*inch, 2*inch],
+            'estilo': [
+                ('GRID', (0, 0), (-1, -2), 0.5, colors.grey),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3498DB')),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+                ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+                ('ALIGN', (2, 0), (2, -1), 'RIGHT'),
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, 0), 11),
+                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+                ('TOPPADDING', (0, 0), (-1, 0), 12),
+                ('BACKGROUND', (0, 1), (-1, -2), colors.white),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('LEFTPADDING', (0, 0), (-1, -1), 10),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+                ('TOPPADDING', (0, 1), (-1, -2), 8),
+                ('BOTTOMPADDING', (0, 1), (-1, -2), 8),
+                # Fila de total
+                ('BACKGROUND', (1, -1), (-1, -1), colors.HexColor('#ECF0F1')),
+                ('FONTNAME', (1, -1), (-1, -1), 'Helvetica-Bold'),
+                ('FONTSIZE', (1, -1), (-1, -1), 12),
+                ('TOPPADDING', (1, -1), (-1, -1), 10),
+                ('BOTTOMPADDING', (1, -1), (-1, -1), 10),
+                ('LINEABOVE', (1, -1), (-1, -1), 2, colors.HexColor('#2C3E50')),
+            ]
+        },
+        {'tipo': 'espacio', 'alto': 0.3*inch},
+        
+        # ===== DATOS DE LA EMPRESA AL FINAL DE LA HOJA 1 =====
+        {
+            'tipo': 'tabla',
+            'filas': [
+                [{'parrafo': '<b>Datos de la empresa:</b>', 'estilo': 'CustomNormal'}],
+                [{'parrafo': '<b>{empresa[razon_social]}</b>', 'estilo': 'CustomNormal'}],
+                [{'parrafo': 'RFC: {empresa[rfc]}', 'estilo': 'CustomNormal'}],
+                [{'parrafo': '{empresa[direccion]}', 'estilo': 'CustomNormal'}],
+                [{'parrafo': 'Tel: {empresa[telefono]} | Email: {empresa[email]}', 'estilo': 'CustomNormal'}]
+            ],
+            'anchos': [7*inch],
+            'estilo': [
+                ('BACKGROUND', (0, 0), (-1, -1), colors.HexColor('#F8F9FA')),
+                ('BOX', (0, 0), (-1, -1), 1, colors.HexColor('#DEE2E6')),
+                ('LEFTPADDING', (0, 0), (-1, -1), 10),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 10),
+                ('TOPPADDING', (0, 0), (-1, -1), 6),
+                ('BOTTOMPADDING', (0, 0), (-1, -1), 6),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ]
+        },
+        
+        # ===== COMPROBANTES DE PAGO A PARTIR DE LA HOJA 2 =====
+        {'tipo': 'bloque', 'funcion': _bloque_imagenes},
+        
+        # ===== PIE DE PÁGINA =====
+        {'tipo': 'espacio', 'alto': 0.2*inch},
+        {
+            'tipo': 'parrafo',
+            'texto': """
     <para align=center>
     <font size=8 color='grey'>
-    Documento generado el {datetime.now().strftime('%d/%m/%Y a las %H:%M:%S')}<br/>
+    Documento generado el {fecha:%d/%m/%Y a las %H:%M:%S}<br/>
     Este comprobante tiene validez como constancia de pago
     </font>
     </para>
-    """
-    
-    elements.append(Paragraph(pie_texto, styles['Normal']))
-    
-    # Construir PDF
-    doc.build(elements)
-    
-    # Obtener el valor del buffer
-    pdf_bytes = buffer.getvalue()
-    buffer.close()
-    
-    return pdf_bytes
+    """,
+            'estilo': 'Normal'
+        }
+    ]
+}
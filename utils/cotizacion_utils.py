@@ -2,20 +2,33 @@
 Utilidades para generación de cotizaciones en PDF
 """
 import io
-from datetime import datetime, timedelta
+from datetime import timedelta
 from reportlab.lib.pagesizes import letter
 from reportlab.lib import colors
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.enums import TA_CENTER, TA_RIGHT, TA_LEFT
-import os
+from reportlab.lib.enums import TA_CENTER, TA_RIGHT
+from utils.cache_utils import render_con_cache
+from utils.fuente_utils import rutas_fuentes
+from utils.perfil_utils import perfil_activo, perfilado
+from utils.plantilla_utils import Marcado, renderizar_plantilla, dibujar_numero_pagina
+from utils.recursos_utils import obtener_logo
+
+
+# Recuadro del logo en la primera página; el encabezado de las siguientes usa la misma imagen
+TAMANO_LOGO = 1.75*inch
 
 
 def generar_cotizacion_pdf(datos_cotizacion, config):
     """
     Genera un PDF de cotización profesional.
     
+    Si datos_cotizacion incluye 'fecha' (datetime o ISO), el render es determinista:
+    los mismos datos producen los mismos bytes y el PDF se sirve desde la caché
+    (salvo con el perfilado activo, que siempre genera el documento para perfilarlo).
+    
+    Si incluye 'membrete' (ruta a un PNG de membretes/), se dibuja como fondo de
+    cada página en el mismo render.
+    
     Args:
         datos_cotizacion: Dict con los datos de la cotizacion
         config: Configuración del sistema
@@ -23,183 +36,37 @@ def generar_cotizacion_pdf(datos_cotizacion, config):
     Returns:
         bytes: PDF generado
     """
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(
-        buffer,
-        pagesize=letter,
-        rightMargin=0.60*inch,
-        leftMargin=0.60*inch,
-        topMargin=0.01*inch,
-        bottomMargin=0.05*inch
-    )
-    
-    # Contenedor de elementos
-    elements = []
-    
-    # Estilos
-    styles = getSampleStyleSheet()
-    style_title = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.black,
-        spaceAfter=30,
-        alignment=TA_CENTER,
-        fontName='Helvetica-Bold'
-    )
-    
-    style_heading = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=12,
-        textColor=colors.black,
-        spaceAfter=12,
-        fontName='Helvetica-Bold'
-    )
-    
-    style_normal = ParagraphStyle(
-        'CustomNormal',
-        parent=styles['Normal'],
-        fontSize=10,
-        textColor=colors.black,
-        fontName='Helvetica'
-    )
-    
-    style_small = ParagraphStyle(
-        'CustomSmall',
-        parent=styles['Normal'],
-        fontSize=8,
-        textColor=colors.grey,
-        fontName='Helvetica'
-    )
-    
-    # --- ENCABEZADO CON TÍTULO Y LOGO ---
-    empresa = datos_cotizacion['empresa']
-    
-    # Crear tabla con título a la izquierda y logo a la derecha
-    header_data = []
-    
-    # Título de cotización
-    titulo_cotizacion = Paragraph("COTIZACIÓN", style_title)
-    
-    # Logo a la derecha
-    logo_path = empresa.get('logo', '')
-    if logo_path and os.path.exists(logo_path):
-        try:
-            logo = Image(logo_path, width=1.75*inch, height=1.75*inch)
-            header_data.append([titulo_cotizacion, logo])
-        except Exception as e:
-            print(f"Error al cargar logo {logo_path}: {e}")
-            header_data.append([titulo_cotizacion, ""])
-    else:
-        if logo_path:
-            print(f"Archivo de logo no encontrado: {logo_path}")
-        header_data.append([titulo_cotizacion, ""])
-    
-    # Crear tabla con distribución 60% - 40%
-    header_table = Table(header_data, colWidths=[4*inch, 2.5*inch])
-    header_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (0, 0), 'LEFT'),
-        ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 0),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-    ]))
-    
-    elements.append(header_table)
-    elements.append(Spacer(1, 0.005*inch))
-    
-    # --- INFORMACIÓN DE LA COTIZACIÓN ---
-    fecha_actual = datetime.now()
-    fecha_validez = fecha_actual + timedelta(days=config['configuracion']['validez_cotizacion_dias'])
-    
-    info_data = [
-        ['Folio:', datos_cotizacion['folio']],
-        ['Fecha:', fecha_actual.strftime('%d/%m/%Y'), 'Cotización válida hasta el:', fecha_validez.strftime('%d/%m/%Y')]
-    ]
-    
-    info_table = Table(info_data, colWidths=[0.9*inch, 2.06*inch, 2.06*inch, 2.06*inch])
-    info_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTNAME', (2, 1), (2, 1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('BACKGROUND', (2, 1), (2, 1), colors.lightgrey),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 5),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 5),
-        ('SPAN', (1, 0), (3, 0)),
-    ]))
-    
-    elements.append(info_table)
-    elements.append(Spacer(1, 0.35*inch))
-    
-    # --- DATOS DEL CLIENTE ---
-    cliente = datos_cotizacion['cliente']
-    
-    cliente_data = [
-        ['Cliente:', cliente.get('nombre', '')],
-        ['Empresa:', cliente.get('empresa', '')],
-        ['Dirección:', cliente.get('direccion', '')],
-        ['Teléfono:', cliente.get('telefono', '')],
-        ['Email:', cliente.get('email', '')]
-    ]
-    
-    cliente_table = Table(cliente_data, colWidths=[0.9*inch, 6.2*inch])
-    cliente_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 5),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 5),
-    ]))
+    # Un acierto de caché no generaría nada que perfilar
+    if datos_cotizacion.get('fecha') and not perfil_activo():
+        logo_path = datos_cotizacion['empresa'].get('logo', '')
+        archivos = [logo_path, datos_cotizacion.get('membrete')] + rutas_fuentes(datos_cotizacion['empresa'])
+        return render_con_cache('cotizacion', datos_cotizacion, config, _construir_cotizacion_pdf,
+                                archivos=archivos)
+    
+    return _construir_cotizacion_pdf(datos_cotizacion, config)
+
+
+@perfilado('cotizacion')
+def _construir_cotizacion_pdf(datos_cotizacion, config):
+    """Construye el PDF de la cotización a partir de su plantilla (sin caché)"""
+    return renderizar_plantilla(PLANTILLA_COTIZACION, datos_cotizacion, config)
+
+
+def calcular_totales_cotizacion(datos_cotizacion, config):
+    """
+    Calcula subtotal, descuento, IVA y total de una cotización.
     
-    elements.append(cliente_table)
-    elements.append(Spacer(1, 0.35*inch))
+    Args:
+        datos_cotizacion: Dict con los datos de la cotizacion
+        config: Configuración del sistema
         
-    # Encabezados de la tabla
-    productos_data = [['Código', 'Descripción', 'Cantidad', '$ Unit.', 'Subtotal']]
-    
-    # Agregar productos
+    Returns:
+        dict: {'subtotal', 'descuento', 'iva', 'total'}
+    """
     subtotal_general = 0
     for item in datos_cotizacion['items']:
-        codigo = item['codigo']
-        descripcion = item['descripcion']
-        cantidad = item['cantidad']
-        precio_unitario = item['precio_unitario']
-        subtotal = cantidad * precio_unitario
-        subtotal_general += subtotal
-        
-        productos_data.append([
-            codigo,
-            descripcion,
-            str(cantidad),
-            f"${precio_unitario:,.2f}",
-            f"${subtotal:,.2f}"
-        ])
+        subtotal_general += item['cantidad'] * item['precio_unitario']
     
-    productos_table = Table(productos_data, colWidths=[0.8*inch, 3.8*inch, 0.7*inch, 0.9*inch, 0.9*inch])
-    productos_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('BACKGROUND', (0, 0), (-1, 0), colors.black),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
-        ('ALIGN', (0, 0), (0, -1), 'LEFT'),
-        ('ALIGN', (1, 0), (1, -1), 'LEFT'),
-        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f0f0')]),
-        ('LEFTPADDING', (0, 0), (-1, -1), 5),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 5),
-    ]))
-    
-    elements.append(productos_table)
-    elements.append(Spacer(1, 0.05*inch))
-    
-    # --- TOTALES ---
     # Calcular descuento
     descuento_valor = 0
     descuento_config = datos_cotizacion.get('descuento', {})
@@ -217,78 +84,259 @@ def generar_cotizacion_pdf(datos_cotizacion, config):
     iva = subtotal_con_descuento * config['configuracion']['iva']
     total = subtotal_con_descuento + iva
     
-    totales_data = [
-        ['Subtotal:', f"${subtotal_general:,.2f}"]
-    ]
+    return {
+        'subtotal': subtotal_general,
+        'descuento': descuento_valor,
+        'iva': iva,
+        'total': total
+    }
+
+
+def _logo_encabezado(contexto):
+    """Logo de la primera página como ImageReader, decodificado una sola vez por documento"""
+    from reportlab.lib.utils import ImageReader
     
-    if descuento_valor > 0:
-        tipo_desc = descuento_config.get('tipo', 'Porcentaje')
-        valor_desc = descuento_config.get('valor', 0)
+    ruta = contexto['empresa']['logo']
+    contenido = obtener_logo(ruta, TAMANO_LOGO, TAMANO_LOGO) if ruta else None
+    return ImageReader(io.BytesIO(contenido)) if contenido else None
+
+
+def _encabezado_cotizacion(canvas, doc, contexto):
+    """Encabezado de las páginas 2 en adelante: logo, título, folio, fecha y cliente"""
+    ancho, alto = doc.pagesize
+    izquierda, derecha = doc.leftMargin, ancho - doc.rightMargin
+    fuentes = contexto['fuentes']
+    
+    canvas.saveState()
+    x_texto = izquierda
+    if contexto['logo_encabezado']:
+        # Los mismos bytes que el logo de la primera página: el PDF guarda la imagen una vez
+        canvas.drawImage(contexto['logo_encabezado'], izquierda, alto - 0.85*inch, width=0.6*inch, height=0.6*inch,
+                         preserveAspectRatio=True, mask='auto')
+        x_texto = izquierda + 0.75*inch
+    
+    canvas.setFont(fuentes['negrita'], 14)
+    canvas.drawString(x_texto, alto - 0.5*inch, "COTIZACIÓN")
+    canvas.setFont(fuentes['normal'], 9)
+    canvas.drawString(x_texto, alto - 0.7*inch, f"Folio: {contexto['datos']['folio']}")
+    canvas.drawRightString(derecha, alto - 0.5*inch, f"Fecha: {contexto['fecha']:%d/%m/%Y}")
+    canvas.drawRightString(derecha, alto - 0.7*inch, contexto['cliente']['nombre'])
+    
+    canvas.setStrokeColor(colors.grey)
+    canvas.setLineWidth(0.5)
+    canvas.line(izquierda, alto - 0.95*inch, derecha, alto - 0.95*inch)
+    canvas.restoreState()
+
+
+def _pie_cotizacion(canvas, doc, contexto):
+    """Pie de todas las páginas: página X de Y y empresa emisora"""
+    ancho, _ = doc.pagesize
+    fuentes = contexto['fuentes']
+    
+    canvas.saveState()
+    canvas.setFillColor(colors.grey)
+    dibujar_numero_pagina(canvas, doc.leftMargin, 0.3*inch, fuentes['normal'], 8)
+    canvas.setFont(fuentes['normal'], 8)
+    canvas.drawRightString(ancho - doc.rightMargin, 0.3*inch,
+                           f"{contexto['empresa']['razon_social']} · Cotización {contexto['datos']['folio']}")
+    canvas.restoreState()
+
+
+def _etiqueta_descuento(contexto):
+    """Etiqueta de la fila de descuento: con el porcentaje o solo 'Descuento:'"""
+    descuento_config = contexto['datos'].get('descuento', {})
+    if descuento_config.get('tipo', 'Porcentaje') == 'Porcentaje':
+        return f"Descuento ({descuento_config.get('valor', 0)}%):"
+    return "Descuento:"
+
+
+# Plantilla de la cotización (ver utils/plantilla_utils.py)
+PLANTILLA_COTIZACION = {
+    'nombre': 'cotizacion',
+    'titulo': 'Cotización {datos[folio]}',
+    'pagina': {
+        'tamano': letter,
+        # Abajo queda lugar para el pie; en las páginas siguientes, arriba para el encabezado
+        'margenes': (0.01*inch, 0.60*inch, 0.5*inch, 0.60*inch),
+        'margenes_siguientes': (1.05*inch, 0.60*inch, 0.5*inch, 0.60*inch),
+        'encabezado': _encabezado_cotizacion,
+        'pie': _pie_cotizacion
+    },
+    'estilos': {
+        'CustomTitle': {
+            'parent': 'Heading1',
+            'fontSize': 24,
+            'textColor': colors.black,
+            'spaceAfter': 30,
+            'alignment': TA_CENTER,
+            'fontName': 'Helvetica-Bold'
+        },
+        'CustomSmall': {
+            'fontSize': 8,
+            'textColor': colors.grey,
+            'fontName': 'Helvetica'
+        },
+        'CustomEmpresa': {
+            'fontSize': 9,
+            'textColor': colors.black,
+            'fontName': 'Helvetica',
+            'alignment': TA_RIGHT
+        }
+    },
+    'calculos': {
+        'totales': lambda contexto: calcular_totales_cotizacion(contexto['datos'], contexto['config']),
+        'fecha_validez': lambda contexto: contexto['fecha'] + timedelta(
+            days=contexto['configuracion']['validez_cotizacion_dias']),
+        'etiqueta_descuento': _etiqueta_descuento,
+        'iva_porcentaje': lambda contexto: contexto['configuracion']['iva'] * 100,
+        # Los términos vienen de la configuración y pueden llevar marcado (<b>); solo se agregan los saltos
+        'terminos': lambda contexto: Marcado(contexto['configuracion']['terminos_condiciones'].replace('\n', '<br/>')),
+        'logo_encabezado': _logo_encabezado
+    },
+    'secciones': [
+        # --- ENCABEZADO CON TÍTULO Y LOGO ---
+        {
+            'tipo': 'tabla',
+            'filas': [[
+                {'parrafo': 'COTIZACIÓN', 'estilo': 'CustomTitle'},
+                {'imagen': '{empresa[logo]}', 'ancho': TAMANO_LOGO, 'alto': TAMANO_LOGO}
+            ]],
+            # Distribución 60% - 40%
+            'anchos': [4*inch, 2.5*inch],
+            'estilo': [
+                ('ALIGN', (0, 0), (0, 0), 'LEFT'),
+                ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+                ('LEFTPADDING', (0, 0), (-1, -1), 0),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+            ]
+        },
+        {'tipo': 'espacio', 'alto': 0.005*inch},
         
-        if tipo_desc == 'Porcentaje':
-            desc_label = f"Descuento ({valor_desc}%):"
-        else:
-            desc_label = "Descuento:"
+        # --- INFORMACIÓN DE LA COTIZACIÓN ---
+        {
+            'tipo': 'tabla',
+            'filas': [
+                ['Folio:', '{datos[folio]}'],
+                ['Fecha:', '{fecha:%d/%m/%Y}', 'Cotización válida hasta el:', '{fecha_validez:%d/%m/%Y}']
+            ],
+            'anchos': [0.9*inch, 2.06*inch, 2.06*inch, 2.06*inch],
+            'estilo': [
+                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                ('FONTNAME', (2, 1), (2, 1), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+                ('BACKGROUND', (2, 1), (2, 1), colors.lightgrey),
+                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+                ('LEFTPADDING', (0, 0), (-1, -1), 5),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 5),
+                ('SPAN', (1, 0), (3, 0)),
+            ]
+        },
+        {'tipo': 'espacio', 'alto': 0.35*inch},
         
-        totales_data.append([desc_label, f"-${descuento_valor:,.2f}"])
-    
-    totales_data.extend([
-        [f"IVA ({config['configuracion']['iva']*100:.0f}%):", f"${iva:,.2f}"],
-        ['TOTAL:', f"${total:,.2f}"]
-    ])
-    
-    totales_table = Table(totales_data, colWidths=[4.8*inch, 1.7*inch])
-    totales_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (0, -2), 'Helvetica-Bold'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -2), 10),
-        ('FONTSIZE', (0, -1), (-1, -1), 12),
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
-        ('LEFTPADDING', (0, 0), (-1, -1), 5),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 5),
-    ]))
-
-    elements.append(totales_table)
-    elements.append(Spacer(1, 0.5*inch))
-    
-    # --- TÉRMINOS Y CONDICIONES Y DATOS DE EMPRESA EN COLUMNAS ---
-    # Estilo para datos de empresa alineados a la derecha
-    style_empresa = ParagraphStyle(
-        'CustomEmpresa',
-        parent=styles['Normal'],
-        fontSize=9,
-        textColor=colors.black,
-        fontName='Helvetica',
-        alignment=TA_RIGHT
-    )
-    
-    # Crear párrafo de términos y condiciones (40% del ancho)
-    terminos_text = config['configuracion']['terminos_condiciones'].replace('\n', '<br/>')
-    terminos_para = Paragraph(f"<b>TÉRMINOS Y CONDICIONES</b><br/><br/>{terminos_text}", style_small)
-    
-    # Crear párrafo de datos de empresa (60% del ancho)
-    empresa_text = (f"<b>{empresa['razon_social']}</b><br/>"
-                   f"RFC: {empresa['rfc']}<br/>"
-                   f"{empresa['direccion']}<br/>"
-                   f"Tel: {empresa['telefono']}<br/>"
-                   f"Email: {empresa['email']}")
-    empresa_para = Paragraph(empresa_text, style_empresa)
-    
-    # Tabla con dos columnas: 40% términos, 60% datos empresa
-    footer_data = [[terminos_para, empresa_para]]
-    footer_table = Table(footer_data, colWidths=[3*inch, 4*inch])
-    footer_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (0, -1), 0),
-        ('RIGHTPADDING', (1, 0), (1, -1), 0),
-        ('LEFTPADDING', (1, 0), (1, -1), 10),
-    ]))
-    
-    elements.append(footer_table)
-    
-    # Construir PDF
-    doc.build(elements)
-    buffer.seek(0)
-    
-    return buffer.getvalue()
+        # --- DATOS DEL CLIENTE ---
+        {
+            'tipo': 'tabla',
+            'filas': [
+                ['Cliente:', '{cliente[nombre]}'],
+                ['Empresa:', '{cliente[empresa]}'],
+                ['Dirección:', '{cliente[direccion]}'],
+                ['Teléfono:', '{cliente[telefono]}'],
+                ['Email:', '{cliente[email]}']
+            ],
+            'anchos': [0.9*inch, 6.2*inch],
+            'estilo': [
+                ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('BACKGROUND', (0, 0), (0, -1), colors.lightgrey),
+                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+                ('LEFTPADDING', (0, 0), (-1, -1), 5),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 5),
+            ]
+        },
+        {'tipo': 'espacio', 'alto': 0.35*inch},
+        
+        # --- PRODUCTOS ---
+        {
+            'tipo': 'tabla',
+            'filas': [
+                ['Código', 'Descripción', 'Cantidad', '$ Unit.', 'Subtotal'],
+                {
+                    'por_cada': '{datos[items]}',
+                    'calculos': {
+                        'subtotal': lambda contexto: contexto['item']['cantidad'] * contexto['item']['precio_unitario']
+                    },
+                    'celdas': ['{item[codigo]}', '{item[descripcion]}', '{item[cantidad]!s}',
+                               '${item[precio_unitario]:,.2f}', '${subtotal:,.2f}']
+                }
+            ],
+            'anchos': [0.8*inch, 3.8*inch, 0.7*inch, 0.9*inch, 0.9*inch],
+            'estilo': [
+                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -1), 9),
+                ('BACKGROUND', (0, 0), (-1, 0), colors.black),
+                ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+                ('ALIGN', (0, 0), (0, -1), 'LEFT'),
+                ('ALIGN', (1, 0), (1, -1), 'LEFT'),
+                ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+                ('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f0f0f0')]),
+                ('LEFTPADDING', (0, 0), (-1, -1), 5),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 5),
+            ]
+        },
+        {'tipo': 'espacio', 'alto': 0.05*inch},
+        
+        # --- TOTALES ---
+        {
+            'tipo': 'tabla',
+            'filas': [
+                ['Subtotal:', '${totales[subtotal]:,.2f}'],
+                {
+                    'si': lambda contexto: contexto['totales']['descuento'] > 0,
+                    'celdas': ['{etiqueta_descuento}', '-${totales[descuento]:,.2f}']
+                },
+                ['IVA ({iva_porcentaje:.0f}%):', '${totales[iva]:,.2f}'],
+                ['TOTAL:', '${totales[total]:,.2f}']
+            ],
+            'anchos': [4.8*inch, 1.7*inch],
+            'estilo': [
+                ('FONTNAME', (0, 0), (0, -2), 'Helvetica-Bold'),
+                ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+                ('FONTSIZE', (0, 0), (-1, -2), 10),
+                ('FONTSIZE', (0, -1), (-1, -1), 12),
+                ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+                ('LINEABOVE', (0, -1), (-1, -1), 1, colors.black),
+                ('LEFTPADDING', (0, 0), (-1, -1), 5),
+                ('RIGHTPADDING', (0, 0), (-1, -1), 5),
+            ]
+        },
+        {'tipo': 'espacio', 'alto': 0.5*inch},
+        
+        # --- TÉRMINOS Y CONDICIONES Y DATOS DE EMPRESA EN COLUMNAS ---
+        {
+            'tipo': 'tabla',
+            'filas': [[
+                {'parrafo': '<b>TÉRMINOS Y CONDICIONES</b><br/><br/>{terminos}', 'estilo': 'CustomSmall'},
+                {
+                    'parrafo': ('<b>{empresa[razon_social]}</b><br/>'
+                                'RFC: {empresa[rfc]}<br/>'
+                                '{empresa[direccion]}<br/>'
+                                'Tel: {empresa[telefono]}<br/>'
+                                'Email: {empresa[email]}'),
+                    'estilo': 'CustomEmpresa'
+                }
+            ]],
+            'anchos': [3*inch, 4*inch],
+            'estilo': [
+                ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+                ('LEFTPADDING', (0, 0), (0, -1), 0),
+                ('RIGHTPADDING', (1, 0), (1, -1), 0),
+                ('LEFTPADDING', (1, 0), (1, -1), 10),
+            ]
+        }
+    ]
+}
@@ -0,0 +1,471 @@
+"""
+Envío por correo de los documentos generados al cliente (cliente['email'])
+
+Los documentos se toman del archivo local (buscar_documentos) y se envían con el
+PDF adjunto:
+- Cada hilo de envío abre una sola conexión SMTP (con STARTTLS y login) y la
+  reutiliza para todos sus mensajes; solo se reconecta si el servidor la cierra o
+  al llegar a MENSAJES_POR_CONEXION.
+- Un límite compartido por todos los hilos (mensajes por minuto) evita que el
+  servidor rechace el lote por exceso de envíos.
+- Los errores temporales (conexión perdida, respuestas 4xx) se reintentan con
+  espera creciente; los permanentes (5xx, dirección rechazada) no. Si no se puede
+  conectar o iniciar sesión se cancela el resto del lote.
+- Cada envío queda en la tabla envios del archivo (la escribe cada hilo al
+  terminar un mensaje): al repetir un lote, los documentos ya enviados a ese
+  correo se omiten.
+
+Configuración en data/config.json (la contraseña se lee de la variable de
+entorno DOCUMENTADOR_SMTP_CONTRASENA):
+
+    "smtp": {"servidor": "smtp.ejemplo.com", "puerto": 587, "seguridad": "starttls",
+             "usuario": "cobranza@ejemplo.com", "remitente": "Cobranza <cobranza@ejemplo.com>",
+             "conexiones": 4, "por_minuto": 300}
+"""
+import os
+import queue
+import re
+import smtplib
+import ssl
+import threading
+import time
+from datetime import datetime
+
+from utils.archivo_utils import leer_pdf_archivado, obtener_conexion
+from utils.metricas_utils import medir, registrar_cache
+from utils.recursos_utils import SEGURIDAD_SMTP as SEGURIDAD
+
+
+VARIABLE_CONTRASENA = "DOCUMENTADOR_SMTP_CONTRASENA"
+
+# Puerto por omisión de cada seguridad (ver recursos_utils.SEGURIDAD_SMTP)
+PUERTOS = {'starttls': 587, 'ssl': 465, 'ninguna': 25}
+
+# Hilos de envío (una conexión SMTP cada uno) y mensajes por minuto entre todos
+CONEXIONES = 4
+POR_MINUTO = 300
+
+# Muchos servidores cierran la sesión después de cierto número de mensajes
+MENSAJES_POR_CONEXION = 500
+
+# Reintentos de un mensaje con error temporal; la espera se duplica en cada uno
+REINTENTOS = 3
+ESPERA_REINTENTO = 2.0
+
+# Segundos de espera de cada operación con el servidor
+TIEMPO_ESPERA = 30
+
+COLUMNAS_RESUMEN = ['folio', 'tipo', 'cliente', 'email', 'estado', 'intentos', 'error']
+
+_PATRON_CORREO = re.compile(r"[^@\s,;<>]+@[^@\s,;<>]+\.[^@\s,;<>]+")
+
+
+def obtener_config_smtp(config):
+    """
+    Obtiene la configuración del servidor de correo con sus valores por omisión.
+
+    Args:
+        config: Configuración del sistema
+
+    Returns:
+        dict: Sección 'smtp' completa (con 'contrasena' de la variable de entorno)
+
+    Raises:
+        ValueError: Si falta la sección 'smtp', no tiene servidor y remitente o la seguridad no es válida
+    """
+    smtp = (config or {}).get('smtp')
+    if not isinstance(smtp, dict) or not smtp.get('servidor') or not smtp.get('remitente'):
+        raise ValueError("Configura 'smtp' (servidor y remitente) en data/config.json para enviar por correo")
+
+    seguridad = smtp.get('seguridad', 'starttls')
+    if seguridad not in SEGURIDAD:
+        raise ValueError(f"smtp.seguridad debe ser {', '.join(SEGURIDAD)}")
+    return {
+        'servidor': smtp['servidor'],
+        'puerto': smtp.get('puerto', PUERTOS.get(seguridad, 587)),
+        'seguridad': seguridad,
+        'usuario': smtp.get('usuario', ''),
+        'contrasena': os.environ.get(VARIABLE_CONTRASENA, ''),
+        'remitente': smtp['remitente'],
+        'conexiones': smtp.get('conexiones', CONEXIONES),
+        'por_minuto': smtp.get('por_minuto', POR_MINUTO)
+    }
+
+
+def enviar_documentos(documentos, config, conexiones=None, por_minuto=None, reenviar=False, progreso=None):
+    """
+    Envía cada documento al correo de su cliente.
+
+    Se omiten los documentos sin correo y los que ya se enviaron a ese correo
+    (salvo con reenviar). Los PDFs se leen del archivo al armar cada mensaje.
+
+    Args:
+        documentos: Lista de dicts de buscar_documentos
+        config: Configuración del sistema (sección 'smtp')
+        conexiones: Hilos de envío, cada uno con su conexión (por omisión, smtp.conexiones)
+        por_minuto: Máximo de mensajes por minuto entre todos los hilos; 0 sin límite
+            (por omisión, smtp.por_minuto)
+        reenviar: Si es True, también se envían los documentos ya enviados
+        progreso: Función opcional (terminados, total) que se llama tras cada documento
+
+    Returns:
+        dict: {'total', 'enviados', 'omitidos', 'errores', 'segundos', 'filas': resumen por documento}
+
+    Raises:
+        ValueError: Si la configuración de correo no está completa
+    """
+    smtp = obtener_config_smtp(config)
+    # Sin al menos un hilo nadie vaciaría la cola y la espera de resultados no terminaría
+    conexiones = max(1, conexiones or smtp['conexiones'])
+    por_minuto = smtp['por_minuto'] if por_minuto is None else por_minuto
+
+    inicio = time.perf_counter()
+    total = len(documentos)
+    ya_enviados = set() if reenviar else consultar_enviados([documento['id'] for documento in documentos])
+    filas = []
+    pendientes = queue.Queue()
+
+    for indice, documento in enumerate(documentos):
+        email = (documento.get('cliente_email') or '').strip()
+        filas.append({
+            'folio': documento['folio'],
+            'tipo': documento['tipo'],
+            'cliente': documento['cliente_nombre'],
+            'email': email,
+            'estado': 'omitido',
+            'intentos': 0,
+            'error': ''
+        })
+        if not email:
+            filas[-1]['error'] = "El cliente no tiene correo"
+        elif not _PATRON_CORREO.fullmatch(email):
+            filas[-1].update(estado='error', error=f"Correo no válido: {email}")
+        elif (documento['id'], email.lower()) in ya_enviados:
+            filas[-1]['error'] = "Ya se había enviado"
+        else:
+            pendientes.put(indice)
+
+    por_enviar = pendientes.qsize()
+    terminados = total - por_enviar
+    if progreso and terminados:
+        progreso(terminados, total)
+
+    resultados = queue.Queue()
+    limitador = _crear_limitador(por_minuto)
+    cancelacion = {'motivo': ''}
+    hilos = [
+        threading.Thread(target=_trabajador, args=(smtp, documentos, pendientes, resultados, limitador, cancelacion),
+                         daemon=True)
+        for _ in range(min(conexiones, por_enviar))
+    ]
+    for hilo in hilos:
+        hilo.start()
+
+    for _ in range(por_enviar):
+        indice, estado, intentos, error = resultados.get()
+        filas[indice].update(estado=estado, intentos=intentos, error=error)
+        terminados += 1
+        if progreso:
+            progreso(terminados, total)
+
+    for hilo in hilos:
+        hilo.join()
+
+    enviados = sum(1 for fila in filas if fila['estado'] == 'enviado')
+    omitidos = sum(1 for fila in filas if fila['estado'] == 'omitido')
+    return {
+        'total': total,
+        'enviados': enviados,
+        'omitidos': omitidos,
+        'errores': total - enviados - omitidos,
+        'segundos': time.perf_counter() - inicio,
+        'filas': filas
+    }
+
+
+def consultar_enviados(documento_ids):
+    """
+    Busca qué documentos ya se enviaron.
+
+    Args:
+        documento_ids: IDs de documentos del archivo
+
+    Returns:
+        set: Pares (documento_id, correo en minúsculas) enviados correctamente
+    """
+    documento_ids = list(documento_ids)
+    enviados = set()
+    conexion = obtener_conexion()
+    # SQLite limita el número de parámetros de una consulta
+    for inicio in range(0, len(documento_ids), 500):
+        bloque = documento_ids[inicio:inicio + 500]
+        filas = conexion.execute(
+            f"""SELECT documento_id, destinatario FROM envios
+                WHERE estado = 'enviado' AND documento_id IN ({', '.join('?' * len(bloque))})""",
+            bloque
+        ).fetchall()
+        enviados.update((fila['documento_id'], fila['destinatario'].lower()) for fila in filas)
+    return enviados
+
+
+def consultar_envios(documento_id):
+    """
+    Historial de envíos de un documento.
+
+    Args:
+        documento_id: ID del documento en el archivo
+
+    Returns:
+        list: Dicts {'destinatario', 'estado', 'intentos', 'error', 'creado'}, más recientes primero
+    """
+    filas = obtener_conexion().execute(
+        """SELECT destinatario, estado, intentos, error, creado FROM envios
+           WHERE documento_id = ? ORDER BY id DESC""",
+        (documento_id,)
+    ).fetchall()
+    return [dict(fila) for fila in filas]
+
+
+def armar_mensaje(documento, remitente):
+    """
+    Arma el correo de un documento con el PDF adjunto.
+
+    Args:
+        documento: Dict de buscar_documentos
+        remitente: Dirección del remitente (From)
+
+    Returns:
+        email.message.EmailMessage: Mensaje listo para enviar
+
+    Raises:
+        OSError: Si no se encuentra el PDF archivado
+    """
+    from email.message import EmailMessage
+    from email.utils import formatdate, make_msgid
+
+    if documento['tipo'] == 'cotizacion':
+        nombre_tipo, articulo, prefijo = "Cotización", "la cotización", "Cotizacion"
+    else:
+        nombre_tipo, articulo, prefijo = "Comprobante de pago", "el comprobante de pago", "Comprobante"
+
+    mensaje = EmailMessage()
+    mensaje['From'] = remitente
+    mensaje['To'] = documento['cliente_email'].strip()
+    mensaje['Subject'] = f"{nombre_tipo} {documento['folio']} - {documento['empresa']}"
+    mensaje['Date'] = formatdate(localtime=True)
+    mensaje['Message-ID'] = make_msgid()
+    mensaje.set_content(
+        f"Hola {documento['cliente_nombre']},\n\n"
+        f"Adjuntamos {articulo} {documento['folio']}.\n\n"
+        f"Saludos,\n{documento['empresa']}\n"
+    )
+    mensaje.add_attachment(
+        leer_pdf_archivado(documento),
+        maintype='application',
+        subtype='pdf',
+        filename=f"{prefijo}_{documento['folio']}_{documento['fecha'][:10].replace('-', '')}.pdf"
+    )
+    return mensaje
+
+
+def _trabajador(smtp, documentos, pendientes, resultados, limitador, cancelacion):
+    """
+    Hilo de envío: toma documentos de la cola y los envía por su propia conexión.
+
+    Cada hilo escribe su parte de la bitácora: si quien llamó deja de esperar (por
+    ejemplo, Streamlit interrumpe la ejecución) los mensajes enviados quedan registrados.
+    """
+    conexion = {'cliente': None, 'mensajes': 0}
+    bitacora = obtener_conexion()
+    try:
+        while True:
+            try:
+                indice = pendientes.get_nowait()
+            except queue.Empty:
+                return
+            documento = documentos[indice]
+            inicio = time.perf_counter()
+            try:
+                estado, intentos, error = _enviar_documento(smtp, documento, conexion, limitador, cancelacion)
+            except Exception as e:
+                estado, intentos, error = 'error', 0, str(e)
+            with bitacora:
+                bitacora.execute(
+                    """INSERT INTO envios (documento_id, destinatario, estado, intentos, error, segundos, creado)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    (documento['id'], documento['cliente_email'].strip(), estado, intentos, error,
+                     round(time.perf_counter() - inicio, 3), datetime.now().isoformat(timespec='seconds'))
+                )
+            resultados.put((indice, estado, intentos, error))
+    finally:
+        _cerrar(conexion)
+
+
+def _enviar_documento(smtp, documento, conexion, limitador, cancelacion):
+    """Envía un documento con reintentos; devuelve (estado, intentos, error)"""
+    try:
+        mensaje = armar_mensaje(documento, smtp['remitente'])
+    except OSError as e:
+        return 'error', 0, f"No se encontró el PDF archivado: {e}"
+
+    for intento in range(1, REINTENTOS + 2):
+        if cancelacion['motivo']:
+            return 'error', intento - 1, cancelacion['motivo']
+
+        limitador()
+        conectando = conexion['cliente'] is None or conexion['mensajes'] >= MENSAJES_POR_CONEXION
+        try:
+            if conectando:
+                _conectar(conexion, smtp)
+            registrar_cache('conexion_smtp', not conectando)
+            conectando = False
+            with medir('envio_correo'):
+                _enviar(conexion, mensaje)
+        except Exception as e:
+            error = _describir_error(e)
+            if not _es_temporal(e) or intento > REINTENTOS:
+                if conectando:
+                    # Sin conexión o sin sesión, el resto del lote fallaría igual
+                    error = f"No se pudo conectar al servidor de correo: {error}"
+                    cancelacion['motivo'] = error
+                return 'error', intento, error
+            time.sleep(ESPERA_REINTENTO * 2 ** (intento - 1))
+        else:
+            return 'enviado', intento, ''
+
+
+def _conectar(conexion, smtp):
+    """Abre (o reabre) la conexión del hilo e inicia sesión"""
+    _cerrar(conexion)
+    if smtp['seguridad'] == 'ssl':
+        cliente = smtplib.SMTP_SSL(smtp['servidor'], smtp['puerto'], timeout=TIEMPO_ESPERA,
+                                   context=ssl.create_default_context())
+    else:
+        cliente = smtplib.SMTP(smtp['servidor'], smtp['puerto'], timeout=TIEMPO_ESPERA)
+    try:
+        if smtp['seguridad'] == 'starttls':
+            cliente.starttls(context=ssl.create_default_context())
+        if smtp['usuario']:
+            cliente.login(smtp['usuario'], smtp['contrasena'])
+    except Exception:
+        cliente.close()
+        raise
+    conexion['cliente'] = cliente
+    conexion['mensajes'] = 0
+
+
+def _enviar(conexion, mensaje):
+    """Envía un mensaje por la conexión abierta"""
+    cliente = conexion['cliente']
+    try:
+        cliente.send_message(mensaje)
+    except (smtplib.SMTPResponseException, smtplib.SMTPRecipientsRefused):
+        # El servidor rechazó el mensaje pero la sesión sigue (smtplib envía RSET),
+        # salvo con 421: el servidor cierra y smtplib también
+        if cliente.sock is None:
+            conexion['cliente'] = None
+        raise
+    except Exception:
+        _cerrar(conexion)
+        raise
+    conexion['mensajes'] += 1
+
+
+def _cerrar(conexion):
+    """Cierra la conexión del hilo (QUIT), sin fallar si ya estaba cerrada"""
+    cliente = conexion['cliente']
+    conexion['cliente'] = None
+    if cliente is None:
+        return
+    try:
+        cliente.quit()
+    except Exception:
+        cliente.close()
+
+
+def _es_temporal(error):
+    """True si el error puede resolverse reintentando (conexión perdida o respuesta 4xx)"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= codigo < 500 for codigo, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPServerDisconnected):
+        return True
+    # SMTPException hereda de OSError: el resto son errores de red (tiempo agotado, conexión rechazada)
+    return isinstance(error, OSError) and not isinstance(error, (smtplib.SMTPException, ssl.SSLError))
+
+
+def _describir_error(error):
+    """Texto de un error de envío para el resumen y la bitácora"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        codigo, respuesta = next(iter(error.recipients.values()))
+        return f"{codigo} {respuesta.decode('utf-8', 'replace')}"
+    if isinstance(error, smtplib.SMTPResponseException):
+        respuesta = error.smtp_error
+        if isinstance(respuesta, bytes):
+            respuesta = respuesta.decode('utf-8', 'replace')
+        return f"{error.smtp_code} {respuesta}"
+    return str(error) or type(error).__name__
+
+
+def _crear_limitador(por_minuto):
+    """Función que espera el turno del siguiente mensaje (compartida por todos los hilos)"""
+    if not por_minuto:
+        return lambda: None
+
+    intervalo = 60 / por_minuto
+    estado = {'siguiente': time.monotonic()}
+    lock = threading.Lock()
+
+    def esperar():
+        with lock:
+            ahora = time.monotonic()
+            turno = max(ahora, estado['siguiente'])
+            estado['siguiente'] = turno + intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+    return esperar
+
+
+if __name__ == "__main__":
+    import argparse
+    from datetime import date
+
+    from utils.archivo_utils import buscar_documentos
+    from utils.recursos_utils import obtener_configuracion
+
+    parser = argparse.ArgumentParser(description="Envía por correo documentos del archivo a sus clientes")
+    parser.add_argument("--tipo", choices=["cotizacion", "comprobante"])
+    parser.add_argument("--folio", help="Folio o prefijo")
+    parser.add_argument("--empresa", help="Nombre exacto de la división")
+    parser.add_argument("--desde", type=date.fromisoformat, help="Fecha inicial (AAAA-MM-DD)")
+    parser.add_argument("--hasta", type=date.fromisoformat, help="Fecha final (AAAA-MM-DD)")
+    parser.add_argument("--limite", type=int, default=1000, help="Máximo de documentos")
+    parser.add_argument("--conexiones", type=int, help="Conexiones SMTP simultáneas")
+    parser.add_argument("--por-minuto", type=int, help="Máximo de mensajes por minuto (0 sin límite)")
+    parser.add_argument("--reenviar", action="store_true", help="Envía también los documentos ya enviados")
+    argumentos = parser.parse_args()
+
+    config_envio = obtener_configuracion()
+    if config_envio is None:
+        parser.error("No se pudo cargar data/config.json")
+
+    seleccion = buscar_documentos(folio=argumentos.folio, empresa=argumentos.empresa, tipo=argumentos.tipo,
+                                  desde=argumentos.desde, hasta=argumentos.hasta, limite=argumentos.limite)
+    try:
+        resultado = enviar_documentos(
+            seleccion, config_envio,
+            conexiones=argumentos.conexiones,
+            por_minuto=argumentos.por_minuto,
+            reenviar=argumentos.reenviar,
+            progreso=lambda hechos, total: print(f"\r{hechos}/{total}", end='', flush=True)
+        )
+    except ValueError as e:
+        parser.error(str(e))
+
+    print(f"\nEnviados: {resultado['enviados']}  Omitidos: {resultado['omitidos']}  "
+          f"Errores: {resultado['errores']}  Tiempo: {resultado['segundos']:.1f} s")
+    for fila in resultado['filas']:
+        if fila['estado'] == 'error':
+            print(f"  {fila['folio']} <{fila['email']}>: {fila['error']}")
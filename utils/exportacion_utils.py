@@ -0,0 +1,270 @@
+"""
+Exportación de documentos PDF como imágenes (PNG, JPEG o WebP)
+
+Para enviar cotizaciones, comprobantes y documentos con membrete por WhatsApp y
+otras aplicaciones de mensajería, donde las imágenes se ven sin abrirlas:
+- Cada página se rasteriza con pypdfium2 (opcional: sin él no hay exportación)
+  a la resolución indicada.
+- Con varias páginas el trabajo se reparte entre procesos (PDFium no admite
+  llamadas simultáneas dentro de un proceso): cada proceso abre el PDF una vez,
+  rasteriza un bloque de páginas consecutivas y las codifica.
+- Un documento de varias páginas se entrega como ZIP (una imagen por página) o
+  como una sola imagen larga (las páginas una debajo de otra). La imagen larga
+  se reduce lo necesario para no pasar del alto máximo del formato ni de
+  MAXIMO_PIXELES_LARGA.
+- El resultado se guarda en memoria (LRU) y en disco (cache/imagenes) por hash
+  del PDF, formato, resolución y modo: exportar otra vez el mismo documento no
+  rasteriza nada. La carpeta se limpia por edad y tamaño (MAX_EDAD_DISCO,
+  MAX_BYTES_DISCO).
+"""
+import hashlib
+import importlib.util
+import io
+import os
+import threading
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from utils.cache_utils import marcar_uso, programar_limpieza
+from utils.metricas_utils import medir, registrar_bytes, registrar_cache
+from utils.recursos_utils import FORMATOS_EXPORTACION as FORMATOS
+
+
+DIRECTORIO_EXPORTACIONES = "cache/imagenes"
+MAX_ENTRADAS_MEMORIA = 8
+
+# Límites de la caché en disco (las imágenes sin usar en 7 días se borran)
+MAX_BYTES_DISCO = 512 * 1024 * 1024
+MAX_EDAD_DISCO = 7 * 24 * 60 * 60
+
+# Resolución por omisión: legible al ampliar en el teléfono sin pesar demasiado
+DPI_EXPORTACION = 150
+CALIDAD_IMAGEN = 85
+
+MODOS = ('zip', 'larga')
+
+# Pixeles de la imagen larga (40 millones: unas 19 páginas carta a 150 dpi)
+MAXIMO_PIXELES_LARGA = 40_000_000
+
+PYPDFIUM2_DISPONIBLE = importlib.util.find_spec('pypdfium2') is not None
+
+_cache_memoria = OrderedDict()
+_lock = threading.Lock()
+
+
+def exportar_imagenes(pdf_bytes, formato='JPEG', dpi=DPI_EXPORTACION, modo='zip', max_procesos=None):
+    """
+    Convierte un PDF en imágenes.
+
+    Con una sola página el resultado es la imagen de esa página, sin importar el modo.
+
+    Args:
+        pdf_bytes: PDF en bytes (salida de generar_cotizacion_pdf, generar_comprobante_pdf
+            o aplicar_membrete_pdf)
+        formato: 'PNG', 'JPEG' o 'WEBP'
+        dpi: Resolución de las imágenes
+        modo: 'zip' (una imagen por página) o 'larga' (una sola imagen con todas las páginas)
+        max_procesos: Procesos para rasterizar (por omisión, uno por núcleo)
+
+    Returns:
+        tuple: (bytes: imagen o ZIP, str: extensión del archivo, str: tipo MIME)
+
+    Raises:
+        RuntimeError: Si pypdfium2 no está instalado
+        ValueError: Si el formato o el modo no son válidos
+    """
+    formato = formato.upper()
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de imagen no válido: {formato}")
+    if modo not in MODOS:
+        raise ValueError(f"Modo de exportación no válido: {modo}")
+    if not PYPDFIUM2_DISPONIBLE:
+        raise RuntimeError("Para exportar como imagen se necesita pypdfium2")
+
+    firma = f"|{formato}|{dpi}|{modo}".encode('utf-8')
+    clave = hashlib.sha256(pdf_bytes + firma).hexdigest()
+
+    guardado = _obtener_cache(clave)
+    registrar_cache('exportacion_imagen', guardado is not None)
+    if guardado is not None:
+        return guardado
+
+    with medir('exportacion_imagen'):
+        resultado = _exportar(pdf_bytes, formato, dpi, modo, max_procesos)
+    registrar_bytes('exportacion_imagen', 'salida', len(resultado[0]))
+    _guardar_cache(clave, resultado)
+    return resultado
+
+
+def contar_paginas(pdf_bytes):
+    """
+    Número de páginas de un PDF (para ofrecer el ZIP o la imagen larga).
+
+    Se lee el total que declara el árbol de páginas (/Count), sin recorrer las
+    páginas: sirve para llamarlo una vez al generar el documento.
+
+    Args:
+        pdf_bytes: PDF en bytes
+
+    Returns:
+        int: Páginas del documento
+    """
+    from PyPDF2 import PdfReader
+
+    return int(PdfReader(io.BytesIO(pdf_bytes)).trailer['/Root']['/Pages']['/Count'])
+
+
+def _exportar(pdf_bytes, formato, dpi, modo, max_procesos):
+    """Rasteriza y arma el resultado (sin caché)"""
+    import pypdfium2 as pdfium
+    from utils.miniatura_utils import lock_pdfium
+
+    with lock_pdfium:
+        documento = pdfium.PdfDocument(pdf_bytes)
+        try:
+            tamanos = [documento.get_page_size(indice) for indice in range(len(documento))]
+        finally:
+            documento.close()
+
+    extension, mime, alto_maximo = FORMATOS[formato]
+    escala = dpi / 72
+    larga = modo == 'larga' and len(tamanos) > 1
+
+    if larga:
+        # Reducir todas las páginas por igual para no pasar de los límites de la
+        # imagen larga (PDFium redondea el tamaño de cada página: un pixel de margen por página)
+        ancho = max(ancho for ancho, _ in tamanos) * escala
+        alto = sum(alto for _, alto in tamanos) * escala
+        escala *= min(1.0, (alto_maximo - len(tamanos)) / alto, (MAXIMO_PIXELES_LARGA / (ancho * alto)) ** 0.5)
+
+    paginas = _rasterizar_paginas(pdf_bytes, len(tamanos), escala, None if larga else formato, max_procesos)
+
+    if larga:
+        return _unir_paginas(paginas, formato), extension, mime
+    if len(paginas) == 1:
+        return paginas[0], extension, mime
+
+    salida = io.BytesIO()
+    digitos = len(str(len(paginas)))
+    with zipfile.ZipFile(salida, 'w') as zip_salida:
+        for numero, imagen in enumerate(paginas, 1):
+            # Las imágenes ya vienen comprimidas; se guardan sin volver a comprimir
+            zip_salida.writestr(f"pagina_{numero:0{digitos}d}.{extension}", imagen,
+                                compress_type=zipfile.ZIP_STORED)
+    return salida.getvalue(), 'zip', 'application/zip'
+
+
+def _rasterizar_paginas(pdf_bytes, total, escala, formato, max_procesos):
+    """
+    Rasteriza todas las páginas, en bloques de páginas consecutivas por proceso.
+
+    Returns:
+        list: Imágenes codificadas en el formato (o imágenes PIL si formato es None)
+    """
+    from utils.miniatura_utils import lock_pdfium
+
+    procesos = min(max_procesos or os.cpu_count() or 1, total)
+    if procesos == 1:
+        with lock_pdfium:
+            return _rasterizar_bloque(pdf_bytes, 0, total, escala, formato)
+
+    tamano_bloque = -(-total // procesos)
+    bloques = [(inicio, min(inicio + tamano_bloque, total)) for inicio in range(0, total, tamano_bloque)]
+    with ProcessPoolExecutor(max_workers=procesos) as executor:
+        # Los procesos se crean (fork) al enviar los trabajos: con el lock ningún
+        # otro hilo está dentro de PDFium en ese momento
+        with lock_pdfium:
+            futuros = [executor.submit(_rasterizar_bloque, pdf_bytes, inicio, fin, escala, formato)
+                       for inicio, fin in bloques]
+        return [imagen for futuro in futuros for imagen in futuro.result()]
+
+
+def _rasterizar_bloque(pdf_bytes, inicio, fin, escala, formato):
+    """Rasteriza las páginas [inicio, fin) de un PDF (también dentro de un proceso del pool)"""
+    import pypdfium2 as pdfium
+
+    documento = pdfium.PdfDocument(pdf_bytes)
+    try:
+        paginas = []
+        for indice in range(inicio, fin):
+            imagen = documento[indice].render(scale=escala).to_pil()
+            paginas.append(_codificar(imagen, formato) if formato else imagen)
+        return paginas
+    finally:
+        documento.close()
+
+
+def _unir_paginas(paginas, formato):
+    """Una sola imagen con las páginas una debajo de otra, centradas sobre fondo blanco"""
+    from PIL import Image as PILImage
+
+    ancho = max(pagina.width for pagina in paginas)
+    larga = PILImage.new('RGB', (ancho, sum(pagina.height for pagina in paginas)), 'white')
+    y = 0
+    for pagina in paginas:
+        larga.paste(pagina, ((ancho - pagina.width) // 2, y))
+        y += pagina.height
+    return _codificar(larga, formato)
+
+
+def _codificar(imagen, formato):
+    """Bytes de una imagen PIL en el formato de exportación"""
+    salida = io.BytesIO()
+    if formato == 'PNG':
+        imagen.save(salida, format='PNG')
+    else:
+        imagen.convert('RGB').save(salida, format=formato, quality=CALIDAD_IMAGEN)
+    return salida.getvalue()
+
+
+def _obtener_cache(clave):
+    """Busca una exportación en memoria y en disco"""
+    with _lock:
+        if clave in _cache_memoria:
+            _cache_memoria.move_to_end(clave)
+            return _cache_memoria[clave]
+
+    for extension, mime in _extensiones():
+        ruta = os.path.join(DIRECTORIO_EXPORTACIONES, clave[:2], f"{clave}.{extension}")
+        try:
+            with open(ruta, 'rb') as f:
+                resultado = (f.read(), extension, mime)
+        except OSError:
+            continue
+        marcar_uso(ruta)
+        _guardar_en_memoria(clave, resultado)
+        return resultado
+    return None
+
+
+def _guardar_cache(clave, resultado):
+    """Guarda una exportación en memoria y en disco (escritura atómica)"""
+    _guardar_en_memoria(clave, resultado)
+
+    contenido, extension, _ = resultado
+    ruta = os.path.join(DIRECTORIO_EXPORTACIONES, clave[:2], f"{clave}.{extension}")
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(ruta_tmp, 'wb') as f:
+            f.write(contenido)
+        os.replace(ruta_tmp, ruta)
+    except OSError as e:
+        print(f"Error al guardar la exportación en caché: {e}")
+
+    programar_limpieza(DIRECTORIO_EXPORTACIONES, MAX_BYTES_DISCO, MAX_EDAD_DISCO)
+
+
+def _guardar_en_memoria(clave, resultado):
+    """Agrega una exportación a la caché en memoria (LRU)"""
+    with _lock:
+        _cache_memoria[clave] = resultado
+        _cache_memoria.move_to_end(clave)
+        while len(_cache_memoria) > MAX_ENTRADAS_MEMORIA:
+            _cache_memoria.popitem(last=False)
+
+
+def _extensiones():
+    """(extensión, tipo MIME) de los archivos que puede haber en la caché en disco"""
+    return [(extension, mime) for extension, mime, _ in FORMATOS.values()] + [('zip', 'application/zip')]
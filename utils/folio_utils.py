@@ -0,0 +1,386 @@
+"""
+Utilidades para asignar folios consecutivos por empresa y tipo de documento
+"""
+import atexit
+import multiprocessing
+import multiprocessing.util
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+
+RUTA_BASE_DATOS = os.path.join("archivo", "folios.db")
+
+# Folios que cada proceso reserva de una vez; la serie global solo se toca al reservar
+TAMANO_BLOQUE = 20
+
+# Un bloque cuyo dueño no ha asignado folios en este tiempo se considera abandonado
+# (proceso caído) y sus folios libres se reutilizan para no dejar huecos
+SEGUNDOS_ABANDONO = 15 * 60
+
+PREFIJOS = {
+    'cotizacion': 'COT',
+    'comprobante': 'COMP'
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS series_folio (
+    serie TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    siguiente INTEGER NOT NULL,
+    PRIMARY KEY (serie, tipo)
+);
+CREATE TABLE IF NOT EXISTS bloques_folio (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    serie TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    inicio INTEGER NOT NULL,
+    fin INTEGER NOT NULL,
+    usados INTEGER NOT NULL DEFAULT 0,
+    propietario TEXT,
+    latido REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_bloques_serie ON bloques_folio(serie, tipo, inicio);
+"""
+
+
+def _nuevo_propietario():
+    """Identificador del proceso actual como dueño de bloques"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+# Identificador de este proceso como dueño de bloques
+PROPIETARIO = _nuevo_propietario()
+
+_bloques = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+# Proceso dueño del estado del módulo y si ya se registró la liberación en un proceso hijo
+_proceso = {'pid': os.getpid(), 'finalizador': False}
+
+
+def obtener_serie(empresa):
+    """
+    Obtiene la serie de folios de una empresa.
+
+    Args:
+        empresa: Dict de la empresa (config['empresas'])
+
+    Returns:
+        str: Valor de 'serie' en la configuración, o iniciales del nombre
+    """
+    if empresa.get('serie'):
+        return empresa['serie']
+    return "".join(palabra[0] for palabra in empresa['nombre'].split() if palabra[0].isalnum()).upper()
+
+
+def asignar_folio(empresa, tipo):
+    """
+    Asigna el siguiente folio de la serie de una empresa y tipo de documento.
+
+    Es seguro con varios hilos y varios procesos: cada folio se asigna una sola vez.
+    Cada proceso reserva bloques de TAMANO_BLOQUE folios; los folios de bloques no
+    usados (cierre del proceso o proceso caído) se reutilizan antes de abrir un bloque
+    nuevo, así la serie no deja huecos. Conviene asignar los folios en el proceso
+    principal (como hacen api.py y lote_utils) y no en los procesos de un pool.
+
+    Args:
+        empresa: Dict de la empresa (config['empresas'])
+        tipo: 'cotizacion' o 'comprobante'
+
+    Returns:
+        str: Folio con formato PREFIJO-SERIE-000123
+    """
+    serie = obtener_serie(empresa)
+    numero = asignar_numero(serie, tipo)
+    return formatear_folio(serie, tipo, numero)
+
+
+def asignar_numero(serie, tipo):
+    """
+    Asigna el siguiente número consecutivo de una serie.
+
+    Args:
+        serie: Serie de la empresa
+        tipo: 'cotizacion' o 'comprobante'
+
+    Returns:
+        int: Número asignado
+    """
+    with _lock:
+        _preparar_proceso()
+        while True:
+            bloque_id = _bloques.get((serie, tipo))
+            if bloque_id is None:
+                bloque_id = _reservar_bloque(serie, tipo)
+                _bloques[(serie, tipo)] = bloque_id
+
+            numero = _tomar_del_bloque(bloque_id)
+            if numero is not None:
+                return numero
+
+            # Bloque agotado o reasignado a otro proceso: reservar otro
+            del _bloques[(serie, tipo)]
+
+
+def devolver_folio(empresa, tipo, folio):
+    """
+    Devuelve a la serie un folio asignado que no se usó (por ejemplo, porque falló la generación).
+
+    Si es el último número tomado del bloque de este proceso, el bloque retrocede y
+    el número se vuelve a asignar enseguida; si no, queda como un bloque libre de un
+    folio que se adopta antes de abrir bloques nuevos. Así un error no deja huecos.
+
+    Args:
+        empresa: Dict de la empresa (config['empresas'])
+        tipo: 'cotizacion' o 'comprobante'
+        folio: Folio devuelto por asignar_folio
+
+    Returns:
+        bool: True si se devolvió; False si el folio no es de la serie o ya estaba libre
+    """
+    serie = obtener_serie(empresa)
+    prefijo = formatear_folio(serie, tipo, 0)[:-6]
+    if not folio.startswith(prefijo) or not folio[len(prefijo):].isdigit():
+        return False
+    numero = int(folio[len(prefijo):])
+
+    with _lock:
+        _preparar_proceso()
+        conexion = _obtener_conexion()
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            # Un número que no se ha asignado o que ya está libre no se devuelve dos veces
+            libre = conexion.execute(
+                """SELECT 1 FROM series_folio WHERE serie = ? AND tipo = ? AND siguiente <= ?
+                   UNION ALL
+                   SELECT 1 FROM bloques_folio
+                   WHERE serie = ? AND tipo = ? AND inicio + usados <= ? AND ? < fin""",
+                (serie, tipo, numero, serie, tipo, numero, numero)
+            ).fetchone()
+
+            devuelto = False
+            if libre is None:
+                bloque_id = _bloques.get((serie, tipo))
+                if bloque_id is not None:
+                    devuelto = conexion.execute(
+                        """UPDATE bloques_folio SET usados = usados - 1
+                           WHERE id = ? AND propietario = ? AND usados > 0 AND inicio + usados - 1 = ?""",
+                        (bloque_id, PROPIETARIO, numero)
+                    ).rowcount > 0
+                if not devuelto:
+                    conexion.execute(
+                        """INSERT INTO bloques_folio (serie, tipo, inicio, fin, usados, propietario, latido)
+                           VALUES (?, ?, ?, ?, 0, NULL, ?)""",
+                        (serie, tipo, numero, numero + 1, time.time())
+                    )
+                    devuelto = True
+
+            conexion.execute("COMMIT")
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            raise
+
+    return devuelto
+
+
+def consultar_siguiente_folio(empresa, tipo):
+    """
+    Folio que probablemente se asignará a continuación (no lo reserva).
+
+    Args:
+        empresa: Dict de la empresa (config['empresas'])
+        tipo: 'cotizacion' o 'comprobante'
+
+    Returns:
+        str: Folio estimado
+    """
+    serie = obtener_serie(empresa)
+    with _lock:
+        _preparar_proceso()
+    conexion = _obtener_conexion()
+
+    bloque_id = _bloques.get((serie, tipo))
+    fila = None
+    if bloque_id is not None:
+        fila = conexion.execute(
+            "SELECT inicio + usados AS numero FROM bloques_folio WHERE id = ? AND propietario = ? AND inicio + usados < fin",
+            (bloque_id, PROPIETARIO)
+        ).fetchone()
+
+    if fila is None:
+        fila = conexion.execute(
+            """SELECT inicio + usados AS numero FROM bloques_folio
+               WHERE serie = ? AND tipo = ? AND inicio + usados < fin AND (propietario IS NULL OR latido < ?)
+               ORDER BY inicio LIMIT 1""",
+            (serie, tipo, time.time() - SEGUNDOS_ABANDONO)
+        ).fetchone()
+
+    if fila is None:
+        fila = conexion.execute(
+            "SELECT siguiente AS numero FROM series_folio WHERE serie = ? AND tipo = ?",
+            (serie, tipo)
+        ).fetchone()
+
+    return formatear_folio(serie, tipo, fila['numero'] if fila else 1)
+
+
+def formatear_folio(serie, tipo, numero):
+    """Da formato al folio: PREFIJO-SERIE-000123"""
+    return f"{PREFIJOS.get(tipo, tipo.upper())}-{serie}-{numero:06d}"
+
+
+def liberar_bloques():
+    """
+    Devuelve a la serie los folios reservados por este proceso y no usados.
+
+    Se llama automáticamente al terminar el proceso, también en los procesos de un
+    pool, que terminan sin ejecutar atexit.
+    """
+    with _lock:
+        if _proceso['pid'] != os.getpid():
+            # Proceso hijo que no ha reservado nada: los bloques heredados son del padre
+            return
+        _bloques.clear()
+        try:
+            conexion = _obtener_conexion()
+            with conexion:
+                conexion.execute(
+                    "UPDATE bloques_folio SET propietario = NULL WHERE propietario = ?",
+                    (PROPIETARIO,)
+                )
+        except sqlite3.Error as e:
+            print(f"Error al liberar bloques de folios: {e}")
+
+
+def _preparar_proceso():
+    """
+    Prepara el estado del módulo para el proceso actual (se llama con _lock tomado).
+
+    Un proceso creado con fork hereda los bloques, el propietario y la conexión
+    SQLite del padre: se descartan para que no use ni libere los bloques del padre.
+    Los procesos de multiprocessing (ProcessPoolExecutor) terminan sin ejecutar
+    atexit, así que en ellos la liberación se registra como finalizador de
+    multiprocessing, que sí se ejecuta al cerrar el pool.
+    """
+    global PROPIETARIO, _local
+
+    if _proceso['pid'] != os.getpid():
+        PROPIETARIO = _nuevo_propietario()
+        _bloques.clear()
+        _local = threading.local()
+        _proceso['pid'] = os.getpid()
+        _proceso['finalizador'] = False
+
+    if not _proceso['finalizador'] and multiprocessing.parent_process() is not None:
+        multiprocessing.util.Finalize(None, liberar_bloques, exitpriority=10)
+        _proceso['finalizador'] = True
+
+
+def _reservar_bloque(serie, tipo):
+    """
+    Reserva un bloque para este proceso: primero adopta un bloque libre o abandonado
+    (el de números más bajos) y, si no hay, abre uno nuevo al final de la serie.
+    """
+    conexion = _obtener_conexion()
+    ahora = time.time()
+
+    # BEGIN IMMEDIATE toma el candado de escritura antes de leer: dos procesos no
+    # pueden adoptar el mismo bloque ni abrir bloques con los mismos números
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        fila = conexion.execute(
+            """SELECT id FROM bloques_folio
+               WHERE serie = ? AND tipo = ? AND inicio + usados < fin AND (propietario IS NULL OR latido < ?)
+               ORDER BY inicio LIMIT 1""",
+            (serie, tipo, ahora - SEGUNDOS_ABANDONO)
+        ).fetchone()
+
+        if fila is not None:
+            bloque_id = fila['id']
+            conexion.execute(
+                "UPDATE bloques_folio SET propietario = ?, latido = ? WHERE id = ?",
+                (PROPIETARIO, ahora, bloque_id)
+            )
+        else:
+            conexion.execute(
+                "INSERT OR IGNORE INTO series_folio (serie, tipo, siguiente) VALUES (?, ?, 1)",
+                (serie, tipo)
+            )
+            inicio = conexion.execute(
+                "SELECT siguiente FROM series_folio WHERE serie = ? AND tipo = ?",
+                (serie, tipo)
+            ).fetchone()['siguiente']
+
+            conexion.execute(
+                "UPDATE series_folio SET siguiente = ? WHERE serie = ? AND tipo = ?",
+                (inicio + TAMANO_BLOQUE, serie, tipo)
+            )
+            bloque_id = conexion.execute(
+                """INSERT INTO bloques_folio (serie, tipo, inicio, fin, usados, propietario, latido)
+                   VALUES (?, ?, ?, ?, 0, ?, ?)""",
+                (serie, tipo, inicio, inicio + TAMANO_BLOQUE, PROPIETARIO, ahora)
+            ).lastrowid
+
+        conexion.execute("COMMIT")
+    except BaseException:
+        conexion.execute("ROLLBACK")
+        raise
+
+    return bloque_id
+
+
+def _tomar_del_bloque(bloque_id):
+    """
+    Toma el siguiente número de un bloque propio. Devuelve None si el bloque se agotó
+    o si otro proceso lo adoptó por abandono.
+    """
+    conexion = _obtener_conexion()
+
+    # La condición sobre el propietario hace la verificación y el consumo en una sola
+    # escritura atómica, así un bloque readoptado nunca entrega un folio repetido
+    conexion.execute("BEGIN IMMEDIATE")
+    try:
+        actualizado = conexion.execute(
+            """UPDATE bloques_folio SET usados = usados + 1, latido = ?
+               WHERE id = ? AND propietario = ? AND inicio + usados < fin""",
+            (time.time(), bloque_id, PROPIETARIO)
+        ).rowcount
+
+        numero = None
+        if actualizado:
+            fila = conexion.execute(
+                "SELECT inicio + usados - 1 AS numero, inicio + usados >= fin AS agotado FROM bloques_folio WHERE id = ?",
+                (bloque_id,)
+            ).fetchone()
+            numero = fila['numero']
+            if fila['agotado']:
+                conexion.execute("DELETE FROM bloques_folio WHERE id = ?", (bloque_id,))
+
+        conexion.execute("COMMIT")
+    except BaseException:
+        conexion.execute("ROLLBACK")
+        raise
+
+    return numero
+
+
+def _obtener_conexion():
+    """Conexión SQLite del hilo actual en modo de transacciones manual"""
+    conexion = getattr(_local, 'conexion', None)
+    if conexion is None:
+        os.makedirs(os.path.dirname(RUTA_BASE_DATOS), exist_ok=True)
+        conexion = sqlite3.connect(RUTA_BASE_DATOS, timeout=30, isolation_level=None)
+        conexion.row_factory = sqlite3.Row
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.execute("PRAGMA synchronous=NORMAL")
+        conexion.executescript(ESQUEMA)
+        _local.conexion = conexion
+    return conexion
+
+
+atexit.register(liberar_bloques)
@@ -0,0 +1,154 @@
+"""
+Fuentes TrueType de cada empresa para los documentos PDF
+
+Cada empresa de data/config.json puede tener sus fuentes:
+
+    "fuentes": {"normal": "fuentes/Marca-Regular.ttf", "negrita": "fuentes/Marca-Bold.ttf"}
+
+Sin "fuentes" se usan Helvetica y Helvetica-Bold. Si solo se indica "normal", la
+negrita usa la misma fuente. Las plantillas siguen escribiendo Helvetica y
+Helvetica-Bold: plantilla_utils las sustituye por las fuentes de la empresa.
+
+Cada archivo se lee y registra en ReportLab una sola vez por proceso (un cambio
+en el archivo lo registra con otro nombre). ReportLab incrusta en cada PDF solo
+los glifos usados, en subconjuntos de hasta 256 caracteres; armar cada
+subconjunto implica recorrer las tablas de la fuente, así que el resultado se
+guarda por conjunto de glifos (los documentos del mismo tipo usan casi siempre
+los mismos) y se reutiliza en los siguientes PDFs.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from utils.metricas_utils import registrar_cache
+from utils.recursos_utils import registrar_invalidacion
+
+
+FUENTES_BASE = {'normal': 'Helvetica', 'negrita': 'Helvetica-Bold'}
+
+# Subconjuntos de glifos que se guardan (entre todas las fuentes)
+MAXIMO_SUBCONJUNTOS = 256
+
+_registradas = {}
+_subconjuntos = OrderedDict()
+_lock = threading.Lock()
+
+
+def obtener_fuentes(empresa):
+    """
+    Obtiene los nombres de fuente de los documentos de una empresa, registrándolas si hace falta.
+
+    Args:
+        empresa: Dict de la empresa (de data/config.json)
+
+    Returns:
+        dict: {'normal': nombre, 'negrita': nombre} listos para fontName
+    """
+    configuradas = (empresa or {}).get('fuentes') or {}
+    if not configuradas.get('normal'):
+        return dict(FUENTES_BASE)
+
+    normal = registrar_fuente(configuradas['normal'])
+    if normal is None:
+        return dict(FUENTES_BASE)
+    negrita = registrar_fuente(configuradas['negrita']) if configuradas.get('negrita') else None
+    fuentes = {'normal': normal, 'negrita': negrita or normal}
+    _registrar_familia(fuentes)
+    return fuentes
+
+
+def registrar_fuente(ruta):
+    """
+    Registra un archivo TTF en ReportLab (una sola vez por versión del archivo).
+
+    Args:
+        ruta: Ruta del archivo .ttf
+
+    Returns:
+        str: Nombre registrado de la fuente, o None si no se pudo leer
+    """
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    try:
+        info = os.stat(ruta)
+    except OSError:
+        print(f"Archivo de fuente no encontrado: {ruta}")
+        return None
+
+    clave = (os.path.abspath(ruta), info.st_mtime_ns, info.st_size)
+    with _lock:
+        if clave in _registradas:
+            return _registradas[clave]
+
+        base = os.path.splitext(os.path.basename(ruta))[0]
+        nombre = f"{base}-{hashlib.sha256(repr(clave).encode('utf-8')).hexdigest()[:8]}"
+        try:
+            fuente = TTFont(nombre, ruta)
+        except Exception as e:
+            print(f"Error al cargar la fuente {ruta}: {e}")
+            return None
+
+        _cachear_subconjuntos(fuente.face, clave)
+        pdfmetrics.registerFont(fuente)
+        _registradas[clave] = nombre
+        return nombre
+
+
+def rutas_fuentes(empresa):
+    """
+    Archivos de fuente de una empresa, para la clave de la caché de PDFs.
+
+    Args:
+        empresa: Dict de la empresa
+
+    Returns:
+        list: Rutas configuradas
+    """
+    configuradas = (empresa or {}).get('fuentes') or {}
+    return [ruta for ruta in (configuradas.get('normal'), configuradas.get('negrita')) if ruta]
+
+
+def limpiar_subconjuntos():
+    """Descarta los subconjuntos de glifos guardados"""
+    with _lock:
+        _subconjuntos.clear()
+
+
+def _registrar_familia(fuentes):
+    """Asocia la negrita a la fuente normal: <b> en los párrafos usa la negrita de la empresa"""
+    from reportlab.pdfbase import pdfmetrics
+
+    pdfmetrics.registerFontFamily(fuentes['normal'], normal=fuentes['normal'], bold=fuentes['negrita'],
+                                  italic=fuentes['normal'], boldItalic=fuentes['negrita'])
+
+
+def _cachear_subconjuntos(cara, clave_fuente):
+    """Reemplaza makeSubset de la fuente por una versión con caché por conjunto de glifos"""
+    original = cara.makeSubset
+    # El lector de TTF guarda su posición en el archivo: un subconjunto a la vez
+    lock_cara = threading.Lock()
+
+    def makeSubset(subset):
+        clave = (clave_fuente, tuple(subset))
+        with _lock:
+            contenido = _subconjuntos.get(clave)
+            if contenido is not None:
+                _subconjuntos.move_to_end(clave)
+        registrar_cache('subconjunto_fuente', contenido is not None)
+        if contenido is not None:
+            return contenido
+
+        with lock_cara:
+            contenido = original(subset)
+        with _lock:
+            _subconjuntos[clave] = contenido
+            while len(_subconjuntos) > MAXIMO_SUBCONJUNTOS:
+                _subconjuntos.popitem(last=False)
+        return contenido
+
+    cara.makeSubset = makeSubset
+
+
+registrar_invalidacion(limpiar_subconjuntos)
@@ -0,0 +1,159 @@
+"""
+Utilidades para preparar imágenes antes de insertarlas en los PDFs
+"""
+import hashlib
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image as PILImage, ImageOps
+
+
+# Resolución de impresión para las imágenes insertadas (puntos por pulgada)
+DPI_IMPRESION = 150
+CALIDAD_JPEG = 85
+
+# Con hasta este número de colores (capturas de pantalla simples) se usa PNG con paleta
+MAX_COLORES_PNG = 256
+
+
+def preparar_imagen(archivo, ancho_max, alto_max, dpi=DPI_IMPRESION):
+    """
+    Prepara una imagen subida para insertarla en un PDF.
+
+    Aplica la orientación EXIF, elimina metadatos, reduce la resolución a la necesaria
+    para imprimir el recuadro destino a `dpi` y elige JPEG (fotos) o PNG (imágenes
+    con pocos colores o transparencia). Una captura de varios MB queda en decenas de KB.
+
+    Args:
+        archivo: Ruta, bytes o file-like object con la imagen
+        ancho_max: Ancho máximo del recuadro destino en puntos
+        alto_max: Alto máximo del recuadro destino en puntos
+        dpi: Resolución de impresión deseada
+
+    Returns:
+        tuple: (BytesIO: imagen recodificada, float: ancho en puntos, float: alto en puntos)
+    """
+    if isinstance(archivo, (bytes, bytearray)):
+        archivo = io.BytesIO(archivo)
+    elif hasattr(archivo, 'seek'):
+        archivo.seek(0)
+
+    img = PILImage.open(archivo)
+
+    # Tamaño en pixeles que se necesita para el recuadro a la resolución indicada
+    ancho_px, alto_px = _dimensiones_orientadas(img)
+    escala = min(ancho_max / ancho_px, alto_max / alto_px, 1.0)
+    ancho_pt = ancho_px * escala
+    alto_pt = alto_px * escala
+    destino = (max(1, round(ancho_pt / 72 * dpi)), max(1, round(alto_pt / 72 * dpi)))
+
+    # En JPEG, draft decodifica directamente a una escala reducida (mucho más rápido)
+    lado = max(destino)
+    img.draft('RGB', (lado, lado))
+
+    img = ImageOps.exif_transpose(img)
+    if img.width > destino[0] or img.height > destino[1]:
+        img = img.resize(destino, PILImage.LANCZOS, reducing_gap=3.0)
+
+    # Las capturas de pantalla suelen traer canal alfa aunque sean totalmente opacas
+    if img.mode == 'RGBA' and img.getchannel('A').getextrema() == (255, 255):
+        img = img.convert('RGB')
+
+    salida = io.BytesIO()
+    if _usar_png(img):
+        if img.mode not in ('RGBA', 'LA', 'P', 'L', '1'):
+            img = img.convert('RGB')
+        colores = img.getcolors(MAX_COLORES_PNG) if img.mode != 'P' else None
+        if colores and img.mode == 'RGB':
+            img = img.quantize(colors=len(colores))
+        img.save(salida, format='PNG', optimize=True)
+    else:
+        img.convert('RGB').save(salida, format='JPEG', quality=CALIDAD_JPEG, optimize=True)
+
+    salida.seek(0)
+    return salida, ancho_pt, alto_pt
+
+
+def imagenes_distintas(archivos):
+    """
+    Lee las imágenes subidas y descarta las repetidas (mismo contenido).
+
+    Args:
+        archivos: Lista de rutas, bytes o file-like objects
+
+    Returns:
+        list: Contenido (bytes) de cada imagen distinta, en el orden original
+    """
+    distintas = {}
+    for archivo in archivos:
+        contenido = _leer_bytes(archivo)
+        distintas.setdefault(hashlib.sha256(contenido).digest(), contenido)
+    return list(distintas.values())
+
+
+def preparar_imagenes(contenidos, ancho_max, alto_max, dpi=DPI_IMPRESION, max_hilos=None):
+    """
+    Prepara varias imágenes en paralelo con preparar_imagen.
+
+    PIL libera el GIL al decodificar y redimensionar, así que un pool de hilos
+    aprovecha varios núcleos sin copiar las imágenes a otros procesos.
+
+    Args:
+        contenidos: Lista de bytes (ver imagenes_distintas)
+        ancho_max: Ancho máximo del recuadro destino en puntos
+        alto_max: Alto máximo del recuadro destino en puntos
+        dpi: Resolución de impresión deseada
+        max_hilos: Número máximo de hilos (por defecto, número de núcleos hasta 8)
+
+    Returns:
+        list: Por cada imagen, la tupla de preparar_imagen o la excepción si falló
+    """
+    if not contenidos:
+        return []
+
+    def _preparar(contenido):
+        try:
+            return preparar_imagen(contenido, ancho_max, alto_max, dpi=dpi)
+        except Exception as e:
+            return e
+
+    hilos = max_hilos or min(len(contenidos), os.cpu_count() or 1, 8)
+    if hilos <= 1:
+        return [_preparar(contenido) for contenido in contenidos]
+
+    with ThreadPoolExecutor(max_workers=hilos) as executor:
+        return list(executor.map(_preparar, contenidos))
+
+
+def _leer_bytes(archivo):
+    """Contenido de una imagen dada como ruta, bytes o file-like object"""
+    if isinstance(archivo, (bytes, bytearray)):
+        return bytes(archivo)
+    if isinstance(archivo, str):
+        with open(archivo, 'rb') as f:
+            return f.read()
+    if hasattr(archivo, 'getvalue'):
+        return archivo.getvalue()
+    archivo.seek(0)
+    return archivo.read()
+
+
+def _dimensiones_orientadas(img):
+    """Dimensiones de la imagen ya aplicada la orientación EXIF (sin decodificarla)"""
+    try:
+        orientacion = img.getexif().get(0x0112, 1)
+    except Exception:
+        orientacion = 1
+    if orientacion in (5, 6, 7, 8):
+        return img.height, img.width
+    return img.width, img.height
+
+
+def _usar_png(img):
+    """PNG para transparencia o pocos colores (texto nítido); JPEG para fotografías"""
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        return True
+    if img.mode in ('1', 'P'):
+        return True
+    return img.getcolors(MAX_COLORES_PNG) is not None
@@ -0,0 +1,191 @@
+"""
+Utilidades para el almacén columnar de items y conceptos (modo tabla)
+"""
+import csv
+import io
+import re
+import unicodedata
+
+
+# Columnas de cada tipo de documento y el tipo de dato de cada una
+COLUMNAS_COTIZACION = {
+    'codigo': str,
+    'descripcion': str,
+    'cantidad': int,
+    'precio_unitario': float
+}
+
+COLUMNAS_COMPROBANTE = {
+    'descripcion': str,
+    'monto': float
+}
+
+# Valor de las columnas numéricas cuando la celda está vacía (en lugar de 0)
+VALORES_POR_OMISION = {
+    'cantidad': 1
+}
+
+# Otros encabezados que se aceptan al pegar una tabla, ya normalizados (sin acentos,
+# en minúsculas y con guiones bajos), incluidas las etiquetas del editor
+ALIAS_ENCABEZADOS = {
+    'clave': 'codigo',
+    'cod': 'codigo',
+    'concepto': 'descripcion',
+    'producto': 'descripcion',
+    'servicio': 'descripcion',
+    'cant': 'cantidad',
+    'piezas': 'cantidad',
+    'precio': 'precio_unitario',
+    'precio_unit': 'precio_unitario',
+    'p_u': 'precio_unitario',
+    'pu': 'precio_unitario',
+    'importe': 'monto',
+    'pago': 'monto'
+}
+
+
+def items_a_columnas(items, columnas):
+    """
+    Convierte una lista de items (filas) a un almacén columnar.
+
+    Args:
+        items: Lista de dicts, un dict por item
+        columnas: Dict {nombre_columna: tipo}
+
+    Returns:
+        dict: {nombre_columna: lista de valores}
+    """
+    return {nombre: [item.get(nombre) for item in items] for nombre in columnas}
+
+
+def columnas_a_items(datos_columnas, columnas):
+    """
+    Convierte un almacén columnar a la lista de items que usan los generadores.
+
+    Las filas vacías (por ejemplo, la fila nueva que agrega el editor) se descartan
+    y los valores se convierten al tipo de su columna; las celdas vacías de columnas
+    con valor en VALORES_POR_OMISION (la cantidad) toman ese valor en lugar de 0.
+
+    Args:
+        datos_columnas: Dict {nombre_columna: lista de valores}
+        columnas: Dict {nombre_columna: tipo}
+
+    Returns:
+        list: Lista de dicts, un dict por item
+    """
+    if not datos_columnas:
+        return []
+
+    total_filas = max((len(valores) for valores in datos_columnas.values()), default=0)
+    items = []
+
+    for idx in range(total_filas):
+        fila = {}
+        for nombre, tipo in columnas.items():
+            valores = datos_columnas.get(nombre, [])
+            valor = valores[idx] if idx < len(valores) else None
+            if nombre in VALORES_POR_OMISION and _celda_vacia(valor):
+                valor = VALORES_POR_OMISION[nombre]
+            fila[nombre] = _convertir_valor(valor, tipo)
+
+        if any(fila[nombre] for nombre, tipo in columnas.items() if tipo is str):
+            items.append(fila)
+
+    return items
+
+
+def parsear_tabla_pegada(texto, columnas):
+    """
+    Interpreta filas copiadas de una hoja de cálculo (Excel, Google Sheets).
+
+    Acepta valores separados por tabulador, punto y coma o coma, con o sin fila de
+    encabezados, y montos con formato de moneda ("$1,234.50"). Los encabezados se
+    comparan sin acentos ni mayúsculas y aceptan las etiquetas del editor y los
+    alias de ALIAS_ENCABEZADOS; las columnas con encabezado desconocido toman, en
+    orden, las columnas esperadas que no aparecieron. Las celdas vacías de columnas
+    con valor en VALORES_POR_OMISION (la cantidad) toman ese valor (ver columnas_a_items).
+
+    Args:
+        texto: Texto pegado por el usuario
+        columnas: Dict {nombre_columna: tipo}, en el orden esperado
+
+    Returns:
+        list: Lista de dicts, un dict por fila válida
+    """
+    texto = texto.strip()
+    if not texto:
+        return []
+
+    primera_linea = texto.splitlines()[0]
+    if '\t' in primera_linea:
+        separador = '\t'
+    elif ';' in primera_linea:
+        separador = ';'
+    else:
+        separador = ','
+
+    filas = list(csv.reader(io.StringIO(texto), delimiter=separador))
+    nombres = list(columnas)
+
+    # Si la primera fila son encabezados, usarlos para ordenar las columnas
+    encabezados = [_columna_de_encabezado(celda, nombres) for celda in filas[0]]
+    if any(encabezados):
+        faltantes = iter([nombre for nombre in nombres if nombre not in encabezados])
+        orden = [nombre or next(faltantes, None) for nombre in encabezados]
+        filas = filas[1:]
+    else:
+        orden = nombres
+
+    datos_columnas = {nombre: [] for nombre in nombres}
+    for fila in filas:
+        if not any(celda.strip() for celda in fila):
+            continue
+        valores = dict(zip(orden, fila))
+        for nombre in nombres:
+            datos_columnas[nombre].append(valores.get(nombre))
+
+    return columnas_a_items(datos_columnas, columnas)
+
+
+def _columna_de_encabezado(celda, nombres):
+    """Columna esperada que corresponde a un encabezado, o None si no se reconoce"""
+    texto = unicodedata.normalize('NFKD', celda).encode('ascii', 'ignore').decode('ascii')
+    texto = re.sub(r'[^a-z0-9]+', '_', texto.lower()).strip('_')
+    nombre = ALIAS_ENCABEZADOS.get(texto, texto)
+    return nombre if nombre in nombres else None
+
+
+def _celda_vacia(valor):
+    """True para None, NaN o pd.NA de celdas vacías y textos en blanco"""
+    if isinstance(valor, str):
+        return not valor.strip()
+    try:
+        return valor is None or bool(valor != valor)
+    except TypeError:
+        # pd.NA no se puede convertir a bool
+        return True
+
+
+def _convertir_valor(valor, tipo):
+    """Convierte un valor de celda al tipo de su columna"""
+    if tipo is str:
+        # None, NaN o pd.NA de celdas vacías se tratan como texto vacío
+        if not isinstance(valor, (str, int, float)) or valor != valor:
+            return ''
+        return str(valor).strip()
+
+    if valor is None or (isinstance(valor, str) and not valor.strip()):
+        return tipo(0)
+
+    if isinstance(valor, str):
+        valor = valor.strip().replace('$', '').replace(',', '').replace(' ', '')
+
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return tipo(0)
+
+    if numero != numero:  # NaN de celdas vacías
+        return tipo(0)
+
+    return tipo(round(numero)) if tipo is int else tipo(numero)
@@ -0,0 +1,502 @@
+"""
+Utilidades para generar comprobantes de pago por lote desde exportaciones de pagos
+"""
+import csv
+import importlib.util
+import io
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+
+from utils.items_utils import columnas_a_items
+from utils.folio_utils import asignar_folio, devolver_folio, obtener_serie
+from utils.metricas_utils import combinar_metricas, tomar_metricas
+
+# openpyxl tarda en importarse: solo se comprueba que exista y se carga al leer un XLSX
+OPENPYXL_DISPONIBLE = importlib.util.find_spec('openpyxl') is not None
+
+
+# Columnas de la exportación de pagos; varias filas con la misma referencia son
+# conceptos de un mismo comprobante
+COLUMNAS_LOTE = {
+    'referencia': str,
+    'cliente': str,
+    'telefono': str,
+    'email': str,
+    'concepto': str,
+    'monto': float,
+    'empresa': str,
+    'folio': str,
+    'fecha': str
+}
+
+# Otros nombres de encabezado que se aceptan para cada columna
+ALIAS_COLUMNAS = {
+    'nombre': 'cliente',
+    'nombre_cliente': 'cliente',
+    'celular': 'telefono',
+    'teléfono': 'telefono',
+    'correo': 'email',
+    'correo_electrónico': 'email',
+    'correo_electronico': 'email',
+    'descripcion': 'concepto',
+    'descripción': 'concepto',
+    'importe': 'monto',
+    'division': 'empresa',
+    'división': 'empresa',
+    'ref': 'referencia'
+}
+
+EXTENSIONES_IMAGEN = ('.png', '.jpg', '.jpeg')
+EXTENSIONES_ADJUNTO = EXTENSIONES_IMAGEN + ('.pdf',)
+
+# Separadores entre la referencia y un sufijo en el nombre de las imágenes (REF_2.jpg)
+SEPARADORES_REFERENCIA = '_- .'
+
+# Formatos de fecha que se aceptan además de ISO (AAAA-MM-DD), como los exporta Excel en español
+FORMATOS_FECHA = ('%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%m-%y',
+                  '%d/%m/%Y %H:%M', '%d/%m/%Y %H:%M:%S', '%d-%m-%Y %H:%M', '%d-%m-%Y %H:%M:%S')
+
+# Día cero de los números de serie de fecha de Excel (45678 = 2025-01-21)
+ORIGEN_FECHAS_EXCEL = datetime(1899, 12, 30)
+
+COLUMNAS_RESUMEN = ['referencia', 'folio', 'cliente', 'telefono', 'conceptos', 'total',
+                    'adjuntos', 'archivo', 'estado', 'error']
+
+# Configuración del sistema en cada proceso del pool (se envía una sola vez)
+_config_proceso = None
+
+
+def leer_pagos(archivo, nombre_archivo=None):
+    """
+    Lee una exportación de pagos en CSV o XLSX.
+
+    La primera fila son los encabezados (ver COLUMNAS_LOTE y ALIAS_COLUMNAS). En CSV
+    se detecta el separador (coma, punto y coma o tabulador).
+
+    Args:
+        archivo: Ruta o file-like object
+        nombre_archivo: Nombre para detectar el formato si archivo no es una ruta
+
+    Returns:
+        list: Lista de dicts, un dict por fila con datos
+    """
+    nombre = nombre_archivo or getattr(archivo, 'name', archivo if isinstance(archivo, str) else '')
+
+    if str(nombre).lower().endswith(('.xlsx', '.xlsm')):
+        filas = _leer_filas_xlsx(archivo)
+    else:
+        filas = _leer_filas_csv(archivo)
+
+    filas = iter(filas)
+    encabezados = [_normalizar_encabezado(celda) for celda in next(filas, [])]
+
+    datos_columnas = {nombre_columna: [] for nombre_columna in COLUMNAS_LOTE}
+    for fila in filas:
+        if not any(celda not in (None, '') for celda in fila):
+            continue
+        valores = dict(zip(encabezados, fila))
+        for nombre_columna in COLUMNAS_LOTE:
+            datos_columnas[nombre_columna].append(valores.get(nombre_columna))
+
+    # Se descartan las filas sin texto (por ejemplo, una fila de totales al final)
+    return columnas_a_items(datos_columnas, COLUMNAS_LOTE)
+
+
+def agrupar_pagos(filas, empresa, config, fecha=None):
+    """
+    Agrupa las filas por referencia y arma los datos de cada comprobante.
+
+    Las filas sin referencia son cada una un comprobante. Si la fila no trae folio
+    se deja vacío: generar_lote_comprobantes lo asigna de la serie de la empresa al
+    generar el comprobante, así las filas con error no consumen folios. La fecha
+    puede ser ISO, dd/mm/aaaa, dd-mm-aaaa o un número de serie de fecha de Excel.
+
+    Args:
+        filas: Lista de dicts de leer_pagos
+        empresa: Dict de la empresa por defecto (config['empresas'])
+        config: Configuración del sistema
+        fecha: datetime de los comprobantes sin fecha (por defecto, ahora)
+
+    Returns:
+        list: Lista de dicts {'referencia', 'datos', 'error'} en el orden del archivo
+    """
+    fecha = fecha or datetime.now().replace(microsecond=0)
+    empresas = {}
+    for emp in config['empresas']:
+        empresas[emp['nombre'].strip().lower()] = emp
+        empresas[obtener_serie(emp).lower()] = emp
+
+    grupos = {}
+    for numero, fila in enumerate(filas, start=1):
+        referencia = fila['referencia'] or f"fila-{numero}"
+        grupos.setdefault(referencia, []).append(fila)
+
+    comprobantes = []
+    for referencia, filas_grupo in grupos.items():
+        primera = filas_grupo[0]
+        comprobante = {'referencia': referencia, 'datos': None, 'error': ''}
+        comprobantes.append(comprobante)
+
+        empresa_fila = empresa
+        if primera['empresa']:
+            empresa_fila = empresas.get(primera['empresa'].lower())
+            if empresa_fila is None:
+                comprobante['error'] = f"División desconocida: {primera['empresa']}"
+                continue
+
+        if not primera['cliente']:
+            comprobante['error'] = "Falta el nombre del cliente"
+            continue
+
+        conceptos = [
+            {'descripcion': fila['concepto'] or 'Pago', 'monto': fila['monto']}
+            for fila in filas_grupo
+        ]
+        if not any(concepto['monto'] for concepto in conceptos):
+            comprobante['error'] = "El comprobante no tiene montos"
+            continue
+
+        fecha_fila = _interpretar_fecha(primera['fecha']) if primera['fecha'] else fecha
+        if fecha_fila is None:
+            comprobante['error'] = f"Fecha no válida: {primera['fecha']}"
+            continue
+
+        comprobante['datos'] = {
+            'empresa': empresa_fila,
+            'folio': primera['folio'],
+            'fecha': fecha_fila,
+            'cliente': {
+                'nombre': primera['cliente'],
+                'telefono': primera['telefono'],
+                'email': primera['email']
+            },
+            'conceptos': conceptos,
+            'referencia': referencia
+        }
+
+    return comprobantes
+
+
+def indexar_adjuntos(carpeta, referencias):
+    """
+    Relaciona las imágenes y PDF de una carpeta con las referencias de pago.
+
+    Un archivo corresponde a una referencia si su nombre (sin extensión) es la
+    referencia o empieza con ella seguida de un separador: REF.jpg, REF_2.jpg,
+    REF-banco.pdf. Si varias referencias coinciden gana la más larga. Solo se
+    guardan rutas; las imágenes se leen al generar cada comprobante.
+
+    Args:
+        carpeta: Ruta de la carpeta (se recorren también las subcarpetas)
+        referencias: Referencias de los comprobantes
+
+    Returns:
+        dict: {referencia: lista de rutas ordenadas por nombre}
+    """
+    conocidas = {referencia.lower(): referencia for referencia in referencias}
+    adjuntos = {}
+    if not carpeta or not os.path.isdir(carpeta):
+        return adjuntos
+
+    for raiz, _, nombres in os.walk(carpeta):
+        for nombre in sorted(nombres):
+            base, extension = os.path.splitext(nombre)
+            if extension.lower() not in EXTENSIONES_ADJUNTO:
+                continue
+
+            base = base.lower()
+            cortes = [len(base)] + [i for i in range(len(base) - 1, 0, -1) if base[i] in SEPARADORES_REFERENCIA]
+            for corte in cortes:
+                referencia = conocidas.get(base[:corte])
+                if referencia is not None:
+                    adjuntos.setdefault(referencia, []).append(os.path.join(raiz, nombre))
+                    break
+
+    return adjuntos
+
+
+def generar_lote_comprobantes(comprobantes, config, salida, adjuntos=None, max_procesos=None,
+                              archivar=False, progreso=None):
+    """
+    Genera los comprobantes en un pool de procesos y los escribe en un ZIP.
+
+    Cada PDF se agrega al ZIP en cuanto termina y se descarta de la memoria; solo
+    hay unos pocos comprobantes en proceso a la vez, así que miles de filas con
+    imágenes no se cargan en memoria juntas. El ZIP incluye resumen.csv con el
+    resultado de cada comprobante.
+
+    Los comprobantes sin folio reciben el siguiente de la serie en este proceso,
+    justo antes de enviarse al pool y en el orden del archivo; si la generación
+    falla, el folio vuelve a la serie.
+
+    Args:
+        comprobantes: Lista de agrupar_pagos
+        config: Configuración del sistema
+        salida: Ruta o file-like object donde se escribe el ZIP
+        adjuntos: Dict {referencia: rutas} de indexar_adjuntos
+        max_procesos: Número de procesos (por defecto, número de núcleos)
+        archivar: Si es True, cada comprobante generado se guarda en el archivo local
+        progreso: Función opcional (terminados, total) que se llama tras cada comprobante
+
+    Returns:
+        dict: {'total', 'generados', 'errores', 'segundos', 'filas': resumen por comprobante}
+    """
+    from utils.comprobante_utils import calcular_total_comprobante
+
+    inicio = time.perf_counter()
+    adjuntos = adjuntos or {}
+    total = len(comprobantes)
+    resumen = []
+    pendientes = []
+
+    for indice, comprobante in enumerate(comprobantes):
+        datos = comprobante['datos']
+        fila = {nombre: '' for nombre in COLUMNAS_RESUMEN}
+        fila['referencia'] = comprobante['referencia']
+        fila['estado'] = 'error'
+        fila['error'] = comprobante['error']
+        resumen.append(fila)
+
+        if datos is None:
+            continue
+
+        rutas = adjuntos.get(comprobante['referencia'], [])
+        datos['comprobante_imagenes'] = [r for r in rutas if r.lower().endswith(EXTENSIONES_IMAGEN)]
+        datos['anexos_pdf'] = [r for r in rutas if r.lower().endswith('.pdf')]
+
+        fila.update({
+            'cliente': datos['cliente']['nombre'],
+            'telefono': datos['cliente']['telefono'],
+            'conceptos': len(datos['conceptos']),
+            'total': f"{calcular_total_comprobante(datos):.2f}",
+            'adjuntos': len(rutas)
+        })
+        pendientes.append(indice)
+
+    terminados = total - len(pendientes)
+    procesos = max_procesos or os.cpu_count() or 1
+
+    with zipfile.ZipFile(salida, 'w', compression=zipfile.ZIP_DEFLATED) as zip_salida, \
+            ProcessPoolExecutor(max_workers=procesos, initializer=_inicializar_proceso,
+                                initargs=(config,)) as executor:
+        # Ventana de trabajos en curso: limita los PDFs terminados que esperan en memoria
+        en_curso = {}
+        siguientes = iter(pendientes)
+        folios_asignados = set()
+
+        def _enviar():
+            for indice in siguientes:
+                datos = comprobantes[indice]['datos']
+                if not datos['folio']:
+                    datos['folio'] = asignar_folio(datos['empresa'], 'comprobante')
+                    folios_asignados.add(indice)
+                resumen[indice]['folio'] = datos['folio']
+                resumen[indice]['archivo'] = f"Comprobante_{datos['folio']}.pdf"
+                en_curso[executor.submit(_generar_en_proceso, datos)] = indice
+                if len(en_curso) >= procesos * 2:
+                    break
+
+        _enviar()
+        while en_curso:
+            hechos, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                indice = en_curso.pop(futuro)
+                fila = resumen[indice]
+                try:
+                    pdf_bytes, metricas = futuro.result()
+                    combinar_metricas(metricas)
+                except Exception as e:
+                    fila['error'] = str(e)
+                    if indice in folios_asignados:
+                        datos = comprobantes[indice]['datos']
+                        devolver_folio(datos['empresa'], 'comprobante', datos['folio'])
+                        datos['folio'] = fila['folio'] = fila['archivo'] = ''
+                else:
+                    # Los PDFs ya vienen comprimidos; se guardan sin volver a comprimir
+                    zip_salida.writestr(fila['archivo'], pdf_bytes, compress_type=zipfile.ZIP_STORED)
+                    fila['estado'] = 'generado'
+                    if archivar:
+                        fila['error'] = _archivar(comprobantes[indice]['datos'], pdf_bytes, config)
+                    del pdf_bytes
+
+                terminados += 1
+                if progreso:
+                    progreso(terminados, total)
+            _enviar()
+
+        texto_resumen = io.StringIO()
+        escritor = csv.DictWriter(texto_resumen, fieldnames=COLUMNAS_RESUMEN)
+        escritor.writeheader()
+        escritor.writerows(resumen)
+        zip_salida.writestr('resumen.csv', '\ufeff' + texto_resumen.getvalue())
+
+    generados = sum(1 for fila in resumen if fila['estado'] == 'generado')
+    return {
+        'total': total,
+        'generados': generados,
+        'errores': total - generados,
+        'segundos': time.perf_counter() - inicio,
+        'filas': resumen
+    }
+
+
+def _inicializar_proceso(config):
+    """Guarda la configuración en el proceso del pool"""
+    global _config_proceso
+    _config_proceso = config
+
+
+def _generar_en_proceso(datos):
+    """Genera un comprobante dentro de un proceso del pool; devuelve el PDF y las métricas del proceso"""
+    from utils.comprobante_utils import generar_comprobante_pdf
+
+    try:
+        return generar_comprobante_pdf(datos, _config_proceso), tomar_metricas()
+    except Exception as e:
+        # Se relanza como Exception simple para que siempre se pueda enviar al proceso principal
+        raise Exception(f"{type(e).__name__}: {e}") from None
+
+
+def _archivar(datos, pdf_bytes, config):
+    """Guarda un comprobante del lote en el archivo local; devuelve el error o ''"""
+    from utils.archivo_utils import archivar_documento
+
+    try:
+        archivar_documento('comprobante', datos, pdf_bytes, config)
+        return ''
+    except Exception as e:
+        return f"No se archivó: {e}"
+
+
+def _leer_filas_csv(archivo):
+    """Filas de un CSV (ruta o file-like object, texto o bytes)"""
+    if isinstance(archivo, str):
+        with open(archivo, 'rb') as f:
+            contenido = f.read()
+    else:
+        if hasattr(archivo, 'seek'):
+            archivo.seek(0)
+        contenido = archivo.read()
+
+    if isinstance(contenido, bytes):
+        try:
+            contenido = contenido.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            # Excel en Windows exporta CSV en Latin-1
+            contenido = contenido.decode('latin-1')
+
+    primera_linea = contenido.split('\n', 1)[0]
+    if '\t' in primera_linea:
+        separador = '\t'
+    elif ';' in primera_linea:
+        separador = ';'
+    else:
+        separador = ','
+
+    return csv.reader(io.StringIO(contenido), delimiter=separador)
+
+
+def _leer_filas_xlsx(archivo):
+    """Filas de la primera hoja de un XLSX (requiere openpyxl)"""
+    if not OPENPYXL_DISPONIBLE:
+        raise Exception("Para leer archivos XLSX instala openpyxl: pip install openpyxl")
+    from openpyxl import load_workbook
+
+    if hasattr(archivo, 'seek'):
+        archivo.seek(0)
+    libro = load_workbook(archivo, read_only=True, data_only=True)
+    try:
+        for fila in libro.worksheets[0].iter_rows(values_only=True):
+            yield [_celda_xlsx(celda) for celda in fila]
+    finally:
+        libro.close()
+
+
+def _celda_xlsx(celda):
+    """Valor de una celda de Excel como lo escribiría un CSV"""
+    if celda is None:
+        return ''
+    if isinstance(celda, datetime):
+        return celda.isoformat(timespec='seconds')
+    if isinstance(celda, float) and celda.is_integer():
+        # Teléfonos y referencias numéricas que Excel guarda como 5512345678.0
+        return str(int(celda))
+    return celda
+
+
+def _interpretar_fecha(texto):
+    """Fecha de una celda: ISO, dd/mm/aaaa, dd-mm-aaaa o número de serie de Excel; None si no es válida"""
+    texto = str(texto).strip()
+    try:
+        return datetime.fromisoformat(texto)
+    except ValueError:
+        pass
+
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato)
+        except ValueError:
+            continue
+
+    try:
+        serie = float(texto)
+    except ValueError:
+        return None
+    # Solo números de serie razonables (1900 a 2173); un folio o monto no es una fecha
+    if not 1 <= serie < 100000:
+        return None
+    return (ORIGEN_FECHAS_EXCEL + timedelta(days=serie)).replace(microsecond=0)
+
+
+def _normalizar_encabezado(celda):
+    """Nombre de columna a partir del encabezado del archivo"""
+    nombre = str(celda or '').strip().lower().replace(' ', '_')
+    return ALIAS_COLUMNAS.get(nombre, nombre)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    # El pool de procesos necesita las funciones del módulo importado, no de __main__
+    from utils.lote_utils import leer_pagos, agrupar_pagos, indexar_adjuntos, generar_lote_comprobantes
+    from utils.recursos_utils import obtener_configuracion
+
+    parser = argparse.ArgumentParser(description="Genera comprobantes de pago desde una exportación de pagos")
+    parser.add_argument("pagos", help="Archivo CSV o XLSX con los pagos")
+    parser.add_argument("--imagenes", help="Carpeta con las imágenes y PDF de los comprobantes")
+    parser.add_argument("--salida", default="comprobantes.zip", help="Archivo ZIP de salida")
+    parser.add_argument("--empresa", help="Nombre o serie de la división por defecto")
+    parser.add_argument("--procesos", type=int, help="Número de procesos")
+    parser.add_argument("--archivar", action="store_true", help="Guarda los comprobantes en el archivo local")
+    argumentos = parser.parse_args()
+
+    config_lote = obtener_configuracion()
+    if config_lote is None:
+        parser.error("No se pudo cargar data/config.json")
+
+    empresa_lote = config_lote['empresas'][0]
+    if argumentos.empresa:
+        buscada = argumentos.empresa.lower()
+        empresa_lote = next((emp for emp in config_lote['empresas']
+                             if buscada in (emp['nombre'].lower(), obtener_serie(emp).lower())), None)
+        if empresa_lote is None:
+            parser.error(f"No existe la empresa {argumentos.empresa}; opciones: "
+                         + ", ".join(emp['nombre'] for emp in config_lote['empresas']))
+
+    lote = agrupar_pagos(leer_pagos(argumentos.pagos), empresa_lote, config_lote)
+    resultado = generar_lote_comprobantes(
+        lote, config_lote, argumentos.salida,
+        adjuntos=indexar_adjuntos(argumentos.imagenes, [c['referencia'] for c in lote]),
+        max_procesos=argumentos.procesos,
+        archivar=argumentos.archivar,
+        progreso=lambda hechos, total: print(f"\r{hechos}/{total}", end='', flush=True)
+    )
+
+    print(f"\nGenerados: {resultado['generados']}  Errores: {resultado['errores']}  "
+          f"Tiempo: {resultado['segundos']:.1f} s  ->  {argumentos.salida}")
+    for fila in resultado['filas']:
+        if fila['error']:
+            print(f"  {fila['referencia']}: {fila['error']}")
@@ -0,0 +1,329 @@
+"""
+Métricas de rendimiento: tiempos por etapa, tamaños, páginas y aciertos de caché
+
+Cada registro es una actualización de un dict protegida por un candado (unos
+microsegundos), así que las métricas quedan siempre activas. Se exportan en el
+formato de texto de Prometheus (exportar_prometheus, iniciar_servidor_metricas)
+y como resumen para el panel de administración de la aplicación.
+
+Los procesos de un pool (lote, API) envían sus métricas al proceso principal con
+tomar_metricas / combinar_metricas.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Límites superiores de los histogramas
+CUBETAS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CUBETAS_BYTES = (10_000, 50_000, 100_000, 500_000, 1_000_000, 5_000_000, 20_000_000, 100_000_000)
+CUBETAS_PAGINAS = (1, 2, 5, 10, 50, 100, 500, 1000, 5000)
+
+# nombre: (tipo, ayuda, cubetas)
+METRICAS = {
+    'documentador_etapa_segundos': ('histogram', "Duración de cada etapa de generación", CUBETAS_SEGUNDOS),
+    'documentador_bytes': ('histogram', "Tamaño de entradas y salidas por operación", CUBETAS_BYTES),
+    'documentador_paginas': ('histogram', "Páginas de los documentos por operación", CUBETAS_PAGINAS),
+    'documentador_cache_total': ('counter', "Consultas a cada caché por resultado", None)
+}
+
+_histogramas = {}
+_contadores = {}
+_lock = threading.Lock()
+_local = threading.local()
+
+
+@contextmanager
+def medir(etapa):
+    """
+    Mide la duración de un bloque como etapa.
+
+    Ejemplo:
+        with medir('doc_build'):
+            doc.build(elements)
+
+    Args:
+        etapa: Nombre de la etapa (conversion_word, overlay, fusion, doc_build, ...)
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_tiempo(etapa, time.perf_counter() - inicio)
+
+
+def registrar_tiempo(etapa, segundos):
+    """Registra la duración de una etapa en segundos"""
+    _observar('documentador_etapa_segundos', (('etapa', etapa),), segundos)
+    etapas = getattr(_local, 'etapas', None)
+    if etapas is not None:
+        etapas.append((etapa, segundos))
+
+
+@contextmanager
+def capturar_etapas():
+    """
+    Además de registrarlas, junta en una lista las etapas medidas en este hilo.
+
+    Ejemplo:
+        with capturar_etapas() as etapas:
+            aplicar_membrete_pdf(pdf, membrete)
+        # etapas == [('lectura', 0.01), ('overlay', 0.2), ...]
+
+    Las etapas anidadas aparecen antes que la etapa que las contiene (se
+    registran al terminar).
+    """
+    anterior = getattr(_local, 'etapas', None)
+    etapas = _local.etapas = []
+    try:
+        yield etapas
+    finally:
+        _local.etapas = anterior
+
+
+def registrar_bytes(operacion, sentido, cantidad):
+    """
+    Registra el tamaño de una entrada o salida.
+
+    Args:
+        operacion: Operación (membrete, cotizacion, comprobante, ...)
+        sentido: 'entrada' o 'salida'
+        cantidad: Tamaño en bytes
+    """
+    _observar('documentador_bytes', (('operacion', operacion), ('sentido', sentido)), cantidad)
+
+
+def registrar_paginas(operacion, cantidad):
+    """Registra las páginas de un documento generado o procesado"""
+    _observar('documentador_paginas', (('operacion', operacion),), cantidad)
+
+
+def registrar_cache(cache, acierto):
+    """
+    Registra una consulta a una caché.
+
+    Args:
+        cache: Nombre de la caché (pdf, overlay, logo, plantilla, ...)
+        acierto: True si el valor ya estaba en la caché
+    """
+    clave = ('documentador_cache_total', (('cache', cache), ('resultado', 'acierto' if acierto else 'fallo')))
+    with _lock:
+        _contadores[clave] = _contadores.get(clave, 0) + 1
+
+
+def tamano_de(archivo):
+    """
+    Tamaño en bytes de bytes o de un file-like object, sin consumirlo.
+
+    Returns:
+        int: Tamaño, o None si no se puede saber
+    """
+    if isinstance(archivo, (bytes, bytearray)):
+        return len(archivo)
+    if hasattr(archivo, 'getbuffer'):
+        return archivo.getbuffer().nbytes
+    if hasattr(archivo, 'size') and isinstance(archivo.size, int):
+        return archivo.size
+    return None
+
+
+def tomar_metricas():
+    """
+    Devuelve las métricas acumuladas y las reinicia (para enviarlas desde un proceso del pool).
+
+    Returns:
+        dict: {'histogramas': ..., 'contadores': ...} para combinar_metricas
+    """
+    with _lock:
+        datos = {'histogramas': dict(_histogramas), 'contadores': dict(_contadores)}
+        _histogramas.clear()
+        _contadores.clear()
+    return datos
+
+
+def combinar_metricas(datos):
+    """
+    Suma métricas tomadas en otro proceso con tomar_metricas.
+
+    Args:
+        datos: Dict devuelto por tomar_metricas
+    """
+    if not datos:
+        return
+    with _lock:
+        for clave, (conteos, suma, cuenta) in datos['histogramas'].items():
+            actual = _histogramas.setdefault(clave, [[0] * len(conteos), 0.0, 0])
+            actual[0] = [a + b for a, b in zip(actual[0], conteos)]
+            actual[1] += suma
+            actual[2] += cuenta
+        for clave, valor in datos['contadores'].items():
+            _contadores[clave] = _contadores.get(clave, 0) + valor
+
+
+def exportar_prometheus():
+    """
+    Exporta las métricas en el formato de texto de Prometheus.
+
+    Returns:
+        str: Texto para el endpoint /metrics
+    """
+    with _lock:
+        histogramas = {clave: (list(c), s, n) for clave, (c, s, n) in _histogramas.items()}
+        contadores = dict(_contadores)
+
+    lineas = []
+    for nombre, (tipo, ayuda, cubetas) in METRICAS.items():
+        lineas.append(f"# HELP {nombre} {ayuda}")
+        lineas.append(f"# TYPE {nombre} {tipo}")
+        if tipo == 'counter':
+            for (metrica, etiquetas), valor in sorted(contadores.items()):
+                if metrica == nombre:
+                    lineas.append(f"{nombre}{_etiquetas(etiquetas)} {valor}")
+            continue
+
+        for (metrica, etiquetas), (conteos, suma, cuenta) in sorted(histogramas.items()):
+            if metrica != nombre:
+                continue
+            acumulado = 0
+            for limite, conteo in zip(cubetas, conteos):
+                acumulado += conteo
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', _numero(limite)),))} {acumulado}")
+            lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas + (('le', '+Inf'),))} {cuenta}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(suma)}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {cuenta}")
+
+    return "\n".join(lineas) + "\n"
+
+
+def obtener_resumen():
+    """
+    Resumen de las métricas para mostrarlo en pantalla.
+
+    Returns:
+        dict: {'etapas': [{'etapa', 'cantidad', 'promedio', 'p95'}],
+               'tamanos': [{'operacion', 'sentido', 'cantidad', 'promedio'}],
+               'caches': [{'cache', 'aciertos', 'fallos', 'tasa'}]}
+    """
+    with _lock:
+        histogramas = {clave: (list(c), s, n) for clave, (c, s, n) in _histogramas.items()}
+        contadores = dict(_contadores)
+
+    etapas, tamanos = [], []
+    for (nombre, etiquetas), (conteos, suma, cuenta) in sorted(histogramas.items()):
+        valores = dict(etiquetas)
+        if nombre == 'documentador_etapa_segundos':
+            etapas.append({
+                'etapa': valores['etapa'],
+                'cantidad': cuenta,
+                'promedio': suma / cuenta if cuenta else 0.0,
+                'p95': _cuantil(conteos, cuenta, CUBETAS_SEGUNDOS, 0.95)
+            })
+        elif nombre == 'documentador_bytes':
+            tamanos.append({
+                'operacion': valores['operacion'],
+                'sentido': valores['sentido'],
+                'cantidad': cuenta,
+                'promedio': suma / cuenta if cuenta else 0.0
+            })
+
+    caches = {}
+    for (_, etiquetas), valor in contadores.items():
+        valores = dict(etiquetas)
+        cache = caches.setdefault(valores['cache'], {'cache': valores['cache'], 'aciertos': 0, 'fallos': 0})
+        cache['aciertos' if valores['resultado'] == 'acierto' else 'fallos'] += valor
+    for cache in caches.values():
+        consultas = cache['aciertos'] + cache['fallos']
+        cache['tasa'] = cache['aciertos'] / consultas if consultas else 0.0
+
+    return {'etapas': etapas, 'tamanos': tamanos, 'caches': sorted(caches.values(), key=lambda c: c['cache'])}
+
+
+def reiniciar_metricas():
+    """Borra todas las métricas acumuladas"""
+    with _lock:
+        _histogramas.clear()
+        _contadores.clear()
+
+
+def iniciar_servidor_metricas(puerto, host="127.0.0.1"):
+    """
+    Sirve las métricas en http://host:puerto/metrics desde un hilo en segundo plano.
+
+    Args:
+        puerto: Puerto donde escuchar
+        host: Dirección (por defecto solo local)
+
+    Returns:
+        ThreadingHTTPServer: Servidor iniciado
+    """
+    servidor = ThreadingHTTPServer((host, puerto), _ManejadorMetricas)
+    servidor.daemon_threads = True
+    hilo = threading.Thread(target=servidor.serve_forever, name="servidor-metricas", daemon=True)
+    hilo.start()
+    return servidor
+
+
+class _ManejadorMetricas(BaseHTTPRequestHandler):
+    """Responde GET /metrics con exportar_prometheus"""
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/metrics', '/metricas'):
+            self.send_error(404)
+            return
+        cuerpo = exportar_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass
+
+
+def _observar(nombre, etiquetas, valor):
+    """Agrega un valor al histograma de una métrica"""
+    cubetas = METRICAS[nombre][2]
+    indice = len(cubetas)
+    for i, limite in enumerate(cubetas):
+        if valor <= limite:
+            indice = i
+            break
+
+    with _lock:
+        histograma = _histogramas.get((nombre, etiquetas))
+        if histograma is None:
+            histograma = _histogramas[(nombre, etiquetas)] = [[0] * (len(cubetas) + 1), 0.0, 0]
+        histograma[0][indice] += 1
+        histograma[1] += valor
+        histograma[2] += 1
+
+
+def _cuantil(conteos, cuenta, cubetas, q):
+    """Cuantil aproximado: límite superior de la cubeta donde cae"""
+    if not cuenta:
+        return 0.0
+    objetivo = q * cuenta
+    acumulado = 0
+    for limite, conteo in zip(cubetas, conteos):
+        acumulado += conteo
+        if acumulado >= objetivo:
+            return float(limite)
+    return float('inf')
+
+
+def _etiquetas(etiquetas):
+    """{clave="valor",...} con los valores escapados"""
+    if not etiquetas:
+        return ""
+    partes = []
+    for clave, valor in etiquetas:
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{clave}="{valor}"')
+    return "{" + ",".join(partes) + "}"
+
+
+def _numero(valor):
+    """Número en el formato de Prometheus"""
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
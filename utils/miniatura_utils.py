@@ -0,0 +1,190 @@
+"""
+Utilidades para miniaturas de membretes y vistas previas de PDFs
+
+Las miniaturas se guardan en memoria (LRU) y en disco (cache/miniaturas):
+- Membretes: por ruta, fecha de modificación y tamaño del archivo, así que se
+  generan una sola vez y se regeneran solo cuando el archivo cambia.
+- PDFs: por hash del contenido; se rasteriza solo la primera página a baja
+  resolución con pypdfium2 (opcional: sin él no hay vista previa de PDFs).
+
+La carpeta en disco se limpia con los mismos límites de edad y tamaño que la
+caché de PDFs (ver cache_utils.programar_limpieza).
+"""
+import hashlib
+import importlib.util
+import io
+import os
+import threading
+from collections import OrderedDict
+
+from utils.cache_utils import marcar_uso, programar_limpieza
+from utils.metricas_utils import registrar_cache
+
+
+DIRECTORIO_MINIATURAS = "cache/miniaturas"
+MAX_ENTRADAS_MEMORIA = 64
+
+# Ancho en pixeles de las miniaturas (el doble de lo que se muestra, para pantallas de alta densidad)
+ANCHO_MINIATURA = 500
+
+# pypdfium2 solo se carga al rasterizar un PDF
+PYPDFIUM2_DISPONIBLE = importlib.util.find_spec('pypdfium2') is not None
+
+_cache_memoria = OrderedDict()
+_lock = threading.Lock()
+# PDFium no admite llamadas simultáneas desde varios hilos: todo el que lo use
+# dentro del proceso (miniaturas, vista previa, exportación) toma este lock
+lock_pdfium = threading.Lock()
+
+
+def obtener_miniatura_membrete(membrete_path, ancho=ANCHO_MINIATURA):
+    """
+    Obtiene la miniatura PNG de un membrete.
+
+    Args:
+        membrete_path: Ruta al archivo PNG del membrete
+        ancho: Ancho de la miniatura en pixeles
+
+    Returns:
+        bytes: Imagen PNG, o None si el archivo no se puede leer
+    """
+    try:
+        info = os.stat(membrete_path)
+    except OSError:
+        return None
+
+    firma = f"{os.path.abspath(membrete_path)}|{info.st_mtime_ns}|{info.st_size}|{ancho}"
+    clave = hashlib.sha256(firma.encode('utf-8')).hexdigest()
+
+    return _obtener_o_generar(clave, lambda: _reducir_imagen(membrete_path, ancho))
+
+
+def obtener_vista_previa_pdf(pdf_bytes, ancho=ANCHO_MINIATURA, sha256=None):
+    """
+    Obtiene una imagen PNG de baja resolución de la primera página de un PDF.
+
+    Args:
+        pdf_bytes: PDF en bytes o file-like object (UploadedFile, BytesIO); con
+            sha256, también una función que lo lee
+        ancho: Ancho de la imagen en pixeles
+        sha256: Hash del PDF ya conocido (documentos archivados): el PDF solo se
+            lee si la imagen no está en caché
+
+    Returns:
+        bytes: Imagen PNG, o None si pypdfium2 no está instalado o el PDF no se puede leer
+    """
+    if not PYPDFIUM2_DISPONIBLE:
+        return None
+
+    if sha256 is None:
+        if hasattr(pdf_bytes, 'getvalue'):
+            pdf_bytes = pdf_bytes.getvalue()
+        sha256 = hashlib.sha256(pdf_bytes).hexdigest()
+        leer = lambda: pdf_bytes
+    elif callable(pdf_bytes):
+        leer = pdf_bytes
+    else:
+        leer = lambda: pdf_bytes.getvalue() if hasattr(pdf_bytes, 'getvalue') else pdf_bytes
+
+    clave = hashlib.sha256(f"{sha256}|{ancho}".encode('utf-8')).hexdigest()
+
+    return _obtener_o_generar(clave, lambda: rasterizar_primera_pagina(leer(), ancho))
+
+
+def limpiar_miniaturas_memoria():
+    """Vacía la caché en memoria (la caché en disco se conserva)"""
+    with _lock:
+        _cache_memoria.clear()
+
+
+def rasterizar_primera_pagina(pdf_bytes, ancho, optimizar=True):
+    """
+    Rasteriza la primera página de un PDF (sin caché; requiere pypdfium2).
+
+    Args:
+        pdf_bytes: PDF en bytes
+        ancho: Ancho de la imagen en pixeles
+        optimizar: Comprime el PNG al máximo; sin optimizar tarda varias veces menos
+            (para imágenes que se descartan pronto, como la vista previa en vivo)
+
+    Returns:
+        bytes: Imagen PNG
+    """
+    import pypdfium2 as pdfium
+
+    with lock_pdfium:
+        documento = pdfium.PdfDocument(pdf_bytes)
+        try:
+            pagina = documento[0]
+            escala = ancho / pagina.get_width()
+            imagen = pagina.render(scale=escala).to_pil()
+        finally:
+            documento.close()
+
+    return _a_png(imagen, optimizar)
+
+
+def _obtener_o_generar(clave, generar):
+    """Busca la miniatura en memoria y en disco, o la genera y la guarda en ambas"""
+    with _lock:
+        if clave in _cache_memoria:
+            _cache_memoria.move_to_end(clave)
+            registrar_cache('miniatura', True)
+            return _cache_memoria[clave]
+
+    ruta = os.path.join(DIRECTORIO_MINIATURAS, clave[:2], f"{clave}.png")
+    try:
+        with open(ruta, 'rb') as f:
+            imagen = f.read()
+        marcar_uso(ruta)
+        registrar_cache('miniatura', True)
+    except OSError:
+        registrar_cache('miniatura', False)
+        try:
+            imagen = generar()
+        except Exception as e:
+            print(f"Error al generar miniatura: {e}")
+            return None
+        _guardar_en_disco(ruta, imagen)
+
+    with _lock:
+        _cache_memoria[clave] = imagen
+        _cache_memoria.move_to_end(clave)
+        while len(_cache_memoria) > MAX_ENTRADAS_MEMORIA:
+            _cache_memoria.popitem(last=False)
+    return imagen
+
+
+def _guardar_en_disco(ruta, imagen):
+    """Escribe la miniatura de forma atómica"""
+    try:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        ruta_tmp = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(ruta_tmp, 'wb') as f:
+            f.write(imagen)
+        os.replace(ruta_tmp, ruta)
+    except OSError as e:
+        print(f"Error al guardar miniatura en caché: {e}")
+
+    programar_limpieza(DIRECTORIO_MINIATURAS)
+
+
+def _reducir_imagen(ruta, ancho):
+    """PNG de una imagen reducida al ancho indicado (sin ampliarla)"""
+    from PIL import Image as PILImage
+
+    with PILImage.open(ruta) as imagen:
+        # thumbnail conserva la proporción: el alto original nunca limita
+        imagen.thumbnail((ancho, imagen.height))
+        return _a_png(imagen)
+
+
+def _a_png(imagen, optimizar=True):
+    """Bytes PNG de una imagen PIL"""
+    buffer = io.BytesIO()
+    if optimizar:
+        imagen.save(buffer, format='PNG', optimize=True)
+    else:
+        imagen.save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
@@ -1,22 +1,30 @@
 """
 Utilidades para manipulación de PDFs y aplicación de membretes
 """
+import importlib.util
 import io
 import os
 import tempfile
-from PyPDF2 import PdfReader, PdfWriter
+import threading
+from PyPDF2 import PdfReader, PdfWriter, PageObject
+from PyPDF2.generic import ArrayObject, DecodedStreamObject, DictionaryObject, FloatObject, NameObject
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.utils import ImageReader
-from PIL import Image
+from utils.metricas_utils import medir, registrar_bytes, registrar_cache, registrar_paginas, tamano_de
+from utils.perfil_utils import perfilado
+from utils.recursos_utils import registrar_invalidacion
 
-try:
-    from docx2pdf import convert
-    DOCX2PDF_DISPONIBLE = True
-except ImportError:
-    DOCX2PDF_DISPONIBLE = False
+# docx2pdf solo se carga al convertir un documento Word
+DOCX2PDF_DISPONIBLE = importlib.util.find_spec('docx2pdf') is not None
+
+# Membretes ya decodificados y overlays ya generados, por ruta: {ruta: ((mtime, tamaño), valor)}
+_imagenes_membrete = {}
+_overlays_membrete = {}
+_lock_membretes = threading.Lock()
 
 
+@perfilado('membrete')
 def aplicar_membrete_pdf(pdf_file, membrete_path):
     """
     Aplica un membrete a todas las páginas de un PDF.
@@ -28,29 +36,70 @@ def aplicar_membrete_pdf(pdf_file, membrete_path):
     Returns:
         bytes: PDF con el membrete aplicado
     """
+    tamano_entrada = tamano_de(pdf_file)
+    if tamano_entrada is not None:
+        registrar_bytes('membrete', 'entrada', tamano_entrada)
+    
     # Leer el PDF original
-    pdf_reader = PdfReader(pdf_file)
+    with medir('lectura'):
+        pdf_reader = PdfReader(pdf_file)
     pdf_writer = PdfWriter()
     
-    # Crear overlay del membrete
-    overlay_buffer = crear_overlay_membrete(membrete_path)
-    overlay_pdf = PdfReader(overlay_buffer)
-    overlay_page = overlay_pdf.pages[0]
+    # Overlay del membrete (se genera una sola vez por membrete)
+    with medir('overlay'):
+        overlay_pdf = PdfReader(io.BytesIO(obtener_overlay_membrete(membrete_path)))
+        overlay_page = overlay_pdf.pages[0]
     
     # Aplicar el membrete a cada página
-    for page in pdf_reader.pages:
-        # Superponer el membrete sobre la página original
-        page.merge_page(overlay_page)
-        pdf_writer.add_page(page)
+    with medir('fusion'):
+        for page in pdf_reader.pages:
+            # Superponer el membrete sobre la página original
+            page.merge_page(overlay_page)
+            pdf_writer.add_page(page)
     
     # Escribir el resultado a un buffer
     output_buffer = io.BytesIO()
-    pdf_writer.write(output_buffer)
+    with medir('escritura'):
+        pdf_writer.write(output_buffer)
     output_buffer.seek(0)
     
+    registrar_paginas('membrete', len(pdf_writer.pages))
+    registrar_bytes('membrete', 'salida', output_buffer.getbuffer().nbytes)
     return output_buffer.getvalue()
 
 
+def obtener_overlay_membrete(membrete_path):
+    """
+    Obtiene el PDF de overlay de un membrete, generándolo solo la primera vez.
+    
+    Args:
+        membrete_path: Ruta al archivo PNG del membrete
+        
+    Returns:
+        bytes: PDF de una página con el membrete
+    """
+    firma, ruta = _firma_membrete(membrete_path)
+    
+    with _lock_membretes:
+        guardado = _overlays_membrete.get(ruta)
+        if guardado is not None and guardado[0] == firma:
+            registrar_cache('overlay', True)
+            return guardado[1]
+    
+    registrar_cache('overlay', False)
+    overlay = crear_overlay_membrete(membrete_path).getvalue()
+    with _lock_membretes:
+        _overlays_membrete[ruta] = (firma, overlay)
+    return overlay
+
+
+def limpiar_membretes():
+    """Descarta los membretes decodificados y los overlays generados"""
+    with _lock_membretes:
+        _imagenes_membrete.clear()
+        _overlays_membrete.clear()
+
+
 def crear_overlay_membrete(membrete_path):
     """
     Crea un PDF de una página con el membrete como overlay transparente.
@@ -62,36 +111,10 @@ def crear_overlay_membrete(membrete_path):
         BytesIO: Buffer con el PDF del overlay
     """
     buffer = io.BytesIO()
-    c = canvas.Canvas(buffer, pagesize=letter)
-    width, height = letter  # 8.5 x 11 pulgadas (612 x 792 puntos)
+    c = canvas.Canvas(buffer, pagesize=letter)  # 8.5 x 11 pulgadas (612 x 792 puntos)
     
     try:
-        # Abrir imagen del membrete
-        img = Image.open(membrete_path)
-        img_width, img_height = img.size
-        
-        # Calcular la proporción de la imagen
-        aspect_ratio = img_width / img_height
-        page_aspect_ratio = width / height
-        
-        # Ajustar para cubrir toda la página manteniendo proporción
-        if aspect_ratio > page_aspect_ratio:
-            # La imagen es más ancha proporcionalmente
-            new_height = height
-            new_width = height * aspect_ratio
-            x_offset = -(new_width - width) / 2
-            y_offset = 0
-        else:
-            # La imagen es más alta proporcionalmente
-            new_width = width
-            new_height = width / aspect_ratio
-            x_offset = 0
-            y_offset = 0
-        
-        # Dibujar la imagen como overlay desde la parte superior
-        # En ReportLab, y=0 es abajo, así que para que esté arriba usamos height - new_height
-        c.drawImage(membrete_path, x_offset, height - new_height + y_offset, 
-                   width=new_width, height=new_height, mask='auto')
+        dibujar_membrete(c, membrete_path)
     except Exception as e:
         print(f"Error al cargar membrete: {e}")
     
@@ -100,6 +123,173 @@ def crear_overlay_membrete(membrete_path):
     return buffer
 
 
+def dibujar_membrete(c, membrete_path):
+    """
+    Dibuja el membrete cubriendo la página actual de un canvas.
+    
+    La imagen se decodifica una sola vez por archivo (ver obtener_imagen_membrete)
+    y dentro de un mismo PDF se guarda una sola vez aunque aparezca en varias páginas.
+    
+    Args:
+        c: Canvas de ReportLab
+        membrete_path: Ruta al archivo PNG del membrete
+    """
+    imagen = obtener_imagen_membrete(membrete_path)
+    width, height = c._pagesize
+    img_width, img_height = imagen.getSize()
+    
+    # Calcular la proporción de la imagen
+    aspect_ratio = img_width / img_height
+    page_aspect_ratio = width / height
+    
+    # Ajustar para cubrir toda la página manteniendo proporción
+    if aspect_ratio > page_aspect_ratio:
+        # La imagen es más ancha proporcionalmente
+        new_height = height
+        new_width = height * aspect_ratio
+        x_offset = -(new_width - width) / 2
+    else:
+        # La imagen es más alta proporcionalmente
+        new_width = width
+        new_height = width / aspect_ratio
+        x_offset = 0
+    
+    # Dibujar la imagen desde la parte superior
+    # En ReportLab, y=0 es abajo, así que para que esté arriba usamos height - new_height
+    c.saveState()
+    c.drawImage(imagen, x_offset, height - new_height,
+                width=new_width, height=new_height, mask='auto')
+    c.restoreState()
+
+
+def crear_fondo_membrete(membrete_path):
+    """
+    Crea la función de página que dibuja el membrete como fondo durante doc.build.
+    
+    Se usa como onFirstPage/onLaterPages de SimpleDocTemplate; así el documento sale
+    con membrete en un solo render, sin volver a leer y combinar el PDF con PyPDF2.
+    
+    Args:
+        membrete_path: Ruta al archivo PNG del membrete
+        
+    Returns:
+        function: Función (canvas, doc) para doc.build
+    """
+    obtener_imagen_membrete(membrete_path)
+    
+    def _fondo(c, doc):
+        dibujar_membrete(c, membrete_path)
+    
+    return _fondo
+
+
+def obtener_imagen_membrete(membrete_path):
+    """
+    Obtiene el membrete como ImageReader ya decodificado.
+    
+    Se guarda en memoria por ruta y se vuelve a leer si el archivo cambia; los
+    documentos siguientes no vuelven a abrir ni decodificar el PNG.
+    
+    Args:
+        membrete_path: Ruta al archivo PNG del membrete
+        
+    Returns:
+        ImageReader: Imagen del membrete
+    """
+    firma, ruta = _firma_membrete(membrete_path)
+    
+    with _lock_membretes:
+        guardado = _imagenes_membrete.get(ruta)
+        if guardado is not None and guardado[0] == firma:
+            registrar_cache('imagen_membrete', True)
+            return guardado[1]
+        
+        registrar_cache('imagen_membrete', False)
+        imagen = ImageReader(membrete_path)
+        # Decodifica la imagen y separa el canal alfa una sola vez
+        imagen.getRGBData()
+        _imagenes_membrete[ruta] = (firma, imagen)
+        return imagen
+
+
+def _firma_membrete(membrete_path):
+    """((mtime, tamaño), ruta absoluta) de un membrete para sus cachés"""
+    info = os.stat(membrete_path)
+    return (info.st_mtime_ns, info.st_size), os.path.abspath(membrete_path)
+
+
+def anexar_pdfs(pdf_bytes, anexos, ajustar=False):
+    """
+    Agrega al final de un PDF las páginas de otros PDFs (por ejemplo, comprobantes
+    bancarios), copiando sus objetos sin rasterizar.
+    
+    Args:
+        pdf_bytes: PDF base en bytes
+        anexos: Lista de PDFs a anexar (bytes, ruta o file-like object)
+        ajustar: Si es True, cada página anexada se reduce a un recuadro de 4x5
+            pulgadas centrado en una hoja carta (como Form XObject, sigue siendo vectorial)
+        
+    Returns:
+        bytes: PDF con las páginas anexadas
+    """
+    pdf_writer = PdfWriter()
+    
+    for page in PdfReader(io.BytesIO(pdf_bytes)).pages:
+        pdf_writer.add_page(page)
+    
+    with medir('anexos'):
+        for anexo in anexos:
+            if isinstance(anexo, (bytes, bytearray)):
+                anexo = io.BytesIO(anexo)
+            elif hasattr(anexo, 'seek'):
+                anexo.seek(0)
+            
+            for page in PdfReader(anexo).pages:
+                if ajustar:
+                    _agregar_pagina_ajustada(pdf_writer, page, 4 * 72, 5 * 72)
+                else:
+                    pdf_writer.add_page(page)
+    
+    output_buffer = io.BytesIO()
+    with medir('escritura'):
+        pdf_writer.write(output_buffer)
+    return output_buffer.getvalue()
+
+
+def _agregar_pagina_ajustada(pdf_writer, page, ancho_max, alto_max):
+    """
+    Agrega una hoja carta con la página dibujada como Form XObject, escalada para caber
+    en ancho_max x alto_max puntos y centrada.
+    """
+    page.transfer_rotation_to_content()
+    caja = page.mediabox
+    ancho, alto = float(caja.width), float(caja.height)
+    
+    contenido = page.get_contents()
+    formulario = DecodedStreamObject()
+    formulario.set_data(contenido.get_data() if contenido is not None else b"")
+    formulario.update({
+        NameObject("/Type"): NameObject("/XObject"),
+        NameObject("/Subtype"): NameObject("/Form"),
+        NameObject("/BBox"): ArrayObject([FloatObject(v) for v in (caja.left, caja.bottom, caja.right, caja.top)]),
+        NameObject("/Resources"): page.get("/Resources", DictionaryObject()),
+    })
+    
+    width, height = letter
+    escala = min(ancho_max / ancho, alto_max / alto)
+    x = (width - ancho * escala) / 2 - float(caja.left) * escala
+    y = (height - alto * escala) / 2 - float(caja.bottom) * escala
+    
+    hoja = PageObject.create_blank_page(width=width, height=height)
+    hoja[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/XObject"): DictionaryObject({NameObject("/Anexo"): formulario})
+    })
+    dibujo = DecodedStreamObject()
+    dibujo.set_data(f"q {escala:.6f} 0 0 {escala:.6f} {x:.4f} {y:.4f} cm /Anexo Do Q".encode())
+    hoja[NameObject("/Contents")] = dibujo
+    pdf_writer.add_page(hoja)
+
+
 def validar_pdf(file):
     """
     Valida que el archivo sea un PDF válido.
@@ -130,6 +320,7 @@ def convertir_word_a_pdf(docx_file):
     """
     if not DOCX2PDF_DISPONIBLE:
         raise ImportError("La librería docx2pdf no está instalada. Instala con: pip install docx2pdf")
+    from docx2pdf import convert
     
     try:
         # Crear archivos temporales
@@ -140,11 +331,14 @@ def convertir_word_a_pdf(docx_file):
         tmp_pdf_path = tmp_docx_path.replace('.docx', '.pdf')
         
         # Convertir Word a PDF
-        convert(tmp_docx_path, tmp_pdf_path)
+        with medir('conversion_word'):
+            convert(tmp_docx_path, tmp_pdf_path)
         
         # Leer el PDF generado
         with open(tmp_pdf_path, 'rb') as pdf_file:
             pdf_bytes = pdf_file.read()
+        registrar_bytes('conversion_word', 'entrada', os.path.getsize(tmp_docx_path))
+        registrar_bytes('conversion_word', 'salida', len(pdf_bytes))
         
         # Limpiar archivos temporales
         try:
@@ -192,3 +386,5 @@ def validar_documento(file, nombre_archivo):
     else:
         return False, None, f"Formato no soportado: {extension}"
 
+
+registrar_invalidacion(limpiar_membretes)
@@ -0,0 +1,213 @@
+"""
+Perfilado de la generación de documentos para analizar casos lentos
+
+Con el perfilado activo, aplicar_membrete_pdf y el render de cotizaciones y
+comprobantes (sin la caché de PDFs, que se omite mientras se perfila) se
+ejecutan bajo cProfile y tracemalloc y cada llamada deja en DIRECTORIO_PERFILES
+tres archivos con el mismo nombre (<fecha>_<operacion>_<hash>):
+- .txt   reporte legible: funciones con más tiempo, memoria pico, líneas que
+         más memoria asignaron y tiempo de cada etapa
+- .prof  estadísticas de cProfile (pstats, snakeviz)
+- .json  resumen (operación, hash de la entrada, duración, memoria, etapas)
+
+El hash identifica la entrada (PDF, datos del documento) sin guardarla, para
+reconocer el mismo caso al reproducirlo.
+
+El perfilado se activa para todo el proceso con DOCUMENTADOR_PERFIL=1 (también
+en los procesos del lote y de api.py) o solo para el hilo actual con
+activar_perfil (la aplicación lo hace con el interruptor de administración).
+Perfilar hace la generación varias veces más lenta.
+"""
+import functools
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+from utils.cache_utils import canonizar
+from utils.metricas_utils import capturar_etapas
+
+
+DIRECTORIO_PERFILES = "perfiles"
+
+# Funciones y líneas que se incluyen en los reportes
+FUNCIONES_REPORTE = 40
+ASIGNACIONES_REPORTE = 25
+
+_local = threading.local()
+# cProfile y tracemalloc son globales: se perfila una llamada a la vez
+_lock_perfil = threading.Lock()
+
+
+def perfil_activo():
+    """Indica si las funciones perfiladas se perfilan en el hilo actual"""
+    if getattr(_local, 'activo', False):
+        return True
+    return os.environ.get("DOCUMENTADOR_PERFIL", "0") == "1"
+
+
+def activar_perfil(activo):
+    """
+    Activa o desactiva el perfilado para el hilo actual.
+
+    Args:
+        activo: True para perfilar las siguientes llamadas de este hilo
+    """
+    _local.activo = bool(activo)
+
+
+def obtener_ultimo_reporte():
+    """
+    Ruta del último reporte generado en el hilo actual.
+
+    Returns:
+        str: Ruta del archivo .txt, o None si no hay
+    """
+    return getattr(_local, 'ultimo_reporte', None)
+
+
+def perfilado(operacion):
+    """
+    Decorador que perfila la función cuando el perfilado está activo.
+
+    Ejemplo:
+        @perfilado('membrete')
+        def aplicar_membrete_pdf(pdf_file, membrete_path):
+            ...
+
+    Args:
+        operacion: Nombre de la operación en los reportes
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            # Las llamadas anidadas quedan dentro del perfil de la externa
+            if not perfil_activo() or getattr(_local, 'perfilando', False):
+                return funcion(*args, **kwargs)
+            if not _lock_perfil.acquire(blocking=False):
+                print(f"Perfilado omitido para {operacion}: hay otro perfil en curso")
+                return funcion(*args, **kwargs)
+            _local.perfilando = True
+            try:
+                return _ejecutar_con_perfil(operacion, funcion, args, kwargs)
+            finally:
+                _local.perfilando = False
+                _lock_perfil.release()
+        return envoltura
+    return decorador
+
+
+def calcular_hash_entrada(*valores):
+    """
+    Hash SHA-256 de los argumentos de una llamada.
+
+    Los archivos (bytes, UploadedFile, BytesIO) se identifican por su contenido,
+    sin consumirlos.
+
+    Returns:
+        str: Hash en hexadecimal
+    """
+    texto = json.dumps(canonizar(list(valores)), sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+
+def _ejecutar_con_perfil(operacion, funcion, args, kwargs):
+    """Ejecuta la función con cProfile y tracemalloc y guarda el reporte"""
+    import cProfile
+    import tracemalloc
+
+    hash_entrada = calcular_hash_entrada(*args, *kwargs.values())
+    perfil = cProfile.Profile()
+
+    iniciado_aqui = not tracemalloc.is_tracing()
+    if iniciado_aqui:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    memoria_inicial = tracemalloc.get_traced_memory()[0]
+
+    error = None
+    inicio = time.perf_counter()
+    try:
+        with capturar_etapas() as etapas:
+            perfil.enable()
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                perfil.disable()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        duracion = time.perf_counter() - inicio
+        memoria_final, memoria_pico = tracemalloc.get_traced_memory()
+        instantanea = tracemalloc.take_snapshot()
+        if iniciado_aqui:
+            tracemalloc.stop()
+
+        resumen = {
+            'operacion': operacion,
+            'funcion': f"{funcion.__module__}.{funcion.__qualname__}",
+            'hash_entrada': hash_entrada,
+            'fecha': datetime.now().isoformat(timespec='seconds'),
+            'pid': os.getpid(),
+            'segundos': duracion,
+            'memoria_pico': memoria_pico - memoria_inicial,
+            'memoria_retenida': memoria_final - memoria_inicial,
+            'etapas': [{'etapa': etapa, 'segundos': segundos} for etapa, segundos in etapas],
+            'error': error
+        }
+        try:
+            _local.ultimo_reporte = _guardar_reporte(resumen, perfil, instantanea)
+        except OSError as e:
+            print(f"Error al guardar el perfil: {e}")
+
+
+def _guardar_reporte(resumen, perfil, instantanea):
+    """Escribe los archivos .txt, .prof y .json del perfil; devuelve la ruta del .txt"""
+    import io
+    import pstats
+    import tracemalloc
+
+    os.makedirs(DIRECTORIO_PERFILES, exist_ok=True)
+    fecha = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+    base = os.path.join(DIRECTORIO_PERFILES, f"{fecha}_{resumen['operacion']}_{resumen['hash_entrada'][:16]}")
+
+    perfil.dump_stats(f"{base}.prof")
+    with open(f"{base}.json", 'w', encoding='utf-8') as f:
+        json.dump(resumen, f, ensure_ascii=False, indent=2)
+
+    texto = io.StringIO()
+    texto.write(f"Operación:        {resumen['operacion']} ({resumen['funcion']})\n")
+    texto.write(f"Hash de entrada:  {resumen['hash_entrada']}\n")
+    texto.write(f"Fecha:            {resumen['fecha']} (PID {resumen['pid']})\n")
+    texto.write(f"Duración:         {resumen['segundos']:.3f} s (con perfilado)\n")
+    texto.write(f"Memoria pico:     {resumen['memoria_pico'] / 1024 / 1024:.1f} MB\n")
+    texto.write(f"Memoria retenida: {resumen['memoria_retenida'] / 1024 / 1024:.1f} MB\n")
+    if resumen['error']:
+        texto.write(f"Error:            {resumen['error']}\n")
+
+    texto.write("\nEtapas\n")
+    for etapa in resumen['etapas']:
+        texto.write(f"  {etapa['etapa']:<20}{etapa['segundos'] * 1000:>10.1f} ms\n")
+
+    texto.write(f"\nLíneas con más memoria asignada al terminar (top {ASIGNACIONES_REPORTE})\n")
+    # Se omiten las asignaciones del propio tracemalloc y de este módulo
+    filtros = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__)
+    ]
+    for estadistica in instantanea.filter_traces(filtros).statistics('lineno')[:ASIGNACIONES_REPORTE]:
+        texto.write(f"  {estadistica}\n")
+
+    texto.write(f"\nFunciones por tiempo acumulado (top {FUNCIONES_REPORTE})\n")
+    estadisticas = pstats.Stats(perfil, stream=texto)
+    estadisticas.sort_stats('cumulative').print_stats(FUNCIONES_REPORTE)
+    texto.write(f"\nFunciones por tiempo propio (top {FUNCIONES_REPORTE})\n")
+    estadisticas.sort_stats('tottime').print_stats(FUNCIONES_REPORTE)
+
+    ruta = f"{base}.txt"
+    with open(ruta, 'w', encoding='utf-8') as f:
+        f.write(texto.getvalue())
+    return ruta
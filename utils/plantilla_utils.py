@@ -0,0 +1,647 @@
+"""
+Motor de plantillas declarativas para generar documentos PDF con ReportLab
+
+Cada tipo de documento se describe con un dict (ver PLANTILLA_COTIZACION en
+cotizacion_utils y PLANTILLA_COMPROBANTE en comprobante_utils):
+
+    {
+        'nombre': 'cotizacion',
+        'titulo': 'Cotización {datos[folio]}',
+        'pagina': {
+            'tamano': letter,
+            'margenes': (arriba, derecha, abajo, izquierda),
+            'margenes_siguientes': (...),             # páginas 2 en adelante (opcional)
+            'encabezado': funcion(canvas, doc, contexto),  # páginas 2 en adelante (opcional)
+            'pie': funcion(canvas, doc, contexto)          # todas las páginas (opcional)
+        },
+        'estilos': {'Titulo': {'parent': 'Heading1', 'fontSize': 24, ...}},
+        'calculos': {'totales': funcion(contexto)},
+        'secciones': [
+            {'tipo': 'parrafo', 'texto': 'Folio: {datos[folio]}', 'estilo': 'Titulo'},
+            {'tipo': 'tabla', 'filas': [...], 'anchos': [...], 'estilo': [...]},
+            {'tipo': 'espacio', 'alto': 0.2*inch},
+            {'tipo': 'salto_pagina'},
+            {'tipo': 'bloque', 'funcion': funcion(contexto, estilos) -> flowables}
+        ]
+    }
+
+Los cálculos son funciones(contexto) cuyo resultado se agrega al contexto con su
+nombre. Los textos son enlaces al contexto con la sintaxis de str.format: {datos[folio]},
+{cliente[nombre]}, {empresa[rfc]}, {fecha:%d/%m/%Y} o {totales[total]:,.2f}. Un
+enlace que es un solo campo sin formato devuelve el valor tal cual (sin
+convertirlo a texto). Las claves que faltan se leen como texto vacío.
+
+En los párrafos el texto de la plantilla es marcado de ReportLab (<b>, <br/>,
+<font>), pero los valores enlazados se escapan (&, <, >): los datos del cliente,
+conceptos o filas de un lote se muestran tal cual y no rompen el párrafo. Un
+cálculo que arma su propio marcado lo devuelve como Marcado para que no se escape.
+
+Cada sección acepta 'si' (nombre de una clave del contexto o función(contexto))
+para incluirla solo si se cumple, y 'alternativa' (lista de secciones) que se usa
+cuando 'si' no se cumple.
+
+Filas de una tabla:
+    [celda, celda, ...]                               fila fija
+    {'si': condicion, 'celdas': [...]}                fila condicional
+    {'por_cada': '{datos[items]}', 'calculos': {...}, 'celdas': [...]}
+        una fila por elemento de la lista enlazada; cada fila ve 'item' e
+        'indice' (desde 1) y sus propios cálculos
+
+Celdas:
+    'texto {enlace}'                                  texto simple
+    {'parrafo': 'texto {enlace}', 'estilo': 'Nombre'}
+    {'imagen': '{empresa[logo]}', 'ancho': ..., 'alto': ...}
+
+El encabezado y el pie se dibujan en las funciones de página de ReportLab, no
+como flowables: se repiten en cada página sin ocupar lugar en el contenido. Para
+"Página X de Y" usan dibujar_numero_pagina (el total se conoce hasta el final
+del documento). Una imagen dibujada con canvas.drawImage en cada página se
+incrusta una sola vez en el PDF (ReportLab la identifica por su contenido), así
+que el logo de un encabezado no hace crecer el archivo por página. Además, cada
+imagen se codifica para el PDF (zlib y ASCII85) una sola vez por proceso: los
+documentos siguientes con el mismo logo o membrete reutilizan el XObject ya
+codificado. Esa caché usa partes internas de ReportLab (PDFImageXObject,
+_digester, idToObject): solo se activa con las versiones de VERSIONES_REPORTLAB,
+y benchmarks/imagenes.py comprueba que el PDF es idéntico con y sin ella.
+
+Las fuentes Helvetica y Helvetica-Bold de estilos y tablas se sustituyen por
+las fuentes de la empresa del documento (ver fuente_utils).
+
+La plantilla se compila una sola vez por juego de fuentes (estilos, TableStyle y
+enlaces ya interpretados) y la versión compilada se reutiliza en cada documento.
+"""
+import io
+import string
+import threading
+import weakref
+from collections import OrderedDict
+from xml.sax.saxutils import escape
+
+from reportlab import Version as VERSION_REPORTLAB
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase.pdfdoc import PDFImageXObject, PDFObjectReference
+from reportlab.pdfbase.pdfmetrics import stringWidth
+from reportlab.pdfgen.canvas import Canvas, _digester
+from reportlab.platypus import (BaseDocTemplate, PageTemplate, Frame, NextPageTemplate, Table, TableStyle,
+                                Paragraph, Spacer, Image, PageBreak)
+
+from utils.cache_utils import obtener_fecha_documento, crear_canvas_determinista
+from utils.fuente_utils import FUENTES_BASE, obtener_fuentes
+from utils.metricas_utils import medir, registrar_cache, registrar_paginas
+from utils.pdf_utils import crear_fondo_membrete
+from utils.recursos_utils import obtener_logo, registrar_invalidacion
+
+
+# Form XObject con el total de páginas (ver dibujar_numero_pagina)
+FORM_TOTAL_PAGINAS = 'total_paginas'
+
+# Bytes de imágenes ya codificadas que se guardan entre documentos
+MAXIMO_BYTES_IMAGENES = 64 * 1024 * 1024
+
+# Versiones de ReportLab [desde, hasta) con las que se probó la caché de imágenes
+# codificadas (benchmarks/imagenes.py); con otras, drawImage codifica como siempre
+VERSIONES_REPORTLAB = ((4, 2, 5), (5, 1))
+
+_compiladas = {}
+_lock = threading.Lock()
+_imagenes = OrderedDict()
+_bytes_imagenes = 0
+# Nombre de XObject de cada ImageReader (el membrete se reutiliza entre documentos)
+_nombres_imagen = weakref.WeakKeyDictionary()
+_lock_imagenes = threading.Lock()
+_formateador = string.Formatter()
+
+
+def _version_probada(version):
+    """True si la versión de ReportLab está en VERSIONES_REPORTLAB"""
+    try:
+        numeros = tuple(int(parte) for parte in version.split('.')[:3])
+    except ValueError:
+        return False
+    desde, hasta = VERSIONES_REPORTLAB
+    return desde <= numeros < hasta
+
+
+CACHE_IMAGENES = _version_probada(VERSION_REPORTLAB)
+
+
+class Marcado(str):
+    """Texto que ya es marcado de párrafo: los enlaces lo insertan sin escapar"""
+
+
+def renderizar_plantilla(plantilla, datos, config, solo_primera_pagina=False):
+    """
+    Genera el PDF de un documento a partir de su plantilla.
+
+    Args:
+        plantilla: Dict con la descripción del documento (ver el inicio del módulo)
+        datos: Dict con los datos del documento
+        config: Configuración del sistema
+        solo_primera_pagina: Detiene el documento al terminar la primera página
+            (vista previa); si el contenido seguía, el total de páginas se muestra como "…"
+
+    Returns:
+        bytes: PDF generado
+    """
+    compilada = compilar_plantilla(plantilla, obtener_fuentes(datos.get('empresa')))
+    fecha, determinista = obtener_fecha_documento(datos)
+    contexto = crear_contexto(compilada, datos, config, fecha)
+
+    # Membrete como fondo de cada página, si se eligió
+    fondo = crear_fondo_membrete(datos['membrete']) if datos.get('membrete') else None
+    buffer = io.BytesIO()
+    doc = _crear_documento(compilada, buffer, contexto, fondo)
+
+    # La primera página usa su plantilla; las demás, la de las siguientes
+    elements = [NextPageTemplate('siguientes')]
+    with medir('contenido'):
+        for seccion in compilada['secciones']:
+            elements.extend(seccion(contexto))
+
+    canvas_base = crear_canvas_determinista(fecha) if determinista else Canvas
+    if solo_primera_pagina:
+        with medir('vista_previa'):
+            _construir_primera_pagina(doc, elements, _canvas_documento(canvas_base))
+        return buffer.getvalue()
+
+    with medir('doc_build'):
+        doc.build(elements, canvasmaker=_canvas_documento(canvas_base))
+
+    registrar_paginas(plantilla['nombre'], doc.page)
+    return buffer.getvalue()
+
+
+def dibujar_numero_pagina(canvas, x, y, fuente, tamano):
+    """
+    Dibuja "Página X de Y" desde una función de página (encabezado o pie).
+
+    El total se dibuja como un form XObject que se define al guardar el PDF,
+    cuando ya se conoce el número de páginas: el documento se construye una sola vez.
+
+    Args:
+        canvas: Canvas de la función de página
+        x, y: Posición del inicio del texto
+        fuente: Nombre de la fuente
+        tamano: Tamaño en puntos
+    """
+    texto = f"Página {canvas.getPageNumber()} de "
+    canvas.setFont(fuente, tamano)
+    canvas.drawString(x, y, texto)
+    canvas.fuente_total_paginas = (fuente, tamano)
+    canvas.saveState()
+    canvas.translate(x + stringWidth(texto, fuente, tamano), y)
+    canvas.doForm(FORM_TOTAL_PAGINAS)
+    canvas.restoreState()
+
+
+def compilar_plantilla(plantilla, fuentes=None):
+    """
+    Compila una plantilla o devuelve la versión ya compilada.
+
+    Las plantillas se identifican por su 'nombre' y las fuentes usadas.
+
+    Args:
+        plantilla: Dict con la descripción del documento
+        fuentes: Dict {'normal', 'negrita'} de obtener_fuentes (None: Helvetica)
+
+    Returns:
+        dict: Plantilla compilada (estilos, cálculos y funciones de cada sección)
+    """
+    fuentes = fuentes or FUENTES_BASE
+    clave = (plantilla['nombre'], fuentes['normal'], fuentes['negrita'])
+    with _lock:
+        guardada = _compiladas.get(clave)
+        acierto = guardada is not None and guardada['origen'] is plantilla
+        registrar_cache('plantilla', acierto)
+        if acierto:
+            return guardada
+
+        # Nombre de fuente de la plantilla -> fuente de la empresa
+        sustituciones = {FUENTES_BASE['normal']: fuentes['normal'], FUENTES_BASE['negrita']: fuentes['negrita']}
+        estilos = _compilar_estilos(plantilla.get('estilos', {}), sustituciones)
+        pagina = plantilla.get('pagina', {})
+        margenes = pagina.get('margenes', (72, 72, 72, 72))
+        compilada = {
+            'origen': plantilla,
+            'tamano': pagina.get('tamano', letter),
+            'margenes': margenes,
+            'margenes_siguientes': pagina.get('margenes_siguientes', margenes),
+            'encabezado': pagina.get('encabezado'),
+            'pie': pagina.get('pie'),
+            'fuentes': dict(fuentes),
+            'titulo': _compilar_enlace(plantilla.get('titulo', '')),
+            'calculos': dict(plantilla.get('calculos', {})),
+            'estilos': estilos,
+            'secciones': [_compilar_seccion(seccion, estilos, sustituciones) for seccion in plantilla['secciones']]
+        }
+        _compiladas[clave] = compilada
+        return compilada
+
+
+def limpiar_plantillas_compiladas():
+    """Descarta las plantillas compiladas (se vuelven a compilar al usarse)"""
+    with _lock:
+        _compiladas.clear()
+
+
+def limpiar_imagenes_codificadas():
+    """Descarta las imágenes ya codificadas para el PDF"""
+    global _bytes_imagenes
+    with _lock_imagenes:
+        _imagenes.clear()
+        _bytes_imagenes = 0
+
+
+def crear_contexto(compilada, datos, config, fecha):
+    """
+    Arma el contexto de los enlaces: datos, config, empresa, cliente, configuracion,
+    fecha, fuentes y los cálculos de la plantilla (en el orden en que se declaran).
+    """
+    contexto = _Valores({
+        'datos': _envolver(datos),
+        'config': _envolver(config),
+        'empresa': _envolver(datos.get('empresa', {})),
+        'cliente': _envolver(datos.get('cliente', {})),
+        'configuracion': _envolver(config.get('configuracion', {})),
+        'fecha': fecha,
+        'fuentes': compilada['fuentes']
+    })
+    for nombre, calculo in compilada['calculos'].items():
+        contexto[nombre] = _envolver(calculo(contexto))
+    return contexto
+
+
+def _crear_documento(compilada, buffer, contexto, fondo):
+    """Documento con la plantilla de página 'primera' y la de las 'siguientes'"""
+    ancho, alto = compilada['tamano']
+    arriba, derecha, abajo, izquierda = compilada['margenes']
+    doc = BaseDocTemplate(
+        buffer,
+        pagesize=compilada['tamano'],
+        rightMargin=derecha,
+        leftMargin=izquierda,
+        topMargin=arriba,
+        bottomMargin=abajo,
+        title=compilada['titulo'](contexto)
+    )
+
+    encabezado, pie = compilada['encabezado'], compilada['pie']
+
+    def _funcion_pagina(con_encabezado):
+        def _pagina(canvas, doc):
+            if fondo:
+                fondo(canvas, doc)
+            if con_encabezado and encabezado:
+                encabezado(canvas, doc, contexto)
+            if pie:
+                pie(canvas, doc, contexto)
+        return _pagina
+
+    plantillas = []
+    for nombre, margenes, con_encabezado in (('primera', compilada['margenes'], False),
+                                             ('siguientes', compilada['margenes_siguientes'], True)):
+        arriba, derecha, abajo, izquierda = margenes
+        marco = Frame(izquierda, abajo, ancho - izquierda - derecha, alto - arriba - abajo, id='normal')
+        plantillas.append(PageTemplate(id=nombre, frames=[marco], onPage=_funcion_pagina(con_encabezado),
+                                       pagesize=compilada['tamano']))
+    doc.addPageTemplates(plantillas)
+    return doc
+
+
+def _canvas_documento(base):
+    """
+    Subclase del canvas de los documentos: define al guardar el form con el total
+    de páginas y reutiliza las imágenes ya codificadas en documentos anteriores.
+    """
+    class CanvasDocumento(base):
+        fuente_total_paginas = None
+        # Texto del total en lugar del número de páginas (vista previa incompleta)
+        texto_total_paginas = None
+
+        def drawImage(self, image, x, y, width=None, height=None, mask=None, *args, **kwargs):
+            if CACHE_IMAGENES and isinstance(image, ImageReader):
+                _registrar_imagen(self, image, mask)
+            return super().drawImage(image, x, y, width, height, mask, *args, **kwargs)
+
+        def save(self):
+            if self.fuente_total_paginas:
+                fuente, tamano = self.fuente_total_paginas
+                self.beginForm(FORM_TOTAL_PAGINAS)
+                self.setFont(fuente, tamano)
+                # Después del último showPage el número de página es el total + 1
+                self.drawString(0, 0, self.texto_total_paginas or str(self.getPageNumber() - 1))
+                self.endForm()
+            super().save()
+
+    return CanvasDocumento
+
+
+class _PrimeraPaginaTerminada(Exception):
+    """Detiene doc.build al terminar la primera página"""
+
+
+def _construir_primera_pagina(doc, elements, canvasmaker):
+    """doc.build que termina el PDF después de la primera página"""
+    def _terminar():
+        raise _PrimeraPaginaTerminada()
+
+    doc.afterPage = _terminar
+    try:
+        doc.build(elements, canvasmaker=canvasmaker)
+    except _PrimeraPaginaTerminada:
+        # build deja en elements lo que no se llegó a dibujar
+        if elements:
+            doc.canv.texto_total_paginas = "…"
+        doc.canv.showPage()
+        doc.canv.save()
+
+
+def _registrar_imagen(canvas, imagen, mascara):
+    """
+    Registra en el PDF el XObject de una imagen tomándolo de la caché de imágenes
+    codificadas (o codificándola y guardándola), antes de que drawImage la busque.
+
+    Usa el mismo nombre que canvas.drawImage (hash de los pixeles y de la máscara),
+    así drawImage la encuentra ya registrada y no la vuelve a codificar.
+    """
+    global _bytes_imagenes
+    with _lock_imagenes:
+        nombre = _nombres_imagen.get(imagen)
+    if nombre is None:
+        # getRGBData separa el canal alfa en _dataA
+        pixeles = imagen.getRGBData()
+        alfa = imagen._dataA
+        datos_mascara = alfa.getRGBData() if mascara == 'auto' and alfa else str(mascara).encode('utf8')
+        nombre = _digester(pixeles + datos_mascara)
+        with _lock_imagenes:
+            _nombres_imagen[imagen] = nombre
+
+    documento = canvas._doc
+    nombre_registro = documento.getXObjectName(nombre)
+    if documento.idToObject.get(nombre_registro):
+        return
+
+    with _lock_imagenes:
+        guardada = _imagenes.get(nombre)
+        if guardada is not None:
+            _imagenes.move_to_end(nombre)
+    registrar_cache('imagen_codificada', guardada is not None)
+
+    if guardada is None:
+        objeto = PDFImageXObject(nombre, imagen, mask=mascara)
+        objeto.name = nombre
+        suave = getattr(objeto, '_smask', None)
+        # Estado de los objetos sin la referencia a la máscara (es de cada documento)
+        guardada = (
+            {clave: valor for clave, valor in vars(objeto).items() if clave != '_smask'},
+            dict(vars(suave)) if suave else None
+        )
+        tamano = len(objeto.streamContent) + (len(suave.streamContent) if suave else 0)
+        with _lock_imagenes:
+            if nombre not in _imagenes:
+                _imagenes[nombre] = guardada
+                _bytes_imagenes += tamano
+                while _bytes_imagenes > MAXIMO_BYTES_IMAGENES and len(_imagenes) > 1:
+                    estado, estado_suave = _imagenes.popitem(last=False)[1]
+                    _bytes_imagenes -= len(estado['streamContent'])
+                    _bytes_imagenes -= len(estado_suave['streamContent']) if estado_suave else 0
+
+    # Copias para este documento: el contenido codificado se comparte
+    objeto = _copiar_imagen(guardada[0])
+    canvas._setXObjects(objeto)
+    documento.Reference(objeto, nombre_registro)
+    documento.addForm(nombre, objeto)
+    if guardada[1]:
+        suave = _copiar_imagen(guardada[1])
+        nombre_suave = documento.getXObjectName(suave.name)
+        if not documento.idToObject.get(nombre_suave):
+            canvas._setXObjects(suave)
+            objeto.smask = documento.Reference(suave, nombre_suave)
+        else:
+            objeto.smask = PDFObjectReference(nombre_suave)
+
+
+def _copiar_imagen(estado):
+    """PDFImageXObject nuevo con el estado de uno ya codificado"""
+    objeto = PDFImageXObject.__new__(PDFImageXObject)
+    objeto.__dict__.update(estado)
+    return objeto
+
+
+def _compilar_estilos(definiciones, sustituciones):
+    """ParagraphStyle de la plantilla; 'parent' puede ser un estilo de ReportLab o de la plantilla"""
+    base = getSampleStyleSheet()
+    estilos = {nombre: base[nombre] for nombre in base.byName}
+
+    for nombre, definicion in definiciones.items():
+        opciones = dict(definicion)
+        padre = opciones.pop('parent', 'Normal')
+        estilos[nombre] = ParagraphStyle(nombre, parent=estilos[padre], **opciones)
+
+    # getSampleStyleSheet crea estilos nuevos en cada llamada: se pueden modificar
+    for estilo in estilos.values():
+        if not isinstance(estilo, ParagraphStyle):
+            continue
+        estilo.fontName = sustituciones.get(estilo.fontName, estilo.fontName)
+        estilo.bulletFontName = sustituciones.get(estilo.bulletFontName, estilo.bulletFontName)
+
+    return estilos
+
+
+def _compilar_seccion(seccion, estilos, sustituciones):
+    """Convierte una sección en una función contexto -> lista de flowables"""
+    tipo = seccion['tipo']
+
+    if tipo == 'parrafo':
+        texto = _compilar_enlace(seccion['texto'], escapar=True)
+        estilo = estilos[seccion.get('estilo', 'Normal')]
+        construir = lambda contexto: [Paragraph(texto(contexto), estilo)]
+    elif tipo == 'espacio':
+        alto = seccion['alto']
+        construir = lambda contexto: [Spacer(1, alto)]
+    elif tipo == 'salto_pagina':
+        construir = lambda contexto: [PageBreak()]
+    elif tipo == 'tabla':
+        construir = _compilar_tabla(seccion, estilos, sustituciones)
+    elif tipo == 'bloque':
+        funcion = seccion['funcion']
+        construir = lambda contexto: list(funcion(contexto, estilos))
+    else:
+        raise ValueError(f"Tipo de sección desconocido: {tipo}")
+
+    if 'si' not in seccion:
+        return construir
+
+    condicion = _compilar_condicion(seccion['si'])
+    alternativas = [_compilar_seccion(s, estilos, sustituciones) for s in seccion.get('alternativa', [])]
+
+    def _condicional(contexto):
+        if condicion(contexto):
+            return construir(contexto)
+        return [flowable for alternativa in alternativas for flowable in alternativa(contexto)]
+
+    return _condicional
+
+
+def _compilar_tabla(seccion, estilos, sustituciones):
+    """Sección de tabla: filas fijas, condicionales y repetidas por cada elemento de una lista"""
+    filas = [_compilar_fila(fila, estilos) for fila in seccion['filas']]
+    anchos = seccion.get('anchos')
+    estilo_tabla = _compilar_estilo_tabla(seccion.get('estilo') or [], sustituciones)
+
+    def _tabla(contexto):
+        datos_tabla = []
+        for fila in filas:
+            datos_tabla.extend(fila(contexto))
+
+        tabla = Table(datos_tabla, colWidths=anchos)
+        if estilo_tabla is not None:
+            tabla.setStyle(estilo_tabla)
+        return [tabla]
+
+    return _tabla
+
+
+def _compilar_estilo_tabla(comandos, sustituciones):
+    """TableStyle con las fuentes sustituidas (el texto simple de las celdas usa Helvetica por omisión)"""
+    if sustituciones[FUENTES_BASE['normal']] != FUENTES_BASE['normal']:
+        comandos = [('FONTNAME', (0, 0), (-1, -1), sustituciones[FUENTES_BASE['normal']])] + [
+            (comando[0], comando[1], comando[2], sustituciones.get(comando[3], comando[3])) + tuple(comando[4:])
+            if comando[0] in ('FONTNAME', 'FONT') else comando
+            for comando in comandos
+        ]
+    return TableStyle(comandos) if comandos else None
+
+
+def _compilar_fila(fila, estilos):
+    """Convierte una fila en una función contexto -> lista de filas de la tabla"""
+    if isinstance(fila, (list, tuple)):
+        celdas = [_compilar_celda(celda, estilos) for celda in fila]
+        return lambda contexto: [[celda(contexto) for celda in celdas]]
+
+    celdas = [_compilar_celda(celda, estilos) for celda in fila['celdas']]
+
+    if 'por_cada' in fila:
+        lista = _compilar_enlace(fila['por_cada'])
+        calculos = fila.get('calculos', {})
+
+        def _repetir(contexto):
+            resultado = []
+            for indice, item in enumerate(lista(contexto) or [], 1):
+                contexto_fila = _Valores(contexto)
+                contexto_fila['item'] = item
+                contexto_fila['indice'] = indice
+                for nombre, calculo in calculos.items():
+                    contexto_fila[nombre] = calculo(contexto_fila)
+                resultado.append([celda(contexto_fila) for celda in celdas])
+            return resultado
+
+        return _repetir
+
+    condicion = _compilar_condicion(fila.get('si', True))
+    return lambda contexto: [[celda(contexto) for celda in celdas]] if condicion(contexto) else []
+
+
+def _compilar_celda(celda, estilos):
+    """Convierte una celda en una función contexto -> valor de celda de Table"""
+    if isinstance(celda, str):
+        return _compilar_enlace(celda)
+
+    if 'parrafo' in celda:
+        texto = _compilar_enlace(celda['parrafo'], escapar=True)
+        estilo = estilos[celda.get('estilo', 'Normal')]
+        return lambda contexto: Paragraph(texto(contexto), estilo)
+
+    if 'imagen' in celda:
+        ruta = _compilar_enlace(celda['imagen'])
+        ancho, alto = celda.get('ancho'), celda.get('alto')
+
+        def _imagen(contexto):
+            archivo = ruta(contexto)
+            if not archivo:
+                return ""
+            try:
+                # Imagen reducida una sola vez para su recuadro (ver recursos_utils)
+                contenido = obtener_logo(archivo, ancho, alto)
+                if contenido is None:
+                    print(f"Archivo de imagen no encontrado: {archivo}")
+                    return ""
+                return Image(io.BytesIO(contenido), width=ancho, height=alto)
+            except Exception as e:
+                print(f"Error al cargar imagen {archivo}: {e}")
+                return ""
+
+        return _imagen
+
+    raise ValueError(f"Celda no válida: {celda}")
+
+
+def _compilar_condicion(condicion):
+    """Condición de una sección o fila: función(contexto), nombre de clave o valor fijo"""
+    if callable(condicion):
+        return condicion
+    if isinstance(condicion, str):
+        return lambda contexto: bool(contexto[condicion])
+    return lambda contexto: bool(condicion)
+
+
+def _compilar_enlace(texto, escapar=False):
+    """
+    Interpreta una sola vez un texto con enlaces {campo[clave]:formato}.
+
+    Args:
+        texto: Texto de la plantilla
+        escapar: Escapa los valores enlazados para usarlos en el marcado de un
+            Paragraph (el texto de la plantilla queda igual, y también los Marcado)
+
+    Returns:
+        function: contexto -> texto (o el valor tal cual si es un solo campo sin formato)
+    """
+    partes = list(_formateador.parse(texto))
+
+    if all(campo is None for _, campo, _, _ in partes):
+        literal = ''.join(parte for parte, _, _, _ in partes)
+        return lambda contexto: literal
+
+    if escapar:
+        def _marcado(contexto):
+            salida = []
+            for literal, campo, formato, conversion in partes:
+                salida.append(literal)
+                if campo is None:
+                    continue
+                valor = _formateador.convert_field(_formateador.get_field(campo, (), contexto)[0], conversion)
+                if isinstance(valor, Marcado) and not formato:
+                    salida.append(valor)
+                else:
+                    salida.append(escape(_formateador.format_field(valor, formato)))
+            return ''.join(salida)
+
+        return _marcado
+
+    if len(partes) == 1 and not partes[0][0] and not partes[0][2] and not partes[0][3]:
+        campo = partes[0][1]
+        return lambda contexto: _formateador.get_field(campo, (), contexto)[0]
+
+    return texto.format_map
+
+
+class _Valores(dict):
+    """Dict del contexto: las claves que faltan se leen como texto vacío"""
+
+    def __missing__(self, clave):
+        return ''
+
+
+def _envolver(valor):
+    """Convierte los dicts anidados a _Valores para que los enlaces toleren claves faltantes"""
+    if isinstance(valor, dict):
+        return _Valores({clave: _envolver(v) for clave, v in valor.items()})
+    if isinstance(valor, list):
+        return [_envolver(v) for v in valor]
+    return valor
+
+
+registrar_invalidacion(limpiar_plantillas_compiladas)
@@ -0,0 +1,380 @@
+"""
+Registro de recursos: configuración, logos y membretes cargados una sola vez
+
+Los archivos se leen la primera vez que se piden y se vuelven a leer solo cuando
+cambia su fecha de modificación o tamaño (se revisa como máximo una vez cada
+INTERVALO_VERIFICACION segundos). Cada cambio genera una nueva versión de los
+recursos y llama a las funciones registradas con registrar_invalidacion, para que
+las cachés derivadas (overlays, logos reducidos, plantillas compiladas) se
+vacíen y los cambios se apliquen sin reiniciar la aplicación.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from utils.metricas_utils import registrar_cache
+
+
+RUTA_CONFIGURACION = os.path.join("data", "config.json")
+DIRECTORIO_MEMBRETES = "membretes"
+
+# Segundos entre revisiones de las fechas de modificación de los archivos
+INTERVALO_VERIFICACION = 1.0
+
+# Resolución de los logos reducidos (más alta que la de los comprobantes: llevan texto)
+DPI_LOGOS = 300
+
+# Campos obligatorios de la configuración y su tipo
+CAMPOS_EMPRESA = {
+    'nombre': str,
+    'razon_social': str,
+    'rfc': str,
+    'direccion': str,
+    'telefono': str,
+    'email': str
+}
+
+CAMPOS_PRODUCTO = {
+    'codigo': str,
+    'descripcion': str,
+    'precio_unitario': (int, float)
+}
+
+# Formatos de exportación a imagen: (extensión, tipo MIME, alto máximo en pixeles)
+FORMATOS_EXPORTACION = {
+    'PNG': ('png', 'image/png', 65500),
+    'JPEG': ('jpg', 'image/jpeg', 65500),
+    'WEBP': ('webp', 'image/webp', 16383)
+}
+
+CAMPOS_SMTP = {
+    'servidor': str,
+    'remitente': str
+}
+
+# Seguridad de la conexión SMTP: 'starttls' (puerto 587), 'ssl' (puerto 465) o 'ninguna' (servidor local)
+SEGURIDAD_SMTP = ('starttls', 'ssl', 'ninguna')
+
+CAMPOS_CONFIGURACION = {
+    'iva': (int, float),
+    'moneda': str,
+    'validez_cotizacion_dias': int,
+    'terminos_condiciones': str
+}
+
+_estado = {
+    'firmas': None,
+    'revisado': 0.0,
+    'version': None,
+    'config': None,
+    'config_sha256': None,
+    'errores': [],
+    'membretes': [],
+    'catalogo': None
+}
+_logos = {}
+_invalidaciones = []
+_lock = threading.RLock()
+
+
+def obtener_configuracion():
+    """
+    Obtiene la configuración del sistema (data/config.json).
+
+    Se lee y valida una sola vez por cambio del archivo; todas las llamadas
+    devuelven el mismo dict, que no se debe modificar. Si el archivo cambia y ya
+    no es JSON válido se sigue usando la última configuración válida.
+
+    Returns:
+        dict: Configuración, o None si nunca se pudo leer
+    """
+    with _lock:
+        verificar_recursos()
+        return _estado['config']
+
+
+def obtener_errores_configuracion():
+    """
+    Obtiene los problemas encontrados al leer o validar la configuración.
+
+    Returns:
+        list: Mensajes de error (vacía si la configuración es válida)
+    """
+    with _lock:
+        verificar_recursos()
+        return list(_estado['errores'])
+
+
+def listar_membretes():
+    """
+    Obtiene los membretes PNG disponibles en la carpeta de membretes.
+
+    Returns:
+        list: Rutas de los membretes ordenadas por nombre
+    """
+    with _lock:
+        verificar_recursos()
+        return list(_estado['membretes'])
+
+
+def obtener_catalogo():
+    """
+    Obtiene el catálogo de productos con sus índices ya calculados.
+
+    Returns:
+        dict: {'productos': lista, 'opciones': textos "CODIGO - Descripción",
+               'por_codigo': {codigo: producto}}
+    """
+    with _lock:
+        verificar_recursos()
+        if _estado['catalogo'] is None:
+            productos = (_estado['config'] or {}).get('catalogo_productos', [])
+            _estado['catalogo'] = {
+                'productos': productos,
+                'opciones': [f"{p.get('codigo', '')} - {p.get('descripcion', '')}" for p in productos],
+                'por_codigo': {p.get('codigo'): p for p in productos}
+            }
+        return _estado['catalogo']
+
+
+def obtener_logo(ruta, ancho, alto):
+    """
+    Obtiene un logo reducido a la resolución necesaria para su recuadro.
+
+    Los logos originales suelen tener miles de pixeles por lado; reducirlos una
+    sola vez evita leerlos y comprimirlos completos en cada documento.
+
+    Args:
+        ruta: Ruta del logo
+        ancho: Ancho del recuadro en puntos
+        alto: Alto del recuadro en puntos
+
+    Returns:
+        bytes: Imagen PNG o JPEG reducida, o None si el archivo no existe
+    """
+    from utils.imagen_utils import preparar_imagen
+
+    firma = _firma_archivo(ruta)
+    if firma is None:
+        return None
+
+    clave = (os.path.abspath(ruta), firma, ancho, alto)
+    with _lock:
+        verificar_recursos()
+        registrar_cache('logo', clave in _logos)
+        if clave not in _logos:
+            imagen, _, _ = preparar_imagen(ruta, ancho, alto, dpi=DPI_LOGOS)
+            _logos[clave] = imagen.getvalue()
+        return _logos[clave]
+
+
+def obtener_version_recursos():
+    """
+    Obtiene la versión actual de los recursos.
+
+    Cambia cuando cambia el contenido de la configuración o la fecha de
+    modificación o el tamaño de un logo, fuente o membrete.
+
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    with _lock:
+        verificar_recursos()
+        return _estado['version']
+
+
+def registrar_invalidacion(funcion):
+    """
+    Registra una función sin argumentos que vacía una caché derivada de los recursos.
+
+    Args:
+        funcion: Se llama cada vez que cambia algún recurso
+    """
+    with _lock:
+        if funcion not in _invalidaciones:
+            _invalidaciones.append(funcion)
+
+
+def verificar_recursos(forzar=False):
+    """
+    Revisa si cambió algún archivo y, si es así, vuelve a cargar los recursos.
+
+    Args:
+        forzar: Revisa aunque no haya pasado INTERVALO_VERIFICACION
+
+    Returns:
+        bool: True si los recursos cambiaron
+    """
+    with _lock:
+        ahora = time.monotonic()
+        if not forzar and _estado['firmas'] is not None and ahora - _estado['revisado'] < INTERVALO_VERIFICACION:
+            return False
+        _estado['revisado'] = ahora
+
+        firmas = _calcular_firmas(_estado['config'])
+        if firmas == _estado['firmas']:
+            return False
+
+        anteriores = _estado['firmas'] or {}
+        if firmas['config'] != anteriores.get('config'):
+            _cargar_configuracion()
+            # Los logos y fuentes dependen de la configuración: volver a calcular sus firmas
+            firmas = _calcular_firmas(_estado['config'])
+
+        _estado['firmas'] = firmas
+        _estado['membretes'] = sorted(firmas['membretes'])
+        _estado['catalogo'] = None
+        # La configuración se versiona por contenido; logos, fuentes y membretes por fecha y tamaño
+        version = dict(firmas, config=_estado['config_sha256'])
+        _estado['version'] = hashlib.sha256(
+            json.dumps(version, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        _logos.clear()
+
+        for funcion in _invalidaciones:
+            try:
+                funcion()
+            except Exception as e:
+                print(f"Error al invalidar caché: {e}")
+
+        return True
+
+
+def validar_configuracion(config):
+    """
+    Valida la estructura de la configuración.
+
+    Args:
+        config: Configuración leída de data/config.json
+
+    Returns:
+        list: Mensajes de error (vacía si es válida)
+    """
+    if not isinstance(config, dict):
+        return ["La configuración debe ser un objeto JSON"]
+
+    errores = []
+
+    empresas = config.get('empresas')
+    if not isinstance(empresas, list) or not empresas:
+        errores.append("'empresas' debe ser una lista con al menos una empresa")
+        empresas = []
+    for idx, empresa in enumerate(empresas, 1):
+        errores.extend(_validar_campos(empresa, CAMPOS_EMPRESA, f"empresas[{idx}]"))
+        if isinstance(empresa, dict) and empresa.get('logo') and not os.path.exists(empresa['logo']):
+            errores.append(f"empresas[{idx}]: no existe el logo {empresa['logo']}")
+        fuentes = empresa.get('fuentes') if isinstance(empresa, dict) else None
+        if fuentes is not None:
+            if not isinstance(fuentes, dict):
+                errores.append(f"empresas[{idx}]: 'fuentes' debe ser un objeto")
+            else:
+                for estilo, ruta in fuentes.items():
+                    if estilo not in ('normal', 'negrita'):
+                        errores.append(f"empresas[{idx}]: fuente desconocida '{estilo}' (normal, negrita)")
+                    elif not isinstance(ruta, str) or not os.path.exists(ruta):
+                        errores.append(f"empresas[{idx}]: no existe la fuente {ruta}")
+
+    productos = config.get('catalogo_productos')
+    if not isinstance(productos, list):
+        errores.append("'catalogo_productos' debe ser una lista")
+        productos = []
+    for idx, producto in enumerate(productos, 1):
+        errores.extend(_validar_campos(producto, CAMPOS_PRODUCTO, f"catalogo_productos[{idx}]"))
+
+    errores.extend(_validar_campos(config.get('configuracion'), CAMPOS_CONFIGURACION, "configuracion"))
+    opciones = config.get('configuracion') if isinstance(config.get('configuracion'), dict) else {}
+    formato = opciones.get('formato_exportacion')
+    if formato is not None and (not isinstance(formato, str) or formato.upper() not in FORMATOS_EXPORTACION):
+        errores.append(f"configuracion: 'formato_exportacion' debe ser {', '.join(FORMATOS_EXPORTACION)}")
+    dpi = opciones.get('dpi_exportacion')
+    if dpi is not None and (not isinstance(dpi, (int, float)) or isinstance(dpi, bool) or dpi <= 0):
+        errores.append("configuracion: 'dpi_exportacion' debe ser un número positivo")
+
+    smtp = config.get('smtp')
+    if smtp is not None:
+        errores.extend(_validar_campos(smtp, CAMPOS_SMTP, "smtp"))
+        if isinstance(smtp, dict):
+            if smtp.get('seguridad', 'starttls') not in SEGURIDAD_SMTP:
+                errores.append(f"smtp: 'seguridad' debe ser {', '.join(SEGURIDAD_SMTP)}")
+            # por_minuto puede ser 0 (sin límite); puerto y conexiones no
+            for campo, minimo in (('puerto', 1), ('conexiones', 1), ('por_minuto', 0)):
+                valor = smtp.get(campo)
+                if valor is not None and (not isinstance(valor, int) or isinstance(valor, bool) or valor < minimo):
+                    errores.append(f"smtp: '{campo}' debe ser un entero mayor o igual a {minimo}")
+
+    return errores
+
+
+def _cargar_configuracion():
+    """Lee, interpreta y valida data/config.json"""
+    try:
+        with open(RUTA_CONFIGURACION, 'rb') as f:
+            contenido = f.read()
+        config = json.loads(contenido.decode('utf-8'))
+    except (OSError, ValueError) as e:
+        _estado['errores'] = [f"No se pudo leer {RUTA_CONFIGURACION}: {e}"]
+        return
+
+    _estado['errores'] = validar_configuracion(config)
+    if not isinstance(config, dict):
+        return
+
+    _estado['config'] = config
+    _estado['config_sha256'] = hashlib.sha256(contenido).hexdigest()
+    for error in _estado['errores']:
+        print(f"Configuración: {error}")
+
+
+def _calcular_firmas(config):
+    """Fecha de modificación y tamaño de la configuración, los logos, las fuentes y los membretes"""
+    logos = {}
+    fuentes = {}
+    for empresa in (config or {}).get('empresas', []):
+        if isinstance(empresa, dict) and empresa.get('logo'):
+            logos[empresa['logo']] = _firma_archivo(empresa['logo'])
+        if isinstance(empresa, dict) and isinstance(empresa.get('fuentes'), dict):
+            for ruta in empresa['fuentes'].values():
+                if isinstance(ruta, str):
+                    fuentes[ruta] = _firma_archivo(ruta)
+
+    membretes = {}
+    try:
+        nombres = os.listdir(DIRECTORIO_MEMBRETES)
+    except OSError:
+        nombres = []
+    for nombre in nombres:
+        if nombre.lower().endswith('.png'):
+            ruta = os.path.join(DIRECTORIO_MEMBRETES, nombre)
+            membretes[ruta] = _firma_archivo(ruta)
+
+    return {
+        'config': _firma_archivo(RUTA_CONFIGURACION),
+        'logos': logos,
+        'fuentes': fuentes,
+        'membretes': membretes
+    }
+
+
+def _firma_archivo(ruta):
+    """(mtime, tamaño) de un archivo, o None si no existe"""
+    try:
+        info = os.stat(ruta)
+    except OSError:
+        return None
+    return (info.st_mtime_ns, info.st_size)
+
+
+def _validar_campos(valor, campos, nombre):
+    """Errores de un objeto de la configuración con campos obligatorios"""
+    if not isinstance(valor, dict):
+        return [f"'{nombre}' debe ser un objeto"]
+
+    errores = []
+    for campo, tipo in campos.items():
+        if campo not in valor:
+            errores.append(f"{nombre}: falta '{campo}'")
+        elif not isinstance(valor[campo], tipo) or isinstance(valor[campo], bool):
+            errores.append(f"{nombre}: '{campo}' tiene un tipo no válido")
+    return errores
@@ -0,0 +1,141 @@
+"""
+Vista previa en vivo de cotizaciones y comprobantes
+
+Mientras se captura un documento, app.py muestra su primera página en baja
+resolución. Para que cada actualización tarde poco:
+- Solo se construye la primera página (renderizar_plantilla con
+  solo_primera_pagina) y se omite lo que nunca cae en ella: las filas después de
+  LIMITE_FILAS (no caben en una hoja), las imágenes de comprobante (empiezan en
+  la hoja 2) y los PDFs anexos.
+- Lo que no cambia entre una actualización y otra no se vuelve a preparar: la
+  plantilla compilada, las fuentes y el logo y el membrete ya codificados para
+  el PDF (ver plantilla_utils).
+- Cada imagen se guarda por la clave de sus datos: volver a un estado anterior
+  (deshacer un cambio) no genera nada.
+
+La primera página se rasteriza con pypdfium2 (opcional: sin él no hay vista
+previa) en un PNG sin optimizar, que se genera varias veces más rápido.
+"""
+import threading
+from collections import OrderedDict
+
+from utils.cache_utils import calcular_clave_cache
+from utils.fuente_utils import rutas_fuentes
+from utils.metricas_utils import medir, registrar_cache
+from utils.miniatura_utils import PYPDFIUM2_DISPONIBLE
+
+
+# Ancho en pixeles (el doble de lo que se muestra en la barra lateral)
+ANCHO_VISTA_PREVIA = 560
+
+# Filas de la tabla principal que se dibujan: con más, la tabla ya pasa de la primera hoja
+LIMITE_FILAS = 60
+
+MAX_VISTAS_MEMORIA = 64
+
+# Lista de filas de cada tipo de documento
+LISTA_FILAS = {'cotizacion': 'items', 'comprobante': 'conceptos'}
+
+# Datos que solo aparecen de la segunda hoja en adelante
+DATOS_OTRAS_PAGINAS = ('comprobante_imagen', 'comprobante_imagenes', 'anexos_pdf', 'anexos_ajustar')
+
+_vistas = OrderedDict()
+_lock = threading.Lock()
+
+
+def calcular_clave_vista_previa(tipo, datos, config, ancho=ANCHO_VISTA_PREVIA):
+    """
+    Calcula la clave de la vista previa de un documento.
+
+    Solo depende de lo que aparece en la primera página: agregar una foto al
+    comprobante o la partida 100 a la cotización no cambia la clave.
+
+    Args:
+        tipo: 'cotizacion' o 'comprobante'
+        datos: Dict con los datos del documento (como para generar el PDF)
+        config: Configuración del sistema
+        ancho: Ancho de la imagen en pixeles
+
+    Returns:
+        str: Hash SHA-256 en hexadecimal
+    """
+    datos_pagina = _datos_primera_pagina(tipo, datos)
+    archivos = [datos['empresa'].get('logo', ''), datos.get('membrete')] + rutas_fuentes(datos['empresa'])
+    return calcular_clave_cache(f"vista_previa_{tipo}_{ancho}", datos_pagina, config, archivos=archivos)
+
+
+def generar_vista_previa(tipo, datos, config, ancho=ANCHO_VISTA_PREVIA):
+    """
+    Obtiene la imagen PNG de la primera página de un documento.
+
+    Args:
+        tipo: 'cotizacion' o 'comprobante'
+        datos: Dict con los datos del documento (como para generar el PDF)
+        config: Configuración del sistema
+        ancho: Ancho de la imagen en pixeles
+
+    Returns:
+        bytes: Imagen PNG, o None si pypdfium2 no está instalado o el documento no se pudo generar
+    """
+    if not PYPDFIUM2_DISPONIBLE:
+        return None
+
+    clave = calcular_clave_vista_previa(tipo, datos, config, ancho)
+    imagen = consultar_vista_previa(clave)
+    registrar_cache('vista_previa', imagen is not None)
+    if imagen is not None:
+        return imagen
+
+    from utils.miniatura_utils import rasterizar_primera_pagina
+    from utils.plantilla_utils import renderizar_plantilla
+
+    try:
+        pdf_bytes = renderizar_plantilla(_obtener_plantilla(tipo), _datos_primera_pagina(tipo, datos), config,
+                                         solo_primera_pagina=True)
+        with medir('rasterizado'):
+            imagen = rasterizar_primera_pagina(pdf_bytes, ancho, optimizar=False)
+    except Exception as e:
+        print(f"Error al generar la vista previa: {e}")
+        return None
+
+    with _lock:
+        _vistas[clave] = imagen
+        while len(_vistas) > MAX_VISTAS_MEMORIA:
+            _vistas.popitem(last=False)
+    return imagen
+
+
+def consultar_vista_previa(clave):
+    """
+    Busca una vista previa ya generada.
+
+    Args:
+        clave: Clave calculada con calcular_clave_vista_previa
+
+    Returns:
+        bytes: Imagen PNG, o None si no está en memoria
+    """
+    with _lock:
+        imagen = _vistas.get(clave)
+        if imagen is not None:
+            _vistas.move_to_end(clave)
+        return imagen
+
+
+def _datos_primera_pagina(tipo, datos):
+    """Datos del documento sin lo que no puede aparecer en la primera página"""
+    datos_pagina = {clave: valor for clave, valor in datos.items() if clave not in DATOS_OTRAS_PAGINAS}
+    lista = LISTA_FILAS[tipo]
+    if len(datos_pagina.get(lista) or []) > LIMITE_FILAS:
+        datos_pagina[lista] = datos_pagina[lista][:LIMITE_FILAS]
+    return datos_pagina
+
+
+def _obtener_plantilla(tipo):
+    """Plantilla del tipo de documento (se importa al generar la primera vista previa)"""
+    if tipo == 'cotizacion':
+        from utils.cotizacion_utils import PLANTILLA_COTIZACION
+        return PLANTILLA_COTIZACION
+
+    from utils.comprobante_utils import PLANTILLA_COMPROBANTE
+    return PLANTILLA_COMPROBANTE